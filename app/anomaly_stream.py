@@ -0,0 +1,216 @@
+"""
+Inline anomaly detection for ingested vitals.
+
+Monitor readings stored by POST /iotData/{device_id}/vitals, the batch endpoint
+and the streaming channels are queued here as soon as they are written. A worker
+on the event loop drains the queue in micro-batches, scores each batch with one
+Isolation Forest call and writes the anomaly logs and alerts straight away, so
+alerts no longer wait for something to poll /anomalies/detect/{monitor_id}.
+
+Producers may run on worker threads (sync route handlers), so `submit` hands
+readings to the loop with call_soon_threadsafe. When the queue is full new
+readings are dropped and counted rather than slowing ingestion down.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.async_db import run_db
+from app.iot_mirror import mirror
+from app.routers.anomalies import detect_anomalies_batch, find_room_environment, save_anomaly_logs
+from app.timekeys import decode_key
+from app.vitals_trends import trends
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_STREAM_ENABLED = os.getenv("ANOMALY_STREAM_ENABLED", "true").lower() in ("1", "true", "yes")
+# Readings waiting to be scored; newer readings are dropped while it is full
+ANOMALY_STREAM_QUEUE_SIZE = int(os.getenv("ANOMALY_STREAM_QUEUE_SIZE", "1000"))
+# Readings scored per model call, and how long a partial batch may wait
+ANOMALY_STREAM_BATCH_SIZE = int(os.getenv("ANOMALY_STREAM_BATCH_SIZE", "64"))
+ANOMALY_STREAM_FLUSH_INTERVAL = float(os.getenv("ANOMALY_STREAM_FLUSH_INTERVAL", "0.05"))
+
+# Latency samples kept for the percentiles reported by stats()
+LATENCY_WINDOW = 1000
+
+
+class AnomalyStream:
+    """Queue and worker that score ingested monitor readings as they arrive"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {"enqueued": 0, "dropped": 0, "scored": 0, "anomalies": 0,
+                          "batches": 0, "errors": 0}
+        self._last_batch_at: Optional[str] = None
+
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the scoring worker on the running event loop"""
+        if self.is_running():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=ANOMALY_STREAM_QUEUE_SIZE)
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Inline anomaly detection started")
+
+    async def stop(self):
+        """Score what is already queued, then stop the worker"""
+        if not self.is_running():
+            return
+        await self._queue.put(None)
+        try:
+            await self._worker
+        finally:
+            self._worker = None
+            logger.info("Inline anomaly detection stopped")
+
+    def submit(self, device_id: str, patient_id: str, timestamp: str, vitals: Dict) -> bool:
+        """Queue a stored monitor reading for scoring; safe to call from any thread"""
+        if not self.is_running():
+            return False
+        item = {"device_id": device_id, "patient_id": patient_id, "timestamp": timestamp,
+                "vitals": vitals, "enqueued_at": time.monotonic()}
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._enqueue(item)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, item)
+        return True
+
+    def submit_ingested(self, readings: List[Any], results: List[Dict]) -> int:
+        """Queue the monitor readings that ingest_readings stored; returns how many were queued"""
+        queued = 0
+        for reading, result in zip(readings, results):
+            # Only monitor readings carry a patientId; environmental readings are context
+            if result.get("status") == "stored" and result.get("patientId"):
+                queued += self.submit(reading.deviceId, result["patientId"], result["timestamp"], reading.data)
+        return queued
+
+    def _enqueue(self, item: Dict):
+        try:
+            self._queue.put_nowait(item)
+            self._count("enqueued")
+        except asyncio.QueueFull:
+            self._count("dropped")
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            closing = False
+            deadline = loop.time() + ANOMALY_STREAM_FLUSH_INTERVAL
+            while len(batch) < ANOMALY_STREAM_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                await run_db(self._score, batch)
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"Error scoring streamed vitals: {e}")
+            if closing:
+                return
+
+    def _score(self, batch: List[Dict]):
+        """Score a batch with one model call and write its logs and alerts in one update"""
+        room_environment = {}
+        rows = []
+        contexts = []
+        for item in batch:
+            # Rooms come from the mirror; each room's environment is read once per batch
+            device_info = mirror.device_info(item["device_id"]) or {}
+            room_id = device_info.get("roomId")
+            if room_id not in room_environment:
+                room_environment[room_id] = find_room_environment(room_id)
+            env_sensor_id, env_data = room_environment[room_id]
+            rows.append((item["vitals"], item["device_id"], env_data))
+            contexts.append({
+                "patient_id": item["patient_id"],
+                "vitals_timestamp": item["timestamp"],
+                "room_id": room_id,
+                "env_sensor_id": env_sensor_id,
+                "env_data_included": env_data is not None,
+                "source": "stream"
+            })
+
+        anomaly_results = detect_anomalies_batch(rows)
+        detected_at = datetime.now().isoformat()
+        for anomaly_result, context in zip(anomaly_results, contexts):
+            anomaly_result.update(context)
+            anomaly_result["detected_at"] = detected_at
+            anomaly_result["trend_analysis"] = trends.features(context["patient_id"])
+            # Key logs by reading time so readings of one monitor in a batch do not collide
+            reading_time = decode_key(context["vitals_timestamp"])
+            if reading_time is not None:
+                anomaly_result["timestamp"] = reading_time.isoformat()
+        save_anomaly_logs(anomaly_results)
+
+        finished = time.monotonic()
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["scored"] += len(anomaly_results)
+            self._counters["anomalies"] += sum(1 for anomaly_result in anomaly_results if anomaly_result["is_anomaly"])
+            self._latencies.extend(finished - item["enqueued_at"] for item in batch)
+            self._last_batch_at = detected_at
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, queue depth and enqueue-to-alert latency in milliseconds"""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+            last_batch_at = self._last_batch_at
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {
+            "enabled": ANOMALY_STREAM_ENABLED,
+            "running": self.is_running(),
+            "queueDepth": self._queue.qsize() if self._queue is not None else 0,
+            "queueSize": ANOMALY_STREAM_QUEUE_SIZE,
+            "batchSize": ANOMALY_STREAM_BATCH_SIZE,
+            **counters,
+            "lastBatchAt": last_batch_at,
+            "latencyMs": {
+                "samples": len(latencies),
+                "avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1] * 1000, 2) if latencies else None
+            }
+        }
+
+
+anomaly_stream = AnomalyStream()
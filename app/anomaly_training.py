@@ -0,0 +1,347 @@
+"""
+Background retraining of the anomaly model from stored readings.
+
+A retraining job runs in four stages:
+
+1. collecting: monitor readings from the last RETRAIN_LOOKBACK_HOURS are
+   streamed out of vitalsHistory one RETRAIN_CHUNK_HOURS window per device and
+   patient at a time, joined with the room's environmental reading at that
+   moment, and turned into model rows the same way detection builds them.
+   Readings the anomaly logs flagged are held back for evaluation; the rest
+   are reservoir-sampled down to RETRAIN_MAX_SAMPLES, so memory stays bounded
+   however much history is stored.
+2. training: the Isolation Forest is fit in a separate process
+   (a spawned ProcessPoolExecutor worker), so the API workers keep serving.
+3. evaluating: the candidate and the active model score a holdout of normal
+   readings (false positive rate) and flagged readings plus synthetic
+   perturbations of the holdout (detection rate).
+4. registering: a candidate within RETRAIN_MAX_FALSE_POSITIVE_RATE that
+   detects at most RETRAIN_MAX_DETECTION_DROP less than the active model is
+   registered as a new version, which every worker then picks up.
+
+Job progress is kept in memory and mirrored to modelTraining/{job_id}, so any
+worker can answer status requests.
+"""
+
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.firebase_config import get_ref
+from app.iot_mirror import ENV_SENSOR_TYPE, mirror
+from app.timekeys import decode_key, read_window
+from app.vitals_store import VITALS_HISTORY_ROOT, read_range
+
+logger = logging.getLogger(__name__)
+
+RETRAIN_LOOKBACK_HOURS = int(os.getenv("RETRAIN_LOOKBACK_HOURS", "168"))
+# History read per device and patient at a time
+RETRAIN_CHUNK_HOURS = int(os.getenv("RETRAIN_CHUNK_HOURS", "6"))
+RETRAIN_MIN_SAMPLES = int(os.getenv("RETRAIN_MIN_SAMPLES", "200"))
+RETRAIN_MAX_SAMPLES = int(os.getenv("RETRAIN_MAX_SAMPLES", "50000"))
+RETRAIN_HOLDOUT_FRACTION = float(os.getenv("RETRAIN_HOLDOUT_FRACTION", "0.2"))
+# Acceptance thresholds for registering the candidate
+RETRAIN_MAX_FALSE_POSITIVE_RATE = float(os.getenv("RETRAIN_MAX_FALSE_POSITIVE_RATE", "0.1"))
+RETRAIN_MAX_DETECTION_DROP = float(os.getenv("RETRAIN_MAX_DETECTION_DROP", "0.05"))
+
+TRAINING_JOBS_ROOT = "modelTraining"
+# Finished jobs kept in memory
+JOB_HISTORY = 20
+
+# Same forest settings as train_anomaly.py
+FOREST_PARAMS = {"n_estimators": 200, "max_samples": 0.8, "max_features": 0.8,
+                 "bootstrap": True, "random_state": 42}
+
+
+def fit_isolation_forest(X: np.ndarray, contamination: float) -> Dict[str, Any]:
+    """Fit scaler and forest; runs in the training process"""
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    model = IsolationForest(contamination=contamination, **FOREST_PARAMS)
+    model.fit(X_scaled)
+    return {"model": model, "scaler": scaler}
+
+
+def synthetic_anomalies(X: np.ndarray, feature_names: List[str], seed: int = 0) -> np.ndarray:
+    """Copies of normal rows with one to three vital signs pushed 4-6 standard deviations out"""
+    rng = np.random.default_rng(seed)
+    vitals = [i for i, name in enumerate(feature_names) if not name.startswith("env_")]
+    mean, std = X.mean(axis=0), X.std(axis=0) + 1e-9
+    anomalous = X.copy()
+    for row in anomalous:
+        for i in rng.choice(vitals, size=rng.integers(1, 4), replace=False):
+            row[i] = mean[i] + rng.choice((-1, 1)) * rng.uniform(4, 6) * std[i]
+    return anomalous
+
+
+def _rates(scores: np.ndarray) -> float:
+    return round(float(np.mean(scores < 0)), 4) if len(scores) else None
+
+
+class AnomalyRetrainer:
+    """Runs one retraining job at a time and tracks job progress"""
+
+    def __init__(self, registry, featurize: Callable[[Dict, Optional[Dict], List[str]], List[float]]):
+        # featurize(vitals, environmental_reading, feature_names) -> model row, as detection builds it
+        self.registry = registry
+        self.featurize = featurize
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running: Optional[str] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # Jobs
+
+    def start(self, hours: int = RETRAIN_LOOKBACK_HOURS, register: bool = True) -> Dict[str, Any]:
+        """Queue a retraining job; raises RuntimeError while another job is running"""
+        with self._lock:
+            if self._running is not None:
+                raise RuntimeError(f"Retraining job {self._running} is already running")
+            job_id = datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "hours": hours,
+                "register": register,
+                "created_at": datetime.now().isoformat(),
+                "progress": {"devices_total": 0, "devices_done": 0, "readings_scanned": 0,
+                             "samples_collected": 0, "flagged_readings": 0, "skipped_no_environment": 0},
+            }
+            self._jobs[job_id] = job
+            self._running = job_id
+            for old_id in list(self._jobs)[:-JOB_HISTORY]:
+                self._jobs.pop(old_id, None)
+        self._save(job)
+        threading.Thread(target=self._run, args=(job_id,), name=f"retrain-{job_id}", daemon=True).start()
+        return dict(job)
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's progress, from this worker or from the database"""
+        with self._lock:
+            if job_id in self._jobs:
+                job = self._jobs[job_id]
+                return {**job, "progress": dict(job["progress"])}
+        return get_ref(f"{TRAINING_JOBS_ROOT}/{job_id}", cached=False).get()
+
+    def jobs(self, limit: int = JOB_HISTORY) -> List[Dict[str, Any]]:
+        """Most recent jobs first"""
+        stored = get_ref(TRAINING_JOBS_ROOT, cached=False).order_by_key().limit_to_last(limit).get() or {}
+        with self._lock:
+            stored = {**stored, **{job_id: dict(job) for job_id, job in self._jobs.items()}}
+        return [stored[job_id] for job_id in sorted(stored, reverse=True)[:limit]]
+
+    def _update(self, job_id: str, persist: bool = True, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            progress = fields.pop("progress", None)
+            job.update(fields)
+            if progress:
+                job["progress"].update(progress)
+            snapshot = {**job, "progress": dict(job["progress"])}
+        if persist:
+            self._save(snapshot)
+
+    def _save(self, job: Dict[str, Any]):
+        try:
+            get_ref(f"{TRAINING_JOBS_ROOT}/{job['job_id']}").set(job)
+        except Exception as e:
+            logger.error(f"Error saving retraining job {job['job_id']}: {e}")
+
+    def shutdown(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # Pipeline
+
+    def _run(self, job_id: str):
+        started = time.perf_counter()
+        try:
+            active = self.registry.active
+            if active is None:
+                raise RuntimeError("No active anomaly model to take feature names and settings from")
+            feature_names = list(active.artifact["feature_names"])
+            contamination = float(active.artifact.get("contamination_rate", 0.05))
+
+            self._update(job_id, status="collecting", started_at=datetime.now().isoformat())
+            normal, flagged = self._collect(job_id, feature_names)
+            if len(normal) < RETRAIN_MIN_SAMPLES:
+                raise RuntimeError(f"Insufficient training data: {len(normal)} samples (need {RETRAIN_MIN_SAMPLES})")
+
+            rng = np.random.default_rng(0)
+            order = rng.permutation(len(normal))
+            holdout_size = max(1, int(len(normal) * RETRAIN_HOLDOUT_FRACTION))
+            holdout, train = normal[order[:holdout_size]], normal[order[holdout_size:]]
+
+            self._update(job_id, status="training",
+                         progress={"train_samples": len(train), "holdout_samples": len(holdout)})
+            fitted = self._fit(train, contamination)
+            candidate = {
+                **fitted,
+                "feature_names": feature_names,
+                "training_samples": len(train),
+                "normal_samples": len(train),
+                "anomalous_samples": 0,
+                "contamination_rate": contamination,
+                "trained_from": f"stored readings, last {self._jobs[job_id]['hours']} hours",
+                "trained_at": datetime.now().isoformat(),
+                "training_job": job_id,
+            }
+
+            self._update(job_id, status="evaluating")
+            metrics = self._evaluate(candidate, active, holdout, flagged, feature_names)
+            candidate["holdout_metrics"] = metrics
+            accepted, reason = self._accept(metrics)
+
+            version = None
+            if accepted and self._jobs[job_id]["register"]:
+                self._update(job_id, status="registering", metrics=metrics)
+                version = self.registry.register(candidate)
+            status = "registered" if version else ("accepted" if accepted else "rejected")
+            self._update(job_id, status=status, metrics=metrics, decision=reason, version=version,
+                         finished_at=datetime.now().isoformat(),
+                         duration_seconds=round(time.perf_counter() - started, 2))
+            logger.info(f"Retraining job {job_id} {status}: {reason}")
+
+        except Exception as e:
+            logger.error(f"Retraining job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat(),
+                         duration_seconds=round(time.perf_counter() - started, 2))
+        finally:
+            with self._lock:
+                self._running = None
+
+    def _fit(self, X: np.ndarray, contamination: float) -> Dict[str, Any]:
+        """Train in a separate process so fitting never competes with request handling for the GIL"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool.submit(fit_isolation_forest, X, contamination).result()
+
+    def _collect(self, job_id: str, feature_names: List[str]):
+        """Stream readings window by window into (normal rows sample, flagged rows)"""
+        hours = self._jobs[job_id]["hours"]
+        end = datetime.now()
+        start = end - timedelta(hours=hours)
+        monitors = mirror.devices_of_type("vitals_monitor")
+        self._update(job_id, persist=False, progress={"devices_total": len(monitors)})
+
+        sample: List[List[float]] = []
+        flagged: List[List[float]] = []
+        seen = 0
+        scanned = skipped = 0
+        sampler = random.Random(0)
+
+        for device_number, device_id in enumerate(monitors, start=1):
+            room_id = (mirror.device_info(device_id) or {}).get("roomId")
+            env_sensors = mirror.devices_in_room(room_id, ENV_SENSOR_TYPE) if room_id else []
+            # Patients with bucketed history, plus any only in the legacy flat map
+            patient_ids = set(get_ref(f"{VITALS_HISTORY_ROOT}/{device_id}", cached=False).get(shallow=True) or {})
+            patient_ids |= set(get_ref(f"iotData/{device_id}/vitals", cached=False).get(shallow=True) or {})
+            patient_ids = sorted(patient_id for patient_id in patient_ids if decode_key(patient_id) is None)
+
+            chunk_start = start
+            while chunk_start < end:
+                chunk_end = min(chunk_start + timedelta(hours=RETRAIN_CHUNK_HOURS), end)
+                environment = self._environment_timeline(env_sensors, chunk_start - timedelta(hours=1), chunk_end)
+                # Logs are written at or shortly after the reading they score
+                logs = read_window(get_ref(f"anomalies/{device_id}", cached=False),
+                                   chunk_start, chunk_end + timedelta(hours=1))
+                flagged_keys = {log.get("vitals_timestamp") for log in logs.values()
+                                if isinstance(log, dict) and log.get("is_anomaly")}
+
+                for patient_id in patient_ids:
+                    for timestamp_key, vitals in read_range(device_id, patient_id, chunk_start, chunk_end):
+                        scanned += 1
+                        moment = decode_key(timestamp_key)
+                        env_reading = self._environment_at(environment, moment.timestamp()) if moment else None
+                        if not isinstance(vitals, dict) or env_reading is None:
+                            skipped += 1
+                            continue
+                        row = self.featurize(vitals, env_reading, feature_names)
+                        if timestamp_key in flagged_keys:
+                            flagged.append(row)
+                            continue
+                        # Reservoir sampling keeps a uniform sample of bounded size
+                        seen += 1
+                        if len(sample) < RETRAIN_MAX_SAMPLES:
+                            sample.append(row)
+                        else:
+                            slot = sampler.randrange(seen)
+                            if slot < RETRAIN_MAX_SAMPLES:
+                                sample[slot] = row
+                chunk_start = chunk_end
+
+            self._update(job_id, progress={"devices_done": device_number, "readings_scanned": scanned,
+                                           "samples_collected": seen, "flagged_readings": len(flagged),
+                                           "skipped_no_environment": skipped})
+
+        width = len(feature_names)
+        return np.array(sample, dtype=np.float64).reshape(-1, width), np.array(flagged, dtype=np.float64).reshape(-1, width)
+
+    @staticmethod
+    def _environment_timeline(sensor_ids: List[str], start: datetime, end: datetime):
+        """(sorted epoch seconds, readings) of a room's environmental readings in a window"""
+        readings = []
+        for sensor_id in sensor_ids:
+            window = read_window(get_ref(f"iotData/{sensor_id}/vitals", cached=False), start, end)
+            for timestamp_key, reading in window.items():
+                moment = decode_key(timestamp_key)
+                if moment is not None and isinstance(reading, dict):
+                    readings.append((moment.timestamp(), reading))
+        readings.sort(key=lambda item: item[0])
+        return np.array([moment for moment, _ in readings]), [reading for _, reading in readings]
+
+    @staticmethod
+    def _environment_at(environment, seconds: float) -> Optional[Dict]:
+        """Newest environmental reading at or before a moment"""
+        times, readings = environment
+        position = int(np.searchsorted(times, seconds, side="right")) - 1
+        return readings[position] if position >= 0 else None
+
+    @staticmethod
+    def _evaluate(candidate: Dict, active, holdout: np.ndarray, flagged: np.ndarray,
+                  feature_names: List[str]) -> Dict[str, Any]:
+        """False positive rate on normal holdout rows and detection rate on anomalous rows, for both models"""
+        anomalous = np.vstack([flagged, synthetic_anomalies(holdout, feature_names)])
+
+        def decision(model_data, X):
+            if not len(X):
+                return np.array([])
+            compiled = model_data.get("compiled")
+            if compiled is not None:
+                return compiled.decision_function(X)
+            return model_data["model"].decision_function(model_data["scaler"].transform(X))
+
+        metrics = {"holdout_normal": len(holdout), "holdout_flagged": len(flagged),
+                   "holdout_synthetic": len(anomalous) - len(flagged)}
+        for label, model_data in (("candidate", candidate), ("active", active.artifact)):
+            metrics[label] = {
+                "false_positive_rate": _rates(decision(model_data, holdout)),
+                "detection_rate": _rates(decision(model_data, anomalous)),
+            }
+        metrics["active"]["version"] = active.version
+        return metrics
+
+    @staticmethod
+    def _accept(metrics: Dict[str, Any]):
+        candidate, current = metrics["candidate"], metrics["active"]
+        if candidate["false_positive_rate"] > RETRAIN_MAX_FALSE_POSITIVE_RATE:
+            return False, (f"false positive rate {candidate['false_positive_rate']} above "
+                           f"{RETRAIN_MAX_FALSE_POSITIVE_RATE}")
+        if candidate["detection_rate"] < current["detection_rate"] - RETRAIN_MAX_DETECTION_DROP:
+            return False, (f"detection rate {candidate['detection_rate']} more than {RETRAIN_MAX_DETECTION_DROP} "
+                           f"below the active model's {current['detection_rate']}")
+        return True, (f"false positive rate {candidate['false_positive_rate']}, "
+                      f"detection rate {candidate['detection_rate']} (active: {current['detection_rate']})")
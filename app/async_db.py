@@ -0,0 +1,70 @@
+"""
+Async access to the database for `async def` route handlers.
+
+The Firebase Admin SDK is blocking, so calling it directly from an async
+handler stalls the event loop for the whole network round trip. References
+returned by `get_async_ref` run every call on a dedicated thread pool
+(DB_THREAD_POOL_SIZE workers) and are awaited by the handler instead.
+
+Reads that decide a write (existence checks, read-modify-write) pass
+`cached=False` so they never act on a subtree cached before another
+process changed it.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.firebase_config import get_ref
+
+DB_THREAD_POOL_SIZE = int(os.getenv("DB_THREAD_POOL_SIZE", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREAD_POOL_SIZE, thread_name_prefix="db")
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking database call on the database thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class AsyncReference:
+    """Awaitable counterpart of the reference returned by get_ref"""
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    @property
+    def key(self):
+        return self._ref.key
+
+    @property
+    def path(self):
+        return self._ref.path
+
+    def child(self, path: str) -> "AsyncReference":
+        return AsyncReference(self._ref.child(path))
+
+    async def get(self, etag: bool = False, shallow: bool = False):
+        return await run_db(self._ref.get, etag=etag, shallow=shallow)
+
+    async def set(self, value: Any):
+        return await run_db(self._ref.set, value)
+
+    async def update(self, value: Dict[str, Any]):
+        return await run_db(self._ref.update, value)
+
+    async def push(self, value: Any = "") -> "AsyncReference":
+        return AsyncReference(await run_db(self._ref.push, value))
+
+    async def delete(self):
+        return await run_db(self._ref.delete)
+
+    async def transaction(self, transaction_update: Callable[[Any], Any]):
+        return await run_db(self._ref.transaction, transaction_update)
+
+
+def get_async_ref(path: str, cached: bool = True) -> AsyncReference:
+    return AsyncReference(get_ref(path, cached=cached))
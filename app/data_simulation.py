@@ -16,6 +16,13 @@ from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, db
 
+try:
+    from app.timekeys import encode_key
+    from app.vitals_store import vitals_write_paths
+except ImportError:
+    from timekeys import encode_key
+    from vitals_store import vitals_write_paths
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -288,39 +295,7 @@ class AnomalyDetectionService:
             logger.info(f"� Response status: {response.status_code}")
             
             if response.status_code == 200:
-                result = response.json()
-                
-                # Check if any anomalies were detected using correct API response format
-                if result.get('is_anomaly'):
-                    anomaly_types = result.get('anomaly_type', [])
-                    severity = result.get('severity_level', 'UNKNOWN')
-                    confidence = result.get('confidence', 0.0)
-                    anomaly_score = result.get('anomaly_score', 0.0)
-                    room_id = result.get('room_id', 'Unknown')
-                    env_sensor_used = result.get('env_sensor_id')
-                    env_data_included = result.get('env_data_included', False)
-                    
-                    logger.warning(f"🚨 ANOMALIES DETECTED for patient {patient_id} (Room: {room_id}): {len(anomaly_types)} anomaly types")
-                    
-                    # Log anomaly details
-                    for anomaly_type in anomaly_types:
-                        logger.warning(f"📊 {anomaly_type}")
-                    logger.warning(f"🔴 Severity: {severity} | Confidence: {confidence:.2f}")
-                    logger.warning(f"📈 Anomaly Score: {anomaly_score:.3f}")
-                    
-                    if env_data_included and env_sensor_used:
-                        logger.warning(f"🌡️ Environmental data from sensor {env_sensor_used} was included in analysis")
-                    else:
-                        logger.warning(f"⚠️ No environmental data was available for this analysis")
-                    
-                    return result
-                else:
-                    room_id = result.get('room_id', 'Unknown')
-                    env_data_included = result.get('env_data_included', False)
-                    logger.debug(f"✅ No anomalies detected for patient {patient_id} (Room: {room_id})")
-                    if env_data_included:
-                        logger.debug(f"🌡️ Environmental data was included in the analysis")
-                    return None
+                return self.handle_detection_result(patient_id, response.json())
                     
             else:
                 logger.error(f"❌ Failed to check anomalies for patient {patient_id} (monitor {monitor_id}): HTTP {response.status_code}")
@@ -346,24 +321,106 @@ class AnomalyDetectionService:
         }
         return severity_map.get(severity.lower(), 'warning')
     
+    def handle_detection_result(self, patient_id: str, result: Dict) -> Optional[Dict]:
+        """Log a detection result; returns it only when anomalies were found"""
+        # Check if any anomalies were detected using correct API response format
+        if result.get('is_anomaly'):
+            anomaly_types = result.get('anomaly_type', [])
+            severity = result.get('severity_level', 'UNKNOWN')
+            confidence = result.get('confidence', 0.0)
+            anomaly_score = result.get('anomaly_score', 0.0)
+            room_id = result.get('room_id', 'Unknown')
+            env_sensor_used = result.get('env_sensor_id')
+            env_data_included = result.get('env_data_included', False)
+            
+            logger.warning(f"🚨 ANOMALIES DETECTED for patient {patient_id} (Room: {room_id}): {len(anomaly_types)} anomaly types")
+            
+            # Log anomaly details
+            for anomaly_type in anomaly_types:
+                logger.warning(f"📊 {anomaly_type}")
+            logger.warning(f"🔴 Severity: {severity} | Confidence: {confidence:.2f}")
+            logger.warning(f"📈 Anomaly Score: {anomaly_score:.3f}")
+            
+            if env_data_included and env_sensor_used:
+                logger.warning(f"🌡️ Environmental data from sensor {env_sensor_used} was included in analysis")
+            else:
+                logger.warning(f"⚠️ No environmental data was available for this analysis")
+            
+            return result
+        else:
+            room_id = result.get('room_id', 'Unknown')
+            env_data_included = result.get('env_data_included', False)
+            logger.debug(f"✅ No anomalies detected for patient {patient_id} (Room: {room_id})")
+            if env_data_included:
+                logger.debug(f"🌡️ Environmental data was included in the analysis")
+            return None
+    
+    def check_patients_batch(self, monitors: Dict[str, str]) -> Optional[Dict[str, Optional[Dict]]]:
+        """
+        Check anomalies for {monitor_id: patient_id} with one call to the batch endpoint
+        Returns None if the batch request failed so callers can fall back to single checks
+        """
+        try:
+            request_url = f"{self.api_base_url}/anomalies/detect:batch"
+            logger.info(f"🔍 Checking anomalies for {len(monitors)} monitors via {request_url}")
+            
+            response = requests.post(
+                request_url,
+                json={"monitor_ids": list(monitors)},
+                timeout=30
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"❌ Batch anomaly check failed: HTTP {response.status_code}")
+                return None
+            
+            body = response.json()
+            results = {}
+            for monitor_id, patient_id in monitors.items():
+                if monitor_id in body.get("results", {}):
+                    results[patient_id] = self.handle_detection_result(patient_id, body["results"][monitor_id])
+                else:
+                    error = body.get("errors", {}).get(monitor_id, {})
+                    logger.error(f"❌ Failed to check anomalies for patient {patient_id} (monitor {monitor_id}): {error.get('error', 'no result')}")
+                    results[patient_id] = None
+            return results
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Error calling batch anomaly detection API: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Unexpected error in batch anomaly check: {str(e)}")
+            return None
+    
     def check_all_patients(self, patient_profiles: Dict) -> Dict[str, Optional[Dict]]:
         """Check anomalies for all patients - environmental sensors are automatically detected"""
         results = {}
+        due_monitors = {}
+        current_time = datetime.now()
         
         for monitor_id, patient_profile in patient_profiles.items():
             patient_id = patient_profile.patientId
             
             # Check if enough time has passed since last check (avoid spam)
             last_check = self.last_check_times.get(patient_id)
-            current_time = datetime.now()
             
             if last_check is None or (current_time - last_check).total_seconds() >= 30:  # Check every 30 seconds
-                result = self.check_patient_anomalies(patient_id, monitor_id)
-                results[patient_id] = result
+                due_monitors[monitor_id] = patient_id
                 self.last_check_times[patient_id] = current_time
             else:
                 results[patient_id] = None  # Skipped due to rate limiting
-                
+        
+        if not due_monitors:
+            return results
+        
+        # One scoring call for every due monitor; fall back to per-monitor checks
+        batch_results = self.check_patients_batch(due_monitors)
+        if batch_results is None:
+            batch_results = {
+                patient_id: self.check_patient_anomalies(patient_id, monitor_id)
+                for monitor_id, patient_id in due_monitors.items()
+            }
+        results.update(batch_results)
         return results
     
     def get_anomaly_summary(self) -> Dict:
@@ -674,9 +731,10 @@ class EnhancedHospitalDataSimulator:
                 'timestamp': format_datetime_for_firebase(current_time)
             })
             
-            # Save to Firebase using the correct structure: vitals/{patient_id}/{timestamp}
-            monitor_ref = db.reference(f'iotData/{monitor_id}/vitals/{patient_profile.patientId}')
-            monitor_ref.child(format_datetime_for_firebase(current_time)).set(vitals)
+            # Save to Firebase under a sortable key: hour bucket, latestVitals pointer and
+            # the vitals/{patient_id}/{timestamp} map in one multi-path update
+            db.reference('/').update(vitals_write_paths(
+                monitor_id, patient_profile.patientId, encode_key(current_time), vitals))
             
             # Log concerning vital patterns for debugging
             if patient_profile.scenario:
@@ -713,7 +771,7 @@ class EnhancedHospitalDataSimulator:
             
             # Save to Firebase using the correct structure for environmental sensors
             sensor_ref = db.reference(f'iotData/{sensor_id}/vitals')
-            sensor_ref.child(format_datetime_for_firebase(current_time)).set(env_data)
+            sensor_ref.child(encode_key(current_time)).set(env_data)
             
         except Exception as e:
             logger.error(f"Error simulating environmental data for sensor {sensor_id}: {str(e)}")
@@ -6,7 +6,43 @@ from firebase_admin import credentials, db
 
 load_dotenv()
 
+# "firebase" talks to the Realtime Database; "memory" and "sqlite" use a local store
+# with the same reference API so the API can be run and load-tested without a project
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase").lower()
+
+# Read-through cache for hot subtrees; TTLs are "prefix=seconds" pairs
+CACHE_ENABLED = os.getenv("FIREBASE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_local_store = None
+_cache = None
+_cached_reference = None
+
+def _init_cache():
+    global _cache, _cached_reference
+    try:
+        from app.ref_cache import CachedReference, SubtreeCache, parse_ttls, DEFAULT_CACHE_TTLS
+    except ImportError:
+        from ref_cache import CachedReference, SubtreeCache, parse_ttls, DEFAULT_CACHE_TTLS
+    _cached_reference = CachedReference
+    _cache = SubtreeCache(parse_ttls(os.getenv("FIREBASE_CACHE_TTLS", DEFAULT_CACHE_TTLS)))
+
+def _init_local_store():
+    global _local_store
+    try:
+        from app.storage import create_store
+    except ImportError:
+        # Scripts that put app/ on sys.path import this module as top-level firebase_config
+        from storage import create_store
+    _local_store = create_store(STORAGE_BACKEND, os.getenv("LOCAL_DB_SEED"))
+
 def init_firebase():
+    if CACHE_ENABLED:
+        _init_cache()
+
+    if STORAGE_BACKEND != "firebase":
+        _init_local_store()
+        return
+
     json_str = os.getenv("FIREBASE_KEY_JSON")
     db_url = os.getenv("FIREBASE_DATABASE_URL")
 
@@ -14,13 +50,29 @@ def init_firebase():
         raise ValueError("Missing FIREBASE_KEY_JSON or FIREBASE_DATABASE_URL")
 
     try:
-        json_data = json.loads(json_str)  
-        cred = credentials.Certificate(json_data)  
+        json_data = json.loads(json_str)
+        cred = credentials.Certificate(json_data)
     except json.JSONDecodeError as e:
         raise ValueError("Invalid FIREBASE_KEY_JSON. Check your .env formatting.") from e
 
     firebase_admin.initialize_app(cred, {
         'databaseURL': db_url
     })
-def get_ref(path: str):
-    return db.reference(path)
\ No newline at end of file
+def get_ref(path: str, cached: bool = True):
+    if _local_store is not None:
+        ref = _local_store.reference(path)
+    else:
+        ref = db.reference(path)
+    if cached and _cache is not None:
+        return _cached_reference(ref, _cache)
+    return ref
+
+def get_cache_stats():
+    """Hit/miss counters for the subtree read cache"""
+    if _cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_cache.stats()}
+
+def clear_cache():
+    if _cache is not None:
+        _cache.clear()
@@ -0,0 +1,629 @@
+"""
+In-process mirror of the iotData tree kept current by a database listener.
+
+The mirror keeps only what the hot read paths need: each device's deviceInfo,
+its latest vitals reading (per patient for monitors) and its unresolved
+alerts, plus room/patient/type -> device ID indexes derived from deviceInfo
+and the newest environmental reading per room (used to assemble model features).
+It is built from the initial listener snapshot and then patched from the
+put/patch events the listener delivers. Events that cannot be applied from
+their payload alone (e.g. a deleted latest reading) queue a re-read, which
+runs after the lock is released so request-path accessors never wait on the
+database. While the listener is not running
+(not started, disconnected or failed) every accessor falls back to reading
+the database directly, so callers never need to check which path served them.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.firebase_config import get_ref
+from app.timekeys import key_order, latest_key, read_last
+from app.vitals_store import read_latest
+
+logger = logging.getLogger(__name__)
+
+ENV_SENSOR_TYPE = "environmental_sensor"
+MIRROR_ENABLED = os.getenv("IOT_MIRROR_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Key used for environmental sensor readings, which are not stored per patient
+ENV_READINGS_KEY = ""
+
+# How long a room's environmental reading is trusted while the listener is not live
+ROOM_ENV_TTL = float(os.getenv("IOT_ROOM_ENV_TTL", "30"))
+
+# Times a re-read is retried when its device changed while it was being read
+REFETCH_ATTEMPTS = 3
+
+
+def _segments(path: str):
+    return [segment for segment in str(path or "").split("/") if segment]
+
+
+def _set_nested(target: Dict, segments, value: Any):
+    """Apply a write at a relative path inside a plain dict"""
+    if not segments:
+        return
+    for segment in segments[:-1]:
+        child = target.get(segment)
+        if not isinstance(child, dict):
+            child = {}
+            target[segment] = child
+        target = child
+    if value is None:
+        target.pop(segments[-1], None)
+    else:
+        target[segments[-1]] = value
+
+
+def _without_nulls(value: Any) -> Any:
+    """Drop null fields and empty objects the way the database does when storing a value"""
+    if not isinstance(value, dict):
+        return value
+    pruned = {}
+    for key, child in value.items():
+        child = _without_nulls(child)
+        if child is not None and child != {}:
+            pruned[key] = child
+    return pruned or None
+
+
+def _latest_entry(readings: Any) -> Optional[Tuple[str, Dict]]:
+    if not isinstance(readings, dict) or not readings:
+        return None
+    latest_timestamp = latest_key(readings.keys())
+    return latest_timestamp, readings[latest_timestamp]
+
+
+def _is_unresolved(alert: Any) -> bool:
+    return isinstance(alert, dict) and not alert.get("resolved", False)
+
+
+class IoTMirror:
+    """Listener-maintained view of device info, latest vitals and unresolved alerts"""
+
+    def __init__(self, root: str = "iotData"):
+        self.root = root
+        self._lock = threading.RLock()
+        self._devices: Dict[str, Dict[str, Any]] = {}
+        # Secondary indexes over deviceInfo roomId / currentPatientId / type
+        self._by_room = defaultdict(set)
+        self._by_patient = defaultdict(set)
+        self._by_type = defaultdict(set)
+        self._index_keys: Dict[str, Tuple[Any, Any, Any]] = {}
+        # Newest environmental reading per room: room_id -> (sensor_id, timestamp, reading, stored_at)
+        self._room_env: Dict[Any, Tuple[str, str, Dict, float]] = {}
+        # Re-reads queued by _apply as (kind, device_id, key), and a change counter per device
+        # so a re-read is only swapped in if its device was not written while it ran
+        self._refetch_queue: List[Tuple[str, str, str]] = []
+        self._generations: Dict[str, int] = {}
+        self._changes = 0
+        self._registration = None
+        self._synced = False
+        self.started_at: Optional[float] = None
+        self.synced_at: Optional[float] = None
+        self.last_event_at: Optional[float] = None
+        self.events_applied = 0
+        self.event_errors = 0
+        self.refetches = 0
+        self.refetch_conflicts = 0
+        self.fallback_reads = 0
+
+    # Lifecycle
+
+    def start(self):
+        """Attach the listener; the first event is the full snapshot"""
+        if self._registration is not None:
+            return
+        self.started_at = time.time()
+        try:
+            self._registration = get_ref(self.root, cached=False).listen(self._on_event)
+            logger.info(f"IoT mirror listening on /{self.root}")
+        except Exception as e:
+            self._registration = None
+            logger.error(f"IoT mirror could not start listener, using direct reads: {e}")
+
+    def stop(self):
+        registration, self._registration = self._registration, None
+        with self._lock:
+            self._synced = False
+        if registration is not None:
+            try:
+                registration.close()
+            except Exception as e:
+                logger.error(f"Error closing IoT mirror listener: {e}")
+
+    def is_live(self) -> bool:
+        """True when the mirror is synced and its listener is still running"""
+        registration = self._registration
+        if registration is None or not self._synced:
+            return False
+        # Firebase runs the SSE stream on a thread that exits when the connection drops
+        thread = getattr(registration, "_thread", None)
+        return thread is None or thread.is_alive()
+
+    # Event handling
+
+    def _on_event(self, event):
+        try:
+            with self._lock:
+                if event.event_type == "patch" and isinstance(event.data, dict):
+                    base = _segments(event.path)
+                    for key, value in event.data.items():
+                        self._apply(base + _segments(key), value)
+                else:
+                    self._apply(_segments(event.path), event.data)
+                self.events_applied += 1
+                self.last_event_at = time.time()
+                if not self._synced:
+                    self._synced = True
+                    self.synced_at = self.last_event_at
+            self._run_refetches()
+        except Exception as e:
+            # A half-applied event leaves the mirror unreliable; rebuild it from a direct read
+            self.event_errors += 1
+            logger.error(f"IoT mirror failed to apply {event.event_type} {event.path}: {e}")
+            self.resync()
+
+    def resync(self):
+        """Rebuild the mirror from a full read of the tree"""
+        data = get_ref(self.root, cached=False).get() or {}
+        with self._lock:
+            self._apply([], data)
+            # The snapshot already holds whatever the queued re-reads would fetch
+            self._refetch_queue = []
+            self.refetches += 1
+
+    def record_write(self, path: str, value: Any):
+        """Apply a write this process just made without waiting for its listener event"""
+        if not self.is_live():
+            return
+        segments = _segments(path)
+        if segments[:1] != [self.root]:
+            return
+        with self._lock:
+            self._apply(segments[1:], _without_nulls(value))
+        self._run_refetches()
+
+    def _changed(self, device_id: str):
+        self._changes += 1
+        self._generations[device_id] = self._changes
+
+    def _apply(self, segments, value):
+        """Patch the mirror with one write; never reads the database (see _run_refetches)"""
+        if not segments:
+            for device_id in set(self._devices) | set(value or {}):
+                self._changed(device_id)
+            self._devices = {device_id: self._summarize(device_data)
+                             for device_id, device_data in (value or {}).items() if isinstance(device_data, dict)}
+            self._rebuild_indexes()
+            return
+
+        device_id = segments[0]
+        self._changed(device_id)
+        if len(segments) == 1:
+            if isinstance(value, dict):
+                self._devices[device_id] = self._summarize(value)
+            else:
+                self._devices.pop(device_id, None)
+            self._reindex(device_id)
+            return
+
+        section, rest = segments[1], segments[2:]
+        device = self._devices.get(device_id)
+        if device is None:
+            # Readings or alerts landing under a device without deviceInfo (e.g. a late write
+            # racing the device's deletion) are not mirrored; a device starts with its deviceInfo
+            if section != "deviceInfo":
+                return
+            device = self._devices[device_id] = self._summarize({})
+
+        if section == "deviceInfo":
+            if rest:
+                _set_nested(device["deviceInfo"], rest, value)
+            else:
+                device["deviceInfo"] = dict(value) if isinstance(value, dict) else {}
+            self._reindex(device_id)
+        elif section == "vitals":
+            self._apply_vitals(device_id, device, rest, value)
+            if device["deviceInfo"].get("type") == ENV_SENSOR_TYPE:
+                self._refresh_room_env(device["deviceInfo"].get("roomId"))
+        elif section == "latestVitals":
+            self._apply_latest_pointer(device_id, device, rest, value)
+        elif section == "alerts":
+            self._apply_alerts(device_id, device, rest, value)
+
+    def _rebuild_indexes(self):
+        self._by_room.clear()
+        self._by_patient.clear()
+        self._by_type.clear()
+        self._index_keys.clear()
+        self._room_env.clear()
+        for device_id in self._devices:
+            self._reindex(device_id)
+
+    def _reindex(self, device_id: str):
+        """Move a device to the index buckets matching its current deviceInfo"""
+        old_keys = self._index_keys.pop(device_id, None)
+        if old_keys is not None:
+            for index, key in zip((self._by_room, self._by_patient, self._by_type), old_keys):
+                if key is not None:
+                    index[key].discard(device_id)
+                    if not index[key]:
+                        del index[key]
+
+        device = self._devices.get(device_id)
+        new_keys = (None, None, None)
+        if device is not None:
+            info = device["deviceInfo"]
+            new_keys = (info.get("roomId"), info.get("currentPatientId"), info.get("type"))
+            for index, key in zip((self._by_room, self._by_patient, self._by_type), new_keys):
+                if key is not None:
+                    index[key].add(device_id)
+            self._index_keys[device_id] = new_keys
+
+        # A sensor that moved, appeared or went away changes its rooms' environment
+        if ENV_SENSOR_TYPE in (old_keys or (None, None, None))[2:] + new_keys[2:]:
+            self._refresh_room_env((old_keys or (None,))[0])
+            self._refresh_room_env(new_keys[0])
+
+    def _refresh_room_env(self, room_id: Any):
+        """Recompute a room's newest environmental reading from its mirrored sensors"""
+        if room_id is None:
+            return
+        best = None
+        for device_id in self._by_room.get(room_id, set()) & self._by_type.get(ENV_SENSOR_TYPE, set()):
+            entry = self._devices[device_id]["latestVitals"].get(ENV_READINGS_KEY)
+            if entry and (best is None or key_order(entry[0]) > key_order(best[1])):
+                best = (device_id, entry[0], entry[1], time.monotonic())
+        if best is not None:
+            self._room_env[room_id] = best
+        else:
+            self._room_env.pop(room_id, None)
+
+    def _apply_vitals(self, device_id: str, device: Dict, rest, value):
+        latest = device["latestVitals"]
+        is_env = device["deviceInfo"].get("type") == ENV_SENSOR_TYPE
+
+        if not rest:
+            device["latestVitals"] = self._summarize_vitals(value, is_env)
+            return
+
+        if is_env:
+            key, timestamp_path = ENV_READINGS_KEY, rest
+        else:
+            key, timestamp_path = rest[0], rest[1:]
+            if not timestamp_path:
+                entry = _latest_entry(value)
+                if entry:
+                    latest[key] = entry
+                else:
+                    latest.pop(key, None)
+                return
+
+        timestamp = timestamp_path[0]
+        current = latest.get(key)
+        if len(timestamp_path) == 1 and value is not None:
+            if current is None or key_order(timestamp) >= key_order(current[0]):
+                latest[key] = (timestamp, value)
+        elif current is None or key_order(timestamp) >= key_order(current[0]):
+            # Deleted or partially edited reading at or after the latest one
+            self._queue_refetch("latest", device_id, key)
+
+    def _apply_latest_pointer(self, device_id: str, device: Dict, rest, value):
+        latest = device["latestVitals"]
+        if not rest:
+            for patient_id, pointer in (value or {}).items():
+                self._merge_pointer(latest, patient_id, pointer)
+            return
+        patient_id = rest[0]
+        if len(rest) == 1:
+            if value is None:
+                latest.pop(patient_id, None)
+            else:
+                self._merge_pointer(latest, patient_id, value)
+        else:
+            # Field-level edit of a pointer; re-read the whole pointer
+            self._queue_refetch("pointer", device_id, patient_id)
+
+    @staticmethod
+    def _merge_pointer(latest: Dict, patient_id: str, pointer: Any):
+        """Adopt a latestVitals pointer unless a newer reading is already known"""
+        if not isinstance(pointer, dict) or not pointer.get("timestamp"):
+            return
+        current = latest.get(patient_id)
+        if current is None or key_order(pointer["timestamp"]) >= key_order(current[0]):
+            latest[patient_id] = (pointer["timestamp"], pointer.get("data"))
+
+    def _apply_alerts(self, device_id: str, device: Dict, rest, value):
+        alerts = device["alerts"]
+        if not rest:
+            device["alerts"] = {alert_id: alert for alert_id, alert in (value or {}).items() if _is_unresolved(alert)}
+            return
+
+        alert_id = rest[0]
+        if len(rest) == 1:
+            alert = value
+        elif alert_id in alerts:
+            alert = alerts[alert_id]
+            _set_nested(alert, rest[1:], value)
+        else:
+            # Field change on an alert we do not hold (e.g. reopening a resolved one)
+            self._queue_refetch("alert", device_id, alert_id)
+            return
+
+        if _is_unresolved(alert):
+            alerts[alert_id] = alert
+        else:
+            alerts.pop(alert_id, None)
+
+    # Re-reads
+
+    def _queue_refetch(self, kind: str, device_id: str, key: str):
+        refetch = (kind, device_id, key)
+        if refetch not in self._refetch_queue:
+            self._refetch_queue.append(refetch)
+
+    def _read_refetch(self, kind: str, device_id: str, key: str) -> Any:
+        if kind == "latest":
+            path = f"{self.root}/{device_id}/vitals"
+            if key != ENV_READINGS_KEY:
+                path = f"{path}/{key}"
+            newest = read_last(get_ref(path, cached=False), 1)
+            return newest[0] if newest else None
+        if kind == "pointer":
+            return get_ref(f"{self.root}/{device_id}/latestVitals/{key}", cached=False).get()
+        return get_ref(f"{self.root}/{device_id}/alerts/{key}", cached=False).get()
+
+    def _swap_in_refetch(self, kind: str, device_id: str, key: str, result: Any):
+        device = self._devices.get(device_id)
+        if device is None:
+            return
+        if kind == "latest":
+            if result:
+                device["latestVitals"][key] = result
+            else:
+                device["latestVitals"].pop(key, None)
+            if device["deviceInfo"].get("type") == ENV_SENSOR_TYPE:
+                self._refresh_room_env(device["deviceInfo"].get("roomId"))
+        elif kind == "pointer":
+            device["latestVitals"].pop(key, None)
+            self._merge_pointer(device["latestVitals"], key, result)
+        elif _is_unresolved(result):
+            device["alerts"][key] = result
+        else:
+            device["alerts"].pop(key, None)
+
+    def _run_refetches(self):
+        """
+        Read what queued events need without holding the lock, then swap each result in
+        A result is dropped and read again if its device changed while it was being read
+        """
+        with self._lock:
+            queued, self._refetch_queue = self._refetch_queue, []
+            pending = [(refetch, self._generations.get(refetch[1])) for refetch in queued]
+        for attempt in range(REFETCH_ATTEMPTS):
+            if not pending:
+                return
+            results = [(refetch, generation, self._read_refetch(*refetch)) for refetch, generation in pending]
+            with self._lock:
+                self.refetches += len(results)
+                pending = []
+                for refetch, generation, result in results:
+                    current = self._generations.get(refetch[1])
+                    if current == generation:
+                        self._swap_in_refetch(*refetch, result)
+                    else:
+                        pending.append((refetch, current))
+        if pending:
+            # Devices written during every attempt; read them again after the next event
+            with self._lock:
+                self.refetch_conflicts += len(pending)
+                for refetch, _ in pending:
+                    self._queue_refetch(*refetch)
+            logger.warning(f"IoT mirror deferred re-reading {len(pending)} entries changed during the read")
+
+    def _summarize(self, device_data: Dict) -> Dict[str, Any]:
+        info = device_data.get("deviceInfo")
+        info = dict(info) if isinstance(info, dict) else {}
+        alerts = device_data.get("alerts") or {}
+        latest = self._summarize_vitals(device_data.get("vitals"), info.get("type") == ENV_SENSOR_TYPE)
+        for patient_id, pointer in (device_data.get("latestVitals") or {}).items():
+            self._merge_pointer(latest, patient_id, pointer)
+        return {
+            "deviceInfo": info,
+            "latestVitals": latest,
+            "alerts": {alert_id: alert for alert_id, alert in alerts.items() if _is_unresolved(alert)},
+        }
+
+    @staticmethod
+    def _summarize_vitals(vitals: Any, is_env: bool) -> Dict[str, Tuple[str, Dict]]:
+        if not isinstance(vitals, dict):
+            return {}
+        if is_env:
+            entry = _latest_entry(vitals)
+            return {ENV_READINGS_KEY: entry} if entry else {}
+        latest = {}
+        for patient_id, readings in vitals.items():
+            entry = _latest_entry(readings)
+            if entry:
+                latest[patient_id] = entry
+        return latest
+
+    # Accessors (fall back to direct reads when the mirror is not live)
+
+    def device_infos(self) -> Dict[str, Dict]:
+        """deviceInfo for every device, keyed by device ID"""
+        if self.is_live():
+            with self._lock:
+                return {device_id: copy.deepcopy(device["deviceInfo"]) for device_id, device in self._devices.items()}
+        self.fallback_reads += 1
+        data = get_ref(self.root).get() or {}
+        return {device_id: device_data.get("deviceInfo", {}) or {}
+                for device_id, device_data in data.items() if isinstance(device_data, dict)}
+
+    def device_info(self, device_id: str) -> Optional[Dict]:
+        """deviceInfo for one device, or None if it does not exist"""
+        if self.is_live():
+            with self._lock:
+                device = self._devices.get(device_id)
+                return copy.deepcopy(device["deviceInfo"]) if device is not None else None
+        self.fallback_reads += 1
+        return get_ref(f"{self.root}/{device_id}/deviceInfo").get()
+
+    def latest_vitals(self, device_id: str, patient_id: Optional[str] = None) -> Tuple[Optional[str], Optional[Dict]]:
+        """(timestamp, reading) of the newest vitals; pass patient_id for monitors"""
+        key = patient_id or ENV_READINGS_KEY
+        if self.is_live():
+            with self._lock:
+                device = self._devices.get(device_id)
+                entry = device["latestVitals"].get(key) if device is not None else None
+                return (entry[0], copy.deepcopy(entry[1])) if entry else (None, None)
+        self.fallback_reads += 1
+        if patient_id:
+            return read_latest(device_id, patient_id)
+        newest = read_last(get_ref(f"{self.root}/{device_id}/vitals"), 1)
+        return newest[0] if newest else (None, None)
+
+    def _lookup(self, index: Dict, key: Any, device_type: Optional[str], field: str) -> List[str]:
+        if self.is_live():
+            with self._lock:
+                device_ids = set(index.get(key, ()))
+                if device_type is not None:
+                    device_ids &= self._by_type.get(device_type, set())
+                return sorted(device_ids)
+        return sorted(device_id for device_id, info in self.device_infos().items()
+                      if info.get(field) == key and (device_type is None or info.get("type") == device_type))
+
+    def devices_in_room(self, room_id: str, device_type: Optional[str] = None) -> List[str]:
+        """IDs of devices whose deviceInfo.roomId is room_id, optionally of one type"""
+        return self._lookup(self._by_room, room_id, device_type, "roomId")
+
+    def devices_for_patient(self, patient_id: str, device_type: Optional[str] = None) -> List[str]:
+        """IDs of devices whose deviceInfo.currentPatientId is patient_id, optionally of one type"""
+        return self._lookup(self._by_patient, patient_id, device_type, "currentPatientId")
+
+    def devices_of_type(self, device_type: str) -> List[str]:
+        """IDs of devices whose deviceInfo.type is device_type"""
+        return self._lookup(self._by_type, device_type, None, "type")
+
+    def unresolved_alerts(self) -> Dict[str, Dict[str, Dict]]:
+        """Unresolved alerts grouped by device ID"""
+        if self.is_live():
+            with self._lock:
+                return {device_id: copy.deepcopy(device["alerts"])
+                        for device_id, device in self._devices.items() if device["alerts"]}
+        self.fallback_reads += 1
+        data = get_ref(self.root).get() or {}
+        unresolved = {}
+        for device_id, device_data in data.items():
+            if not isinstance(device_data, dict):
+                continue
+            alerts = {alert_id: alert for alert_id, alert in (device_data.get("alerts") or {}).items()
+                      if _is_unresolved(alert)}
+            if alerts:
+                unresolved[device_id] = alerts
+        return unresolved
+
+    def room_environment(self, room_id: str) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
+        """(sensor_id, timestamp, reading) of the newest environmental reading in a room"""
+        live = self.is_live()
+        with self._lock:
+            entry = self._room_env.get(room_id)
+            if entry is not None and (live or time.monotonic() - entry[3] < ROOM_ENV_TTL):
+                return entry[0], entry[1], copy.deepcopy(entry[2])
+        if live:
+            return None, None, None
+        self.fallback_reads += 1
+        best = (None, None, None)
+        for sensor_id in self.devices_in_room(room_id, ENV_SENSOR_TYPE):
+            timestamp, reading = self.latest_vitals(sensor_id)
+            if reading and (best[1] is None or key_order(timestamp) > key_order(best[1])):
+                best = (sensor_id, timestamp, reading)
+        if best[0] is not None:
+            self._remember_room_env(best[0], room_id, best[1], best[2])
+        return best
+
+    def newest_environment(self) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
+        """(sensor_id, timestamp, reading) of the newest environmental reading in any room"""
+        live = self.is_live()
+        with self._lock:
+            entries = [entry for entry in self._room_env.values()
+                       if live or time.monotonic() - entry[3] < ROOM_ENV_TTL]
+            if entries:
+                sensor_id, timestamp, reading, _ = max(entries, key=lambda entry: key_order(entry[1]))
+                return sensor_id, timestamp, copy.deepcopy(reading)
+        if live:
+            return None, None, None
+        self.fallback_reads += 1
+        for sensor_id in self.devices_of_type(ENV_SENSOR_TYPE):
+            timestamp, reading = self.latest_vitals(sensor_id)
+            if reading:
+                return sensor_id, timestamp, reading
+        return None, None, None
+
+    def record_env_reading(self, sensor_id: str, room_id: Optional[str], timestamp: str, reading: Dict):
+        """
+        Apply an environmental reading this process just wrote
+        The room's entry is kept even while the listener is not live, so feature
+        assembly can use it without reading the database
+        """
+        self.record_write(f"{self.root}/{sensor_id}/vitals/{timestamp}", reading)
+        if room_id is not None:
+            self._remember_room_env(sensor_id, room_id, timestamp, _without_nulls(reading))
+
+    def _remember_room_env(self, sensor_id: str, room_id: str, timestamp: str, reading: Dict):
+        with self._lock:
+            current = self._room_env.get(room_id)
+            if current is None or key_order(timestamp) >= key_order(current[1]):
+                self._room_env[room_id] = (sensor_id, timestamp, reading, time.monotonic())
+
+    def device_unresolved_alerts(self, device_id: str) -> Dict[str, Dict]:
+        """Unresolved alerts of one device keyed by alert ID"""
+        if self.is_live():
+            with self._lock:
+                device = self._devices.get(device_id)
+                return copy.deepcopy(device["alerts"]) if device is not None else {}
+        self.fallback_reads += 1
+        alerts = get_ref(f"{self.root}/{device_id}/alerts").get() or {}
+        return {alert_id: alert for alert_id, alert in alerts.items() if _is_unresolved(alert)}
+
+    # Metrics
+
+    def verify(self) -> Dict[str, Any]:
+        """Compare the mirrored deviceInfo of every device against a direct read"""
+        data = get_ref(self.root, cached=False).get() or {}
+        with self._lock:
+            mirrored = {device_id: device["deviceInfo"] for device_id, device in self._devices.items()}
+        actual = {device_id: (device_data.get("deviceInfo") or {})
+                  for device_id, device_data in data.items() if isinstance(device_data, dict)}
+        mismatched = sorted(device_id for device_id in set(mirrored) | set(actual)
+                            if mirrored.get(device_id) != actual.get(device_id))
+        return {"checkedDevices": len(actual), "mismatchedDevices": mismatched, "consistent": not mismatched}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                "enabled": MIRROR_ENABLED,
+                "live": self.is_live(),
+                "devices": len(self._devices),
+                "indexedRooms": len(self._by_room),
+                "indexedPatients": len(self._by_patient),
+                "roomEnvironments": len(self._room_env),
+                "eventsApplied": self.events_applied,
+                "eventErrors": self.event_errors,
+                "refetches": self.refetches,
+                "refetchConflicts": self.refetch_conflicts,
+                "fallbackReads": self.fallback_reads,
+                "syncedAt": self.synced_at,
+                "secondsSinceLastEvent": round(now - self.last_event_at, 3) if self.last_event_at else None,
+            }
+
+
+mirror = IoTMirror()
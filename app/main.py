@@ -1,8 +1,15 @@
 from fastapi import FastAPI
 from app.routers import patients, predictions, alerts, staff, iot, anomalies, rooms, beds, simulation, auth
-from app.firebase_config import init_firebase
+from app.firebase_config import init_firebase, get_cache_stats
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import realtime
+from app.iot_mirror import mirror, MIRROR_ENABLED
+from app.anomaly_stream import anomaly_stream, ANOMALY_STREAM_ENABLED
+from app.routers.anomalies import anomaly_models, anomaly_retrainer
+from app.routers.predictions import risk_models
+from app.risk_scheduler import risk_scheduler, RISK_SCHEDULER_ENABLED
+from app.write_behind import write_behind
+from app.process_memory import process_memory
 
 
 app = FastAPI(title="Smart Hospital API")
@@ -45,5 +52,103 @@ app.include_router(anomalies.router)
 app.include_router(rooms.router)
 app.include_router(beds.router)
 app.include_router(simulation.router)
-#app.include_router(realtime.router)
+app.include_router(realtime.router)
 
+
+@app.on_event("startup")
+def start_iot_mirror():
+    if MIRROR_ENABLED:
+        mirror.start()
+
+
+@app.on_event("shutdown")
+def stop_iot_mirror():
+    mirror.stop()
+
+
+@app.on_event("startup")
+async def start_anomaly_stream():
+    if ANOMALY_STREAM_ENABLED:
+        await anomaly_stream.start()
+
+
+@app.on_event("shutdown")
+async def stop_anomaly_stream():
+    await anomaly_stream.stop()
+
+
+@app.on_event("startup")
+def start_write_behind():
+    write_behind.start()
+
+
+@app.on_event("startup")
+async def start_risk_scheduler():
+    if RISK_SCHEDULER_ENABLED:
+        await risk_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_risk_scheduler():
+    await risk_scheduler.stop()
+
+
+@app.on_event("startup")
+def start_model_reloaders():
+    anomaly_models.start()
+    risk_models.start()
+
+
+@app.on_event("shutdown")
+def stop_model_reloaders():
+    anomaly_models.stop()
+    risk_models.stop()
+    anomaly_retrainer.shutdown()
+
+
+@app.on_event("shutdown")
+def flush_write_behind():
+    # Last shutdown hook, so pending writes are flushed once nothing else can queue more
+    write_behind.stop()
+
+
+@app.get("/cache/stats", tags=["System"])
+def cache_stats():
+    """Hit/miss counters for the database read cache"""
+    return get_cache_stats()
+
+
+@app.get("/write-behind/stats", tags=["System"])
+def write_behind_stats():
+    """Pending writes, flushes and submit-to-write lag of the write-behind queue"""
+    return write_behind.stats()
+
+
+@app.get("/mirror/status", tags=["System"])
+def mirror_status(verify: bool = False):
+    """Freshness of the iotData mirror; verify=true also compares it against the database"""
+    status = mirror.stats()
+    if verify:
+        status["consistency"] = mirror.verify()
+    return status
+
+
+@app.get("/system/memory", tags=["System"])
+def memory_usage():
+    """Memory of the worker that answers; PSS/USS show how much of it is shared with other workers"""
+    return {
+        **process_memory(),
+        "models": {registry.name: registry.version() for registry in (anomaly_models, risk_models)}
+    }
+
+
+@app.get("/anomalies/stream/stats", tags=["Anomaly Detection"])
+def anomaly_stream_stats():
+    """Queue depth, throughput and enqueue-to-alert latency of inline anomaly detection"""
+    return anomaly_stream.stats()
+
+
+@app.get("/predict/scheduler/stats", tags=["Predictions"])
+def risk_scheduler_stats():
+    """Queue depth, overdue patients and lag of scheduled risk re-scoring"""
+    return risk_scheduler.stats()
@@ -0,0 +1,347 @@
+"""
+Versioned, hot-reloadable model artifacts.
+
+Each registry serves one model. Versions live at models/{name}/{version}.pkl
+and models/{name}/ACTIVE names the version to serve; without a pointer the
+original unversioned models/{name}.pkl is served (as version "legacy"), then
+the newest versioned file.
+
+Loading a version runs the registry's `prepare` hook (e.g. compiling the
+forest) and `validate` hook (a smoke-test batch) on the new artifact before it
+is swapped in with a single reference assignment. Requests already holding the
+previous artifact finish with it, and a version that fails to load or validate
+is never served: the current one stays active and the error is reported.
+
+Every worker polls the pointer (and the file it names) every
+MODEL_RELOAD_INTERVAL seconds, so activating a version through one worker's
+reload endpoint, `register`, or by replacing the file on disk reaches all
+workers without a restart.
+
+With MODEL_MMAP enabled artifacts are loaded with joblib's mmap_mode, and
+`share_arrays` lets a prepare hook swap the arrays it builds (e.g. the
+flattened forest) for read-only memory maps of files under models/.shared, so
+every worker on a host scores from the same physical pages. Pair it with
+`python serve.py --preload` to also share what was loaded before forking.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+# Seconds between checks for a newly activated or replaced model file (0 disables polling)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+
+# Load artifacts and derived arrays as read-only memory maps shared by every worker
+MODEL_MMAP = os.getenv("MODEL_MMAP", "false").lower() in ("1", "true", "yes")
+SHARED_ARRAYS_DIR = os.path.join(MODELS_DIR, ".shared")
+
+LEGACY_VERSION = "legacy"
+ACTIVE_POINTER = "ACTIVE"
+
+# Version names become file names, so no separators or dot segments
+VERSION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+def share_arrays(name: str, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Read-only memory maps of arrays, stored under models/.shared by content hash
+    The first worker writes the files; the rest map the same files, so the OS
+    keeps one copy in its page cache however many workers load the model
+    """
+    digest = hashlib.sha1()
+    for key in sorted(arrays):
+        array = np.asarray(arrays[key])
+        digest.update(f"{key}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    directory = os.path.join(SHARED_ARRAYS_DIR, f"{name}-{digest.hexdigest()[:16]}")
+
+    if not os.path.isdir(directory):
+        staging = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(staging, exist_ok=True)
+        for key, array in arrays.items():
+            np.save(os.path.join(staging, f"{key}.npy"), np.asarray(array))
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # Another worker published the same arrays first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    # Scalars are read normally (memmap cannot hold 0-d arrays)
+    return {key: np.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r" if np.ndim(array) else None)
+            for key, array in arrays.items()}
+
+
+class ModelLoadError(Exception):
+    """A model version could not be loaded or failed validation"""
+
+
+class InvalidModelVersion(ModelLoadError):
+    """A version name that could point outside the registry's directory"""
+
+
+class ModelVersionNotFound(ModelLoadError):
+    """A version that is not on disk"""
+
+
+def check_version_name(version: str) -> str:
+    if not isinstance(version, str) or not VERSION_NAME.match(version) or ".." in version:
+        raise InvalidModelVersion(f"Invalid model version: {version!r}")
+    return version
+
+
+class LoadedModel:
+    """One loaded, validated artifact and where it came from"""
+
+    def __init__(self, version: str, path: str, artifact: Any, signature: Tuple,
+                 load_seconds: float, validation: Dict[str, Any]):
+        self.version = version
+        self.path = path
+        self.artifact = artifact
+        self.signature = signature
+        self.loaded_at = datetime.now().isoformat()
+        self.load_seconds = load_seconds
+        self.validation = validation
+
+
+class ModelRegistry:
+    """Serves the active version of one model and swaps in new versions atomically"""
+
+    def __init__(self, name: str, prepare: Optional[Callable[[Any], Any]] = None,
+                 validate: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                 models_dir: str = MODELS_DIR):
+        self.name = name
+        self.models_dir = models_dir
+        self.prepare = prepare
+        self.validate = validate
+        self._active: Optional[LoadedModel] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error: Optional[str] = None
+        self._failed_signature: Optional[Tuple] = None
+        self.last_checked_at: Optional[str] = None
+
+    # Artifact locations
+
+    @property
+    def versions_dir(self) -> str:
+        return os.path.join(self.models_dir, self.name)
+
+    @property
+    def legacy_path(self) -> str:
+        return os.path.join(self.models_dir, f"{self.name}.pkl")
+
+    def version_path(self, version: str) -> str:
+        if version == LEGACY_VERSION:
+            return self.legacy_path
+        return os.path.join(self.versions_dir, f"{check_version_name(version)}.pkl")
+
+    def versions(self) -> List[str]:
+        """Versions available on disk, oldest first"""
+        versions = [LEGACY_VERSION] if os.path.exists(self.legacy_path) else []
+        if os.path.isdir(self.versions_dir):
+            versions += sorted(file_name[:-4] for file_name in os.listdir(self.versions_dir)
+                               if file_name.endswith(".pkl"))
+        return versions
+
+    def pointer(self) -> Optional[str]:
+        """Version named by the ACTIVE pointer, if there is one"""
+        try:
+            with open(os.path.join(self.versions_dir, ACTIVE_POINTER)) as pointer_file:
+                return pointer_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, version: str):
+        os.makedirs(self.versions_dir, exist_ok=True)
+        pointer_path = os.path.join(self.versions_dir, ACTIVE_POINTER)
+        with open(pointer_path + ".tmp", "w") as pointer_file:
+            pointer_file.write(version)
+        os.replace(pointer_path + ".tmp", pointer_path)
+
+    def resolve(self) -> Optional[str]:
+        """Version that should be served: the pointer, else the legacy file, else the newest version"""
+        pointed = self.pointer()
+        if pointed is not None:
+            return pointed
+        versions = self.versions()
+        if LEGACY_VERSION in versions:
+            return LEGACY_VERSION
+        return versions[-1] if versions else None
+
+    def _signature(self, version: str) -> Tuple:
+        """Changes whenever the file behind a version is replaced"""
+        stat = os.stat(self.version_path(version))
+        return version, stat.st_mtime_ns, stat.st_size
+
+    # Serving
+
+    def get(self) -> Any:
+        """Active artifact, or None if no version is loaded"""
+        active = self._active
+        return active.artifact if active is not None else None
+
+    @property
+    def active(self) -> Optional[LoadedModel]:
+        return self._active
+
+    def version(self) -> Optional[str]:
+        active = self._active
+        return active.version if active is not None else None
+
+    # Loading
+
+    def _load(self, version: str) -> LoadedModel:
+        # Only versions listed on disk are loaded, whatever the caller passed
+        if version not in self.versions():
+            check_version_name(version)
+            raise ModelVersionNotFound(f"{self.name} version {version} not found")
+        path = self.version_path(version)
+        started = time.perf_counter()
+        try:
+            signature = self._signature(version)
+            artifact = joblib.load(path, mmap_mode="r" if MODEL_MMAP else None)
+            if self.prepare is not None:
+                artifact = self.prepare(artifact)
+            validation = self.validate(artifact) if self.validate is not None else {"ok": True}
+        except ModelLoadError:
+            raise
+        except Exception as e:
+            raise ModelLoadError(f"{self.name} version {version} failed to load: {e}") from e
+        if not validation.get("ok", False):
+            raise ModelLoadError(f"{self.name} version {version} failed validation: {validation}")
+        return LoadedModel(version, path, artifact, signature, round(time.perf_counter() - started, 3), validation)
+
+    def load(self, version: Optional[str] = None, activate: bool = False) -> LoadedModel:
+        """
+        Load, validate and swap in a version (default: the one that should be served)
+        activate=True also points every worker at it; raises ModelLoadError and keeps
+        the current version if the new one is unusable
+        """
+        with self._lock:
+            version = version or self.resolve()
+            if version is None:
+                raise ModelLoadError(f"No {self.name} model found in {self.models_dir}")
+            try:
+                loaded = self._load(version)
+            except ModelLoadError as e:
+                self.failed_reloads += 1
+                self.last_error = str(e)
+                logger.error(str(e))
+                raise
+            if activate:
+                self._write_pointer(version)
+            previous, self._active = self._active, loaded
+            self.reloads += 1
+            self.last_error = None
+            self._failed_signature = None
+            logger.info(f"Model {self.name} version {version} active after {loaded.load_seconds}s"
+                        f"{f' (replaced {previous.version})' if previous is not None else ''}")
+            return loaded
+
+    def load_initial(self) -> Optional[LoadedModel]:
+        """Load the served version at startup; a missing or bad model leaves the registry empty"""
+        try:
+            return self.load()
+        except ModelLoadError:
+            return None
+
+    def register(self, artifact: Any, version: Optional[str] = None, activate: bool = True) -> str:
+        """Save an artifact as a new version and (by default) activate it"""
+        version = version or datetime.now().strftime("%Y%m%d-%H%M%S")
+        if version in (LEGACY_VERSION, ACTIVE_POINTER):
+            raise ValueError(f"Reserved version name: {version}")
+        check_version_name(version)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        path = self.version_path(version)
+        joblib.dump(artifact, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if activate:
+            self.load(version, activate=True)
+        return version
+
+    def warm_up(self) -> Dict[str, Any]:
+        """Run the smoke test against the active artifact (e.g. in a freshly forked worker)"""
+        artifact = self.get()
+        if artifact is None or self.validate is None:
+            return {"ok": artifact is not None}
+        return self.validate(artifact)
+
+    def check_for_update(self) -> bool:
+        """Reload if another version was activated or the served file changed; True if swapped"""
+        self.last_checked_at = datetime.now().isoformat()
+        try:
+            version = self.resolve()
+            if version is None:
+                return False
+            active = self._active
+            if active is not None and active.signature == self._signature(version):
+                return False
+        except (OSError, InvalidModelVersion):
+            return False
+        # A version that already failed is retried only once its file changes again
+        if self._failed_signature == self._signature(version):
+            return False
+        try:
+            self.load(version)
+            return True
+        except ModelLoadError:
+            self._failed_signature = self._signature(version)
+            return False
+
+    # Watcher
+
+    def start(self):
+        """Poll for new versions in a daemon thread"""
+        if MODEL_RELOAD_INTERVAL <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name=f"{self.name}-reloader", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.join(timeout=5)
+
+    def _watch(self):
+        while not self._stop.wait(MODEL_RELOAD_INTERVAL):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                logger.error(f"Error checking for a new {self.name} model: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        active = self._active
+        return {
+            "name": self.name,
+            "activeVersion": active.version if active is not None else None,
+            "path": active.path if active is not None else None,
+            "loadedAt": active.loaded_at if active is not None else None,
+            "loadSeconds": active.load_seconds if active is not None else None,
+            "validation": active.validation if active is not None else None,
+            "availableVersions": self.versions(),
+            "pointer": self.pointer(),
+            "reloads": self.reloads,
+            "failedReloads": self.failed_reloads,
+            "lastError": self.last_error,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "reloadIntervalSeconds": MODEL_RELOAD_INTERVAL,
+            "mmap": MODEL_MMAP,
+            "lastCheckedAt": self.last_checked_at
+        }
@@ -0,0 +1,89 @@
+"""
+Cache of risk predictions keyed by their exact inputs.
+
+A prediction depends only on the model version and the feature vector built
+from the patient's latest vitals and conditions, so while those are unchanged
+the stored prediction is still current. GET /predict/risk/{patient_id} looks
+the inputs up here first and returns the stored response instead of scoring
+again and rewriting patients/{id}/predictions, aiLogs and predictionsHistory.
+A hit returns that stored prediction unchanged, including its predictedAt,
+nextPrediction and alert_created: it is the record still stored under
+patients/{id}/predictions, and the response says so with "cached": true
+rather than presenting it as a new prediction.
+
+Each patient has one entry, the hash of the inputs of its latest prediction
+and the response, so a lookup only hits if nothing changed since that
+prediction was stored (inputs going back to an earlier state are scored
+again). Entries are evicted least recently used first once
+RISK_PREDICTION_CACHE_SIZE is reached (0 disables the cache). The cache is per
+worker process; batch and scheduled predictions refresh it as well.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+RISK_PREDICTION_CACHE_SIZE = int(os.getenv("RISK_PREDICTION_CACHE_SIZE", "10000"))
+
+
+def prediction_key(patient_id: str, model_version: Optional[str], features: Dict[str, Any]) -> str:
+    """Hash of the patient, model version and exact feature vector"""
+    payload = json.dumps({"patientId": patient_id, "modelVersion": model_version, "features": features},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class PredictionCache:
+    """LRU map of patient ID -> (input hash, response) of the latest prediction, with hit/miss counters"""
+
+    def __init__(self, max_entries: int = RISK_PREDICTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, patient_id: str, key: str) -> Optional[Dict[str, Any]]:
+        """Response of the patient's latest prediction if it was made from the same inputs"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, patient_id: str, key: str, response: Dict[str, Any]):
+        """Remember the patient's latest prediction and the hash of its inputs"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[patient_id] = (key, response)
+            self._entries.move_to_end(patient_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_entries > 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries
+            }
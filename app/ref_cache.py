@@ -0,0 +1,198 @@
+"""
+Read-through cache for hot Realtime Database subtrees.
+
+`app.firebase_config.get_ref` wraps references in `CachedReference` so repeated
+full-subtree reads (iotData, patients, rooms, ...) are served from memory for a
+short per-prefix TTL. Any write made through a wrapped reference drops the
+cached entries it could affect (the written path, its ancestors and its
+descendants). Writes from other processes are only picked up once the TTL
+expires, so TTLs for fast-moving data like iotData are kept short.
+"""
+
+import copy
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_CACHE_TTLS = "iotData=2,patients=10,beds=10,rooms=10,staff=30,users=30"
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """Parse "prefix=seconds,prefix=seconds" into a TTL map"""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        prefix, seconds = item.split("=", 1)
+        prefix = prefix.strip().strip("/")
+        if prefix:
+            ttls[prefix] = float(seconds)
+    return ttls
+
+
+def _segments(path: str) -> Tuple[str, ...]:
+    return tuple(segment for segment in str(path or "").split("/") if segment)
+
+
+def _descend(value: Any, segments: Tuple[str, ...]) -> Any:
+    """Walk a cached subtree down to a child path; missing children read as None"""
+    for segment in segments:
+        if isinstance(value, dict):
+            value = value.get(segment)
+        elif isinstance(value, list) and segment.isdigit() and int(segment) < len(value):
+            value = value[int(segment)]
+        else:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+class SubtreeCache:
+    """TTL cache of subtree snapshots keyed by database path"""
+
+    def __init__(self, ttls: Dict[str, float]):
+        self.ttls = {prefix: ttl for prefix, ttl in ttls.items() if ttl > 0}
+        self._entries: Dict[Tuple[str, ...], Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def ttl_for(self, path: str) -> Optional[float]:
+        segments = _segments(path)
+        if not segments:
+            return None
+        return self.ttls.get(segments[0])
+
+    def generation(self) -> int:
+        return self._generation
+
+    def lookup(self, path: str) -> Tuple[bool, Any]:
+        """Return (found, value) from the entry for path or the closest cached ancestor"""
+        segments = _segments(path)
+        now = time.monotonic()
+        with self._lock:
+            for depth in range(len(segments), 0, -1):
+                entry = self._entries.get(segments[:depth])
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at <= now:
+                    del self._entries[segments[:depth]]
+                    continue
+                self.hits += 1
+                return True, copy.deepcopy(_descend(value, segments[depth:]))
+            self.misses += 1
+        return False, None
+
+    def store(self, path: str, value: Any, generation: int):
+        """Cache a snapshot unless a write invalidated anything since it was read"""
+        ttl = self.ttl_for(path)
+        if ttl is None:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[_segments(path)] = (time.monotonic() + ttl, copy.deepcopy(value))
+
+    def invalidate(self, path: str):
+        """Drop cached entries overlapping path (ancestors and descendants)"""
+        segments = _segments(path)
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in list(self._entries):
+                shorter = min(len(key), len(segments))
+                if key[:shorter] == segments[:shorter]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "ttls": dict(self.ttls),
+            }
+
+
+class CachedReference:
+    """Wraps a database reference so plain get() calls go through the subtree cache"""
+
+    def __init__(self, ref, cache: SubtreeCache):
+        self._ref = ref
+        self._cache = cache
+
+    def __getattr__(self, name):
+        # Queries, listen() and anything else not overridden go straight to the reference
+        return getattr(self._ref, name)
+
+    @property
+    def key(self):
+        return self._ref.key
+
+    @property
+    def path(self):
+        return self._ref.path
+
+    @property
+    def parent(self):
+        parent = self._ref.parent
+        return CachedReference(parent, self._cache) if parent is not None else None
+
+    def child(self, path: str) -> "CachedReference":
+        return CachedReference(self._ref.child(path), self._cache)
+
+    def get(self, etag: bool = False, shallow: bool = False):
+        if etag or shallow or self._cache.ttl_for(self._ref.path) is None:
+            return self._ref.get(etag=etag, shallow=shallow)
+        found, value = self._cache.lookup(self._ref.path)
+        if found:
+            return value
+        generation = self._cache.generation()
+        value = self._ref.get()
+        self._cache.store(self._ref.path, value, generation)
+        return value
+
+    def set(self, value: Any):
+        try:
+            return self._ref.set(value)
+        finally:
+            self._cache.invalidate(self._ref.path)
+
+    def update(self, value: Dict[str, Any]):
+        try:
+            return self._ref.update(value)
+        finally:
+            # Multi-path updates only touch the listed children, so keep sibling entries
+            base = "/".join(_segments(self._ref.path))
+            for key in value:
+                self._cache.invalidate(f"{base}/{key}")
+
+    def push(self, value: Any = ""):
+        try:
+            return CachedReference(self._ref.push(value), self._cache)
+        finally:
+            self._cache.invalidate(self._ref.path)
+
+    def delete(self):
+        try:
+            return self._ref.delete()
+        finally:
+            self._cache.invalidate(self._ref.path)
+
+    def transaction(self, transaction_update):
+        try:
+            return self._ref.transaction(transaction_update)
+        finally:
+            self._cache.invalidate(self._ref.path)
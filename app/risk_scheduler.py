@@ -0,0 +1,276 @@
+"""
+Scheduled re-scoring of patient risk.
+
+Every prediction stores a nextPrediction time: RISK_RESCORE_MINUTES ahead,
+or sooner for High and Critical patients. This scheduler keeps every patient
+in a priority queue keyed by that time and re-scores the ones that are due,
+so clients read patients/{id}/predictions instead of polling
+/predict/risk/{patient_id}.
+
+A worker on the event loop wakes at the next due time (at most every
+RISK_SCHEDULER_TICK seconds), splits the due patients into batches of
+RISK_SCHEDULER_BATCH_SIZE and scores them with predict_patients (one model
+call and one write per batch), running at most RISK_SCHEDULER_CONCURRENCY
+batches at a time on the database thread pool. The queue is rebuilt from the
+patients collection every RISK_SCHEDULER_REFRESH_SECONDS, which also picks up
+new patients and predictions made through the API.
+
+With several API workers only the one holding the lease at riskScheduler/lease
+schedules; the others take over if it stops renewing it for
+RISK_SCHEDULER_LEASE_SECONDS.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.async_db import run_db
+from app.firebase_config import get_ref
+from app.routers.predictions import parse_firebase_datetime, predict_patients
+
+logger = logging.getLogger(__name__)
+
+RISK_SCHEDULER_ENABLED = os.getenv("RISK_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Patients scored per model call, and batches scored at the same time
+RISK_SCHEDULER_BATCH_SIZE = int(os.getenv("RISK_SCHEDULER_BATCH_SIZE", "100"))
+RISK_SCHEDULER_CONCURRENCY = int(os.getenv("RISK_SCHEDULER_CONCURRENCY", "2"))
+# Longest sleep between checks for due patients
+RISK_SCHEDULER_TICK = float(os.getenv("RISK_SCHEDULER_TICK", "5"))
+# How often the queue and patient data are re-read from the database
+RISK_SCHEDULER_REFRESH_SECONDS = float(os.getenv("RISK_SCHEDULER_REFRESH_SECONDS", "60"))
+# Delay before retrying a patient that could not be scored (e.g. no vitals yet)
+RISK_SCHEDULER_RETRY_MINUTES = float(os.getenv("RISK_SCHEDULER_RETRY_MINUTES", "15"))
+RISK_SCHEDULER_LEASE_SECONDS = float(os.getenv("RISK_SCHEDULER_LEASE_SECONDS", "60"))
+
+RISK_SCHEDULER_LEASE_PATH = "riskScheduler/lease"
+
+
+class RiskScheduler:
+    """Priority queue of patients by next prediction time and the worker that re-scores them"""
+
+    def __init__(self):
+        self._owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._worker: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        # (due epoch seconds, patient ID); entries that no longer match _due are stale
+        self._heap: List[tuple] = []
+        self._due: Dict[str, float] = {}
+        self._in_flight = 0
+        self._patients: Dict[str, Any] = {}
+        self._refreshed_at: Optional[float] = None
+        self._leader = False
+        self._counters = {"rounds": 0, "batches": 0, "scored": 0, "alerts": 0, "skipped": 0, "errors": 0}
+        self._last_round: Dict[str, Any] = {}
+
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the scheduling worker on the running event loop"""
+        if self.is_running():
+            return
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Risk prediction scheduler started")
+
+    async def stop(self):
+        """Stop scheduling and hand the lease back; a batch already being scored still finishes its write"""
+        if not self.is_running():
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._worker = None
+        if self._leader:
+            await run_db(self._release_lease)
+        logger.info("Risk prediction scheduler stopped")
+
+    # Queue
+
+    def schedule(self, patient_id: str, due: datetime):
+        """(Re)schedule a patient's next prediction"""
+        due_seconds = due.timestamp()
+        with self._lock:
+            self._due[patient_id] = due_seconds
+            heapq.heappush(self._heap, (due_seconds, patient_id))
+
+    def _rebuild(self, patients: Dict[str, Any]):
+        """Queue every patient at its stored nextPrediction; patients never scored are due now"""
+        now = time.time()
+        due = {}
+        for patient_id, patient in patients.items():
+            if not isinstance(patient, dict):
+                continue
+            next_prediction = parse_firebase_datetime((patient.get("predictions") or {}).get("nextPrediction"))
+            due[patient_id] = next_prediction.timestamp() if next_prediction else now
+        with self._lock:
+            self._due = due
+            self._heap = [(due_seconds, patient_id) for patient_id, due_seconds in due.items()]
+            heapq.heapify(self._heap)
+            self._patients = patients
+
+    def _pop_due(self, now: float) -> List[tuple]:
+        """Remove and return (due epoch seconds, patient ID) of every patient due by now, most overdue first"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_seconds, patient_id = heapq.heappop(self._heap)
+                if self._due.get(patient_id) == due_seconds:
+                    del self._due[patient_id]
+                    due.append((due_seconds, patient_id))
+        return due
+
+    def _next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    # Lease
+
+    def _renew_lease(self) -> bool:
+        """Take or extend the scheduling lease; True if this worker holds it"""
+        now = time.time()
+
+        def claim(current):
+            if isinstance(current, dict) and current.get("owner") != self._owner and current.get("expiresAt", 0) > now:
+                return current
+            return {"owner": self._owner, "expiresAt": now + RISK_SCHEDULER_LEASE_SECONDS}
+
+        lease = get_ref(RISK_SCHEDULER_LEASE_PATH, cached=False).transaction(claim)
+        return isinstance(lease, dict) and lease.get("owner") == self._owner
+
+    def _release_lease(self):
+        try:
+            get_ref(RISK_SCHEDULER_LEASE_PATH, cached=False).transaction(
+                lambda current: None if isinstance(current, dict) and current.get("owner") == self._owner else current)
+        except Exception as e:
+            logger.error(f"Error releasing the risk scheduler lease: {e}")
+        self._leader = False
+
+    # Worker
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(RISK_SCHEDULER_CONCURRENCY)
+        while True:
+            try:
+                self._leader = await run_db(self._renew_lease)
+                if not self._leader:
+                    # Another worker schedules; rebuild from the database if this one takes over later
+                    if self._refreshed_at is not None:
+                        self._rebuild({})
+                        self._refreshed_at = None
+                else:
+                    if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= RISK_SCHEDULER_REFRESH_SECONDS:
+                        self._rebuild(await run_db(lambda: get_ref("patients", cached=False).get() or {}))
+                        self._refreshed_at = time.monotonic()
+                    await self._run_round(semaphore)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"Error in risk prediction scheduler: {e}")
+
+            # Sleep until the next patient is due, checking the lease at least every tick
+            next_due = self._next_due() if self._leader else None
+            delay = RISK_SCHEDULER_TICK if next_due is None else min(RISK_SCHEDULER_TICK, max(0.0, next_due - time.time()))
+            await asyncio.sleep(delay)
+
+    async def _run_round(self, semaphore: asyncio.Semaphore):
+        now = time.time()
+        due = self._pop_due(now)
+        if not due:
+            return
+        started = time.perf_counter()
+        lag = now - due[0][0]
+        patient_ids = [patient_id for _, patient_id in due]
+        batches = [patient_ids[i:i + RISK_SCHEDULER_BATCH_SIZE]
+                   for i in range(0, len(patient_ids), RISK_SCHEDULER_BATCH_SIZE)]
+
+        async def score(batch: List[str]):
+            async with semaphore:
+                await run_db(self._score, batch)
+
+        await asyncio.gather(*(score(batch) for batch in batches))
+        with self._lock:
+            self._counters["rounds"] += 1
+            self._last_round = {
+                "at": datetime.now().isoformat(),
+                "patients": len(patient_ids),
+                "batches": len(batches),
+                "seconds": round(time.perf_counter() - started, 3),
+                "maxLagSeconds": round(lag, 3)
+            }
+
+    def _score(self, patient_ids: List[str]):
+        """Score one batch and queue each patient again at its new nextPrediction"""
+        with self._lock:
+            self._in_flight += len(patient_ids)
+        retry_at = datetime.now() + timedelta(minutes=RISK_SCHEDULER_RETRY_MINUTES)
+        try:
+            results, errors = predict_patients(patient_ids, self._patients)
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Error scoring scheduled risk batch: {e}")
+            results, errors = {}, {patient_id: str(e) for patient_id in patient_ids}
+        finally:
+            with self._lock:
+                self._in_flight -= len(patient_ids)
+
+        for patient_id, result in results.items():
+            next_prediction = parse_firebase_datetime(result["prediction_details"]["nextPrediction"])
+            self.schedule(patient_id, next_prediction or retry_at)
+        for patient_id in errors:
+            # Patients deleted since the last refresh drop out of the queue
+            if patient_id in self._patients:
+                self.schedule(patient_id, retry_at)
+
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["scored"] += len(results)
+            self._counters["alerts"] += sum(1 for result in results.values() if result["alert_created"])
+            self._counters["skipped"] += len(errors)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, how many patients are overdue and by how long, and counters"""
+        now = time.time()
+        with self._lock:
+            overdue = [now - due_seconds for due_seconds in self._due.values() if due_seconds <= now]
+            next_due = min(self._due.values()) if self._due else None
+            counters = dict(self._counters)
+            last_round = dict(self._last_round)
+            queued = len(self._due)
+            in_flight = self._in_flight
+        return {
+            "enabled": RISK_SCHEDULER_ENABLED,
+            "running": self.is_running(),
+            "leader": self._leader,
+            "owner": self._owner,
+            "queueDepth": queued,
+            "due": len(overdue),
+            "inFlight": in_flight,
+            # How far behind schedule the most overdue queued patient is
+            "lagSeconds": round(max(overdue), 3) if overdue else 0.0,
+            "nextDueAt": datetime.fromtimestamp(next_due).isoformat() if next_due is not None else None,
+            "batchSize": RISK_SCHEDULER_BATCH_SIZE,
+            "concurrency": RISK_SCHEDULER_CONCURRENCY,
+            **counters,
+            "lastRound": last_round or None,
+            "lastRefreshSecondsAgo": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None
+        }
+
+
+risk_scheduler = RiskScheduler()
@@ -0,0 +1,309 @@
+"""
+Array-backed scorer for the trained patient risk Pipeline.
+
+The risk model is a ColumnTransformer (numeric passthrough columns plus a
+OneHotEncoder on `conditions`) followed by a RandomForestClassifier. Scoring
+one patient through the Pipeline builds a one-row DataFrame, runs every
+transformer on it and validates the result before the forest walks its trees,
+and that overhead dwarfs the forest itself. `CompiledRiskModel` extracts the
+passthrough columns and the one-hot vocabulary when the model is loaded,
+encodes a features dict straight into a preallocated NumPy row, and walks all
+trees together from flattened node arrays (as `CompiledIsolationForest` does).
+
+Probabilities match `predict_proba` exactly: rows are cast to float32 like
+sklearn's tree input, each leaf holds the class fractions its tree returns,
+and trees are summed in estimator order before dividing by their number.
+A missing value (None, e.g. an incomplete reading) is encoded as NaN and
+follows the side each split sends missing values to, as sklearn's trees do.
+`verify` checks this against the Pipeline and `compile_model` only returns a
+scorer that passes.
+
+    python -m app.risk_scorer [model.pkl]   # verify and benchmark single-row inference
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledRiskModel:
+    """Pipeline preprocessing as a column map and the forest as node arrays"""
+
+    def __init__(self, numeric: List[tuple], categorical: List[tuple], classes: np.ndarray,
+                 feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, leaf_proba: np.ndarray,
+                 roots: np.ndarray, max_depth: int, missing_right: Optional[np.ndarray] = None):
+        # (column, position in the encoded row) per passthrough column
+        self.numeric = [(column, int(position)) for column, position in numeric]
+        # (column, {category: position in the encoded row}) per one-hot encoded column
+        self.categorical = [(column, dict(vocabulary)) for column, vocabulary in categorical]
+        self.n_features = len(self.numeric) + sum(len(vocabulary) for _, vocabulary in self.categorical)
+        self.classes_ = np.asarray(classes)
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        # Right children are stored directly after their left sibling
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        # Splits that send NaN to the right child (NaN fails the <= test, so it goes left otherwise)
+        self.missing_right = (np.zeros(len(self.feature), dtype=bool) if missing_right is None
+                              else np.ascontiguousarray(missing_right, dtype=bool))
+        self.leaf_proba = np.ascontiguousarray(leaf_proba, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        # One reusable encoded row per request thread
+        self._rows = threading.local()
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "CompiledRiskModel":
+        """Extract the column layout and flatten the forest; raises ValueError for unsupported pipelines"""
+        preprocessor = pipeline.named_steps["preprocessor"]
+        forest = pipeline.named_steps["classifier"]
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        numeric, categorical = [], []
+        position = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str) and transformer == "drop":
+                continue
+            # Fitted ColumnTransformers hold passthrough columns as an identity FunctionTransformer
+            if (isinstance(transformer, str) and transformer == "passthrough") or (
+                    type(transformer).__name__ == "FunctionTransformer" and transformer.func is None):
+                numeric.extend((column, position + i) for i, column in enumerate(columns))
+                position += len(columns)
+            elif type(transformer).__name__ == "OneHotEncoder":
+                if transformer.drop is not None or getattr(transformer, "infrequent_categories_", None):
+                    raise ValueError("OneHotEncoder with drop or infrequent categories is not supported")
+                if transformer.handle_unknown != "ignore":
+                    raise ValueError("OneHotEncoder must ignore unknown categories")
+                for column, categories in zip(columns, transformer.categories_):
+                    categorical.append((column, {category: position + i for i, category in enumerate(categories)}))
+                    position += len(categories)
+            else:
+                raise ValueError(f"Unsupported transformer {name}: {transformer}")
+        if position != forest.n_features_in_:
+            raise ValueError(f"Encoded width {position} does not match the forest's {forest.n_features_in_} features")
+
+        n_classes = len(forest.classes_)
+        features, thresholds, lefts, leaf_probas, roots, missing_rights = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            left = tree.children_left
+            right = tree.children_right
+            values = tree.value[:, 0, :n_classes].astype(np.float64)
+            # sklearn < 1.3 trees have no missing-value routing (and reject NaN input)
+            missing_go_to_left = getattr(tree, "missing_go_to_left", None)
+            # Older sklearn stores class counts and normalizes them at predict time
+            normalizer = values.sum(axis=1)[:, np.newaxis]
+            if not np.allclose(normalizer, 1.0):
+                normalizer[normalizer == 0.0] = 1.0
+                values = values / normalizer
+
+            # Renumber breadth first so each right child directly follows its left sibling
+            order = [0]
+            depth = {0: 0}
+            for node in order:
+                if left[node] != -1:
+                    order.extend((left[node], right[node]))
+                    depth[left[node]] = depth[right[node]] = depth[node] + 1
+            new_id = {node: index for index, node in enumerate(order)}
+
+            tree_feature = np.zeros(len(order), dtype=np.intp)
+            tree_threshold = np.full(len(order), np.inf)
+            tree_left = np.arange(len(order)) + offset
+            tree_leaf_proba = np.zeros((len(order), n_classes))
+            tree_missing_right = np.zeros(len(order), dtype=bool)
+            for node, index in new_id.items():
+                if left[node] == -1:
+                    # Leaves point at themselves (threshold inf never goes right)
+                    tree_leaf_proba[index] = values[node]
+                else:
+                    tree_feature[index] = tree.feature[node]
+                    tree_threshold[index] = tree.threshold[node]
+                    tree_left[index] = new_id[left[node]] + offset
+                    if missing_go_to_left is not None:
+                        tree_missing_right[index] = not missing_go_to_left[node]
+            max_depth = max(max_depth, max(depth.values()))
+
+            features.append(tree_feature)
+            thresholds.append(tree_threshold)
+            lefts.append(tree_left)
+            leaf_probas.append(tree_leaf_proba)
+            missing_rights.append(tree_missing_right)
+            roots.append(offset)
+            offset += len(order)
+
+        return cls(numeric, categorical, forest.classes_,
+                   np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+                   np.concatenate(leaf_probas), np.array(roots), max_depth, np.concatenate(missing_rights))
+
+    # Encoding
+
+    def encode(self, features: Dict[str, Any], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Encoded model row for a features dict (as predictions.build_risk_features builds it)"""
+        if out is None:
+            out = np.zeros(self.n_features)
+        else:
+            out.fill(0.0)
+        for column, position in self.numeric:
+            value = features.get(column)
+            out[position] = np.nan if value is None else value
+        for column, vocabulary in self.categorical:
+            # Unknown categories encode as all zeros, like handle_unknown="ignore"
+            position = vocabulary.get(features.get(column))
+            if position is not None:
+                out[position] = 1.0
+        return out
+
+    def _row(self) -> np.ndarray:
+        row = getattr(self._rows, "row", None)
+        if row is None:
+            row = self._rows.row = np.zeros(self.n_features)
+        return row
+
+    # Scoring
+
+    def _walk(self, values: np.ndarray, nodes: np.ndarray, row_offsets: Optional[np.ndarray]) -> np.ndarray:
+        """Leaf reached by each (row, tree) starting at its root"""
+        missing = bool(np.isnan(values).any())
+        for _ in range(self.max_depth):
+            columns = self.feature.take(nodes)
+            node_values = values.take(columns if row_offsets is None else columns + row_offsets)
+            go_right = node_values > self.threshold.take(nodes)
+            if missing:
+                go_right |= np.isnan(node_values) & self.missing_right.take(nodes)
+            nodes = self.left.take(nodes) + go_right
+        return nodes
+
+    def predict_proba_one(self, features: Dict[str, Any]) -> np.ndarray:
+        """Class probabilities for one features dict, without building a DataFrame"""
+        values = self.encode(features, self._row()).astype(np.float32).astype(np.float64)
+        nodes = self._walk(values, self.roots, None)
+        # Summing over the tree axis adds trees one after another, in estimator order
+        return self.leaf_proba.take(nodes, axis=0).sum(axis=0) / self.n_trees
+
+    def predict_proba(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        """Class probabilities for many features dicts; same as the Pipeline's predict_proba"""
+        if not rows:
+            return np.zeros((0, len(self.classes_)))
+        X = np.zeros((len(rows), self.n_features))
+        for row, features in zip(X, rows):
+            self.encode(features, row)
+        values = X.astype(np.float32).astype(np.float64).ravel()
+        n_rows = len(rows)
+        row_offsets = np.repeat(np.arange(n_rows) * self.n_features, self.n_trees)
+        nodes = self._walk(values, np.tile(self.roots, n_rows), row_offsets)
+        leaf_proba = self.leaf_proba.take(nodes, axis=0).reshape(n_rows, self.n_trees, -1)
+        return leaf_proba.sum(axis=1) / self.n_trees
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Node arrays, for sharing between workers"""
+        return {"feature": self.feature, "threshold": self.threshold, "left": self.left,
+                "leaf_proba": self.leaf_proba, "roots": self.roots, "missing_right": self.missing_right}
+
+    def with_arrays(self, arrays) -> "CompiledRiskModel":
+        """Same model scoring from other (e.g. memory-mapped) copies of its node arrays"""
+        return CompiledRiskModel(self.numeric, self.categorical, self.classes_,
+                                 arrays["feature"], arrays["threshold"], arrays["left"],
+                                 arrays["leaf_proba"], arrays["roots"], self.max_depth, arrays["missing_right"])
+
+
+def sample_rows(compiled: CompiledRiskModel, n_rows: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Random features dicts spread around the forest's split thresholds, with known and unknown categories and missing values"""
+    rng = np.random.default_rng(seed)
+    split = np.isfinite(compiled.threshold)
+    rows = []
+    for _ in range(n_rows):
+        features = {}
+        for column, position in compiled.numeric:
+            column_thresholds = compiled.threshold[split & (compiled.feature == position)]
+            if len(column_thresholds):
+                # Exactly on a threshold half the time, to exercise the <= comparison
+                value = rng.choice(column_thresholds)
+                features[column] = float(value if rng.random() < 0.5 else value + rng.normal(0, 1 + abs(value) * 0.1))
+            else:
+                features[column] = float(rng.normal(0, 10))
+            if rng.random() < 0.05:
+                features[column] = None
+        for column, vocabulary in compiled.categorical:
+            categories = list(vocabulary) + ["unknown-category"]
+            features[column] = categories[rng.integers(len(categories))]
+        rows.append(features)
+    return rows
+
+
+def verify(compiled: CompiledRiskModel, pipeline, n_rows: int = 500, seed: int = 0) -> Dict[str, Any]:
+    """Compare compiled probabilities with the Pipeline's, which must be identical"""
+    import pandas as pd
+
+    rows = sample_rows(compiled, n_rows, seed)
+    columns = list(pipeline.named_steps["preprocessor"].feature_names_in_)
+    expected = pipeline.predict_proba(pd.DataFrame(rows)[columns])
+    batch = compiled.predict_proba(rows)
+    single = np.array([compiled.predict_proba_one(row) for row in rows[:50]])
+    batch_match = bool(np.array_equal(batch, expected))
+    single_match = bool(np.array_equal(single, expected[:50]))
+    classes_match = bool(np.array_equal(compiled.classes_, pipeline.named_steps["classifier"].classes_))
+    return {
+        "rows": n_rows,
+        "max_abs_error": float(np.max(np.abs(batch - expected))) if n_rows else 0.0,
+        "batch_match": batch_match,
+        "single_match": single_match,
+        "ok": batch_match and single_match and classes_match
+    }
+
+
+def compile_model(pipeline) -> Optional[CompiledRiskModel]:
+    """Compiled scorer for a loaded risk Pipeline, or None if it cannot reproduce predict_proba exactly"""
+    try:
+        compiled = CompiledRiskModel.from_pipeline(pipeline)
+        check = verify(compiled, pipeline)
+        if not check["ok"]:
+            logger.warning(f"Compiled risk model does not match the Pipeline ({check}); using the Pipeline")
+            return None
+        return compiled
+    except Exception as e:
+        logger.warning(f"Risk model not compiled, using the Pipeline: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("models", "patient_risk_model.pkl")
+    pipeline = joblib.load(model_path)
+
+    compiled = CompiledRiskModel.from_pipeline(pipeline)
+    print(f"🌲 {compiled.n_trees} trees, {len(compiled.feature)} nodes, depth {compiled.max_depth}, "
+          f"{compiled.n_features} encoded features")
+    print(f"🔍 Verification: {verify(compiled, pipeline, n_rows=5000)}")
+
+    row = sample_rows(compiled, 1, seed=1)[0]
+    frame = pd.DataFrame([row])
+    for label, score_row in (("pipeline", lambda: pipeline.predict_proba(pd.DataFrame([row]))),
+                             ("pipeline (frame reused)", lambda: pipeline.predict_proba(frame)),
+                             ("compiled", lambda: compiled.predict_proba_one(row))):
+        runs = 200 if label.startswith("pipeline") else 5000
+        start = time.perf_counter()
+        for _ in range(runs):
+            score_row()
+        print(f"⏱️ {label} single row: {(time.perf_counter() - start) / runs * 1e6:.1f} µs")
+
+    for n_rows in (10, 100, 1000):
+        rows = sample_rows(compiled, n_rows, seed=2)
+        start = time.perf_counter()
+        compiled.predict_proba(rows)
+        elapsed = time.perf_counter() - start
+        print(f"📈 compiled batch of {n_rows}: {elapsed * 1e3:.2f} ms ({elapsed / n_rows * 1e6:.2f} µs/row)")
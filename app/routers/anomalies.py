@@ -1,14 +1,19 @@
 # app/routers/anomalies.py
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import logging
-import joblib
 import numpy as np
 import os
-import re
 from app.firebase_config import get_ref
+from app.anomaly_training import AnomalyRetrainer, RETRAIN_LOOKBACK_HOURS
+from app.iforest_scorer import CompiledIsolationForest, compile_model
+from app.iot_mirror import mirror
+from app.model_registry import MODEL_MMAP, ModelLoadError, ModelRegistry, ModelVersionNotFound, share_arrays
+from app.timekeys import encode_key, paginate, read_window
+from app.vitals_store import read_range
+from app.vitals_trends import trends
 
 router = APIRouter(prefix="/anomalies", tags=["Anomaly Detection"])
 logger = logging.getLogger(__name__)
@@ -21,64 +26,181 @@ logger = logging.getLogger(__name__)
 #         sanitized = re.sub(r'[#\$\[\]]', '', sanitized)
 #         return sanitized
 
-def format_datetime_for_firebase(dt):
-    """Format datetime in a Firebase-safe format (no colons or special chars)"""
-    return dt.strftime("%Y-%m-%d_%H-%M-%S")
+# Prepare and smoke-test anomaly model versions before they are served
+def prepare_anomaly_model(model_data: Dict) -> Dict:
+    """Attach the array-backed copy of the forest, used only if it reproduces sklearn's scores"""
+    compiled = compile_model(model_data)
+    if compiled is not None and MODEL_MMAP:
+        # Score from memory maps shared by every worker instead of a private copy
+        compiled = CompiledIsolationForest.from_arrays(share_arrays("isolation_forest", compiled.arrays()))
+    model_data['compiled'] = compiled
+    return model_data
 
-def format_timestamp_string_for_firebase(timestamp_str):
-    """Format ISO timestamp string to Firebase-safe format"""
-    try:
-        # Handle different ISO formats
-        if isinstance(timestamp_str, str):
-            # Remove timezone info and parse
-            clean_timestamp = timestamp_str.replace('Z', '').replace('+00:00', '')
-            if 'T' in clean_timestamp:
-                dt = datetime.fromisoformat(clean_timestamp)
-            else:
-                # Try to parse as standard datetime string
-                dt = datetime.strptime(clean_timestamp, "%Y-%m-%d %H:%M:%S")
-            return format_datetime_for_firebase(dt)
-        else:
-            # If it's already a datetime object
-            return format_datetime_for_firebase(timestamp_str)
-    except Exception as e:
-        logger.warning(f"Could not parse timestamp {timestamp_str}, using sanitized version: {e}")
-        # Fallback: sanitize the string directly
-        sanitized = re.sub(r'[.:]', '-', str(timestamp_str))
-        sanitized = re.sub(r'[#\$\[\]TZ+]', '', sanitized)
-        return sanitized
-
-# Load the trained anomaly model
-def load_anomaly_model():
-    """Load the trained isolation forest anomaly model"""
-    try:
-        # Get the models directory path
-        current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        model_path = os.path.join(current_dir, 'models', 'isolation_forest_anomaly_model.pkl')
-        
-        if os.path.exists(model_path):
-            model_data = joblib.load(model_path)
-            logger.info(f"Anomaly model loaded successfully from {model_path}")
-            return model_data
-        else:
-            logger.warning(f"Anomaly model not found at {model_path}")
-            return None
-    except Exception as e:
-        logger.error(f"Error loading anomaly model: {e}")
-        return None
+def validate_anomaly_model(model_data: Dict) -> Dict:
+    """Score a small batch around the training mean; the version is rejected unless it scores cleanly"""
+    missing = [key for key in ('model', 'scaler', 'feature_names') if key not in model_data]
+    if missing:
+        return {"ok": False, "error": f"missing {', '.join(missing)}"}
+    feature_names = model_data['feature_names']
+    scaler = model_data['scaler']
+    if len(feature_names) != getattr(scaler, 'n_features_in_', len(feature_names)):
+        return {"ok": False, "error": "feature_names do not match the scaler"}
+    rng = np.random.default_rng(0)
+    smoke_rows = scaler.mean_ + rng.standard_normal((16, len(feature_names))) * scaler.scale_
+    compiled = model_data.get('compiled')
+    if compiled is not None:
+        scores = compiled.decision_function(smoke_rows)
+    else:
+        scores = model_data['model'].decision_function(scaler.transform(smoke_rows))
+    ok = scores.shape == (len(smoke_rows),) and bool(np.all(np.isfinite(scores)))
+    return {"ok": ok, "rows": len(smoke_rows), "anomalies": int(np.sum(scores < 0)),
+            "scorer": "compiled" if compiled is not None else "sklearn"}
 
-# Load model on startup
-anomaly_model_data = load_anomaly_model()
+# Load the served model version on startup; new versions are swapped in without a restart
+anomaly_models = ModelRegistry("isolation_forest_anomaly_model",
+                               prepare=prepare_anomaly_model, validate=validate_anomaly_model)
+anomaly_models.load_initial()
 
-def detect_anomaly_with_model(sensor_data: Dict, device_id: str, environmental_data: Optional[Dict] = None) -> Dict:
+# Retraining builds rows exactly as detection does
+anomaly_retrainer = AnomalyRetrainer(
+    anomaly_models,
+    lambda sensor_data, environmental_data, feature_names:
+        model_feature_row(map_model_features(sensor_data, environmental_data), feature_names)
+)
+
+# Map Firebase vital signs and environmental fields to model feature names
+VITAL_FEATURE_MAP = {
+    'heartRate': 'heart_rate',
+    'oxygenLevel': 'oxygen_level',
+    'respiratoryRate': 'respiratory_rate',
+    'temperature': 'temperature',
+    'glucose': 'glucose'
+}
+
+ENV_FEATURE_MAP = {
+    'temperature': 'env_temperature',
+    'humidity': 'env_humidity',
+    'airQuality': 'env_air_quality',
+    'lightLevel': 'env_light_level',
+    'noiseLevel': 'env_noise_level',
+    'pressure': 'env_pressure',
+    'co2Level': 'env_co2_level'
+}
+
+def map_model_features(sensor_data: Dict, environmental_data: Optional[Dict] = None) -> Dict:
+    """Map a vitals reading (and optional environmental reading) to model feature names"""
+    mapped_data = {}
+    for fb_key, model_key in VITAL_FEATURE_MAP.items():
+        if fb_key in sensor_data:
+            mapped_data[model_key] = sensor_data[fb_key]
+    
+    # Handle blood pressure mapping (it's an object in Firebase)
+    if 'bloodPressure' in sensor_data and isinstance(sensor_data['bloodPressure'], dict):
+        bp = sensor_data['bloodPressure']
+        mapped_data['systolic_bp'] = bp.get('systolic', 0)
+        mapped_data['diastolic_bp'] = bp.get('diastolic', 0)
+    
+    if environmental_data:
+        for env_key, model_key in ENV_FEATURE_MAP.items():
+            if env_key in environmental_data:
+                mapped_data[model_key] = environmental_data[env_key]
+    
+    return mapped_data
+
+def model_feature_row(mapped_data: Dict, feature_names: List[str]) -> List[float]:
+    """Model input row in training feature order; missing features are 0"""
+    return [float(mapped_data.get(name, 0)) if mapped_data.get(name, 0) is not None else 0.0 for name in feature_names]
+
+def classify_anomaly_types(combined_data: Dict, environmental_included: bool) -> List[str]:
+    """Name the kinds of anomaly suggested by the feature values"""
+    anomaly_types = []
+    
+    # Check vital sign anomalies using mapped field names
+    hr = combined_data.get('heart_rate', 70)
+    sys_bp = combined_data.get('systolic_bp', 120)
+    dia_bp = combined_data.get('diastolic_bp', 80)
+    temp = combined_data.get('temperature', 37)
+    o2 = combined_data.get('oxygen_level', 98)
+    rr = combined_data.get('respiratory_rate', 16)
+    glucose = combined_data.get('glucose', 100)
+    
+    # Cardiac anomalies
+    if hr > 110 or hr < 50:
+        anomaly_types.append("Cardiac Rhythm Anomaly")
+    if sys_bp > 160 or sys_bp < 90 or dia_bp > 100 or dia_bp < 60:
+        anomaly_types.append("Blood Pressure Anomaly")
+    
+    # Respiratory anomalies
+    if o2 < 95 or rr > 25 or rr < 10:
+        anomaly_types.append("Respiratory Anomaly")
+    
+    # Temperature anomalies
+    if temp > 38.5 or temp < 35.5:
+        anomaly_types.append("Temperature Anomaly")
+    
+    # Metabolic anomalies
+    if glucose > 180 or glucose < 70:
+        anomaly_types.append("Metabolic Anomaly")
+    
+    # Environmental anomalies (if environmental data included)
+    if environmental_included:
+        env_temp = combined_data.get('env_temperature', 22)
+        env_humidity = combined_data.get('env_humidity', 45)
+        env_air_quality = combined_data.get('env_air_quality', 85)
+        env_noise = combined_data.get('env_noise_level', 35)
+        env_co2 = combined_data.get('env_co2_level', 400)
+        
+        if env_temp > 26 or env_temp < 18 or env_humidity > 70 or env_humidity < 30:
+            anomaly_types.append("Environmental Climate Anomaly")
+        if env_air_quality < 60 or env_co2 > 800:
+            anomaly_types.append("Air Quality Anomaly")
+        if env_noise > 60:
+            anomaly_types.append("Noise Level Anomaly")
+    
+    # If no specific anomaly type found, use general classification
+    if not anomaly_types:
+        anomaly_types.append("Statistical Outlier")
+    
+    return anomaly_types
+
+def apply_anomaly_score(result: Dict, combined_data: Dict, anomaly_score: float, environmental_included: bool) -> Dict:
+    """Fill a detection result from the model's decision_function score"""
+    # IsolationForest.predict() is -1 exactly where decision_function() < 0
+    result["anomaly_score"] = float(anomaly_score)
+    result["is_anomaly"] = bool(anomaly_score < 0)
+    result["confidence"] = float(abs(anomaly_score))
+    
+    if result["is_anomaly"]:
+        result["anomaly_type"] = classify_anomaly_types(combined_data, environmental_included)
+        
+        # Adjust severity based on anomaly score - make thresholds more restrictive
+        if float(anomaly_score) < -0.5:  # Very restrictive threshold for HIGH
+            result["severity_level"] = "HIGH"
+            result["severity_score"] = float(abs(anomaly_score)) * 10
+        elif float(anomaly_score) < -0.35:  # More restrictive for MEDIUM
+            result["severity_level"] = "MEDIUM" 
+            result["severity_score"] = float(abs(anomaly_score)) * 8
+        else:  # Less severe anomalies
+            result["severity_level"] = "LOW"
+            result["severity_score"] = float(abs(anomaly_score)) * 5
+    
+    # Add confidence assessment to details
+    result["details"]["confidence_assessment"] = "High" if result["confidence"] > 0.5 else "Medium" if result["confidence"] > 0.2 else "Low"
+    result["details"]["model_status"] = "Model loaded and functional"
+    
+    # Ensure all numeric values are JSON serializable Python types
+    result["severity_score"] = float(result["severity_score"])
+    return result
+
+def detect_anomalies_batch(rows: List[Tuple[Dict, str, Optional[Dict]]]) -> List[Dict]:
     """
-    Detect anomalies using the trained Isolation Forest model
-    Includes environmental data if provided
+    Score many (sensor_data, device_id, environmental_data) rows at once
+    Builds one feature matrix and makes a single scaler.transform and
+    decision_function call for the whole batch
     """
     timestamp = datetime.now().isoformat()
     
-    # Initialize result
-    result = {
+    results = [{
         "device_id": device_id,
         "timestamp": timestamp,
         "is_anomaly": False,
@@ -89,174 +211,58 @@ def detect_anomaly_with_model(sensor_data: Dict, device_id: str, environmental_d
         "details": {},
         "confidence": 0.0,
         "environmental_included": environmental_data is not None
-    }
+    } for _, device_id, environmental_data in rows]
     
+    if not rows:
+        return results
+    
+    # One version for the whole batch, even if a new one is swapped in meanwhile
+    active_model = anomaly_models.active
+    anomaly_model_data = active_model.artifact if active_model is not None else None
     if anomaly_model_data is None:
         logger.warning("Anomaly model not loaded, skipping anomaly detection")
-        result["details"]["model_status"] = "Model not available - no detection performed"
-        result["severity_level"] = "NORMAL"
-        return result
+        for result in results:
+            result["details"]["model_status"] = "Model not available - no detection performed"
+        return results
     
     try:
         model = anomaly_model_data['model']
         scaler = anomaly_model_data['scaler']
         feature_names = anomaly_model_data['feature_names']
         
-        logger.info(f"Processing anomaly detection for device {device_id} with features: {list(sensor_data.keys())}")
-        if environmental_data:
-            logger.info(f"Including environmental data: {list(environmental_data.keys())}")
-        
-        # Combine sensor data and environmental data
-        combined_data = sensor_data.copy()
-        
-        # Map Firebase vital signs to model feature names
-        vital_mapping = {
-            'heartRate': 'heart_rate',
-            'oxygenLevel': 'oxygen_level',
-            'respiratoryRate': 'respiratory_rate',
-            'temperature': 'temperature',
-            'glucose': 'glucose'
-        }
-        
-        # Create a properly mapped dataset for the model
-        mapped_data = {}
-        for fb_key, model_key in vital_mapping.items():
-            if fb_key in sensor_data:
-                mapped_data[model_key] = sensor_data[fb_key]
-        
-        # Handle blood pressure mapping (it's an object in Firebase)
-        if 'bloodPressure' in sensor_data and isinstance(sensor_data['bloodPressure'], dict):
-            bp = sensor_data['bloodPressure']
-            mapped_data['systolic_bp'] = bp.get('systolic', 0)
-            mapped_data['diastolic_bp'] = bp.get('diastolic', 0)
-        
-        if environmental_data:
-            # Add environmental data with appropriate field mapping
-            env_mapping = {
-                'temperature': 'env_temperature',
-                'humidity': 'env_humidity', 
-                'airQuality': 'env_air_quality',
-                'lightLevel': 'env_light_level',
-                'noiseLevel': 'env_noise_level',
-                'pressure': 'env_pressure',
-                'co2Level': 'env_co2_level'
-            }
-            
-            for env_key, model_key in env_mapping.items():
-                if env_key in environmental_data:
-                    mapped_data[model_key] = environmental_data[env_key]
-        
-        # Use mapped_data instead of combined_data for feature extraction
-        combined_data = mapped_data
-        
-        logger.info(f"Mapped data for model: {combined_data}")
-        
-        # Prepare features in the same order as training
-        features = []
-        for feature_name in feature_names:
-            value = combined_data.get(feature_name, 0)
-            # Ensure value is a Python float, not numpy type
-            features.append(float(value) if value is not None else 0.0)
+        # Prepare features in the same order as training, one row per reading
+        mapped_rows = [map_model_features(sensor_data, environmental_data) for sensor_data, _, environmental_data in rows]
+        features_array = np.array([model_feature_row(mapped, feature_names) for mapped in mapped_rows], dtype=np.float64)
         
-        logger.info(f"Prepared features: {features}")
-        logger.info(f"Feature names: {feature_names}")
-        
-        # Convert to numpy array and reshape
-        features_array = np.array(features, dtype=np.float64).reshape(1, -1)
-        
-        # Scale features
-        features_scaled = scaler.transform(features_array)
+        # One vectorized scale + score call for every row
+        compiled = anomaly_model_data.get('compiled')
+        if compiled is not None:
+            anomaly_scores = compiled.decision_function(features_array)
+        else:
+            anomaly_scores = model.decision_function(scaler.transform(features_array))
         
-        # Get prediction and anomaly score
-        prediction = model.predict(features_scaled)[0]
-        anomaly_score = model.decision_function(features_scaled)[0]
+        for result, mapped, anomaly_score, (_, _, environmental_data) in zip(results, mapped_rows, anomaly_scores, rows):
+            apply_anomaly_score(result, mapped, float(anomaly_score), bool(environmental_data))
+            result["details"]["model_version"] = active_model.version
         
-        # Update result (convert numpy types to Python types)
-        result["anomaly_score"] = float(anomaly_score)
-        result["is_anomaly"] = bool(prediction == -1)
-        result["confidence"] = float(abs(anomaly_score))
-        
-        if result["is_anomaly"]:
-            # Analyze which type of anomaly this is based on feature values
-            anomaly_types = []
-            
-            # Check vital sign anomalies using mapped field names
-            hr = combined_data.get('heart_rate', 70)
-            sys_bp = combined_data.get('systolic_bp', 120)
-            dia_bp = combined_data.get('diastolic_bp', 80)
-            temp = combined_data.get('temperature', 37)
-            o2 = combined_data.get('oxygen_level', 98)
-            rr = combined_data.get('respiratory_rate', 16)
-            glucose = combined_data.get('glucose', 100)
-            
-            # Cardiac anomalies
-            if hr > 110 or hr < 50:
-                anomaly_types.append("Cardiac Rhythm Anomaly")
-            if sys_bp > 160 or sys_bp < 90 or dia_bp > 100 or dia_bp < 60:
-                anomaly_types.append("Blood Pressure Anomaly")
-            
-            # Respiratory anomalies
-            if o2 < 95 or rr > 25 or rr < 10:
-                anomaly_types.append("Respiratory Anomaly")
-            
-            # Temperature anomalies
-            if temp > 38.5 or temp < 35.5:
-                anomaly_types.append("Temperature Anomaly")
-            
-            # Metabolic anomalies
-            if glucose > 180 or glucose < 70:
-                anomaly_types.append("Metabolic Anomaly")
-            
-            # Environmental anomalies (if environmental data included)
-            if environmental_data:
-                env_temp = combined_data.get('env_temperature', 22)
-                env_humidity = combined_data.get('env_humidity', 45)
-                env_air_quality = combined_data.get('env_air_quality', 85)
-                env_noise = combined_data.get('env_noise_level', 35)
-                env_co2 = combined_data.get('env_co2_level', 400)
-                
-                if env_temp > 26 or env_temp < 18 or env_humidity > 70 or env_humidity < 30:
-                    anomaly_types.append("Environmental Climate Anomaly")
-                if env_air_quality < 60 or env_co2 > 800:
-                    anomaly_types.append("Air Quality Anomaly")
-                if env_noise > 60:
-                    anomaly_types.append("Noise Level Anomaly")
-            
-            # If no specific anomaly type found, use general classification
-            if not anomaly_types:
-                anomaly_types.append("Statistical Outlier")
-            
-            result["anomaly_type"] = anomaly_types
-            
-            # Adjust severity based on anomaly score - make thresholds more restrictive
-            if float(anomaly_score) < -0.5:  # Very restrictive threshold for HIGH
-                result["severity_level"] = "HIGH"
-                result["severity_score"] = float(abs(anomaly_score)) * 10
-            elif float(anomaly_score) < -0.35:  # More restrictive for MEDIUM
-                result["severity_level"] = "MEDIUM" 
-                result["severity_score"] = float(abs(anomaly_score)) * 8
-            else:  # Less severe anomalies
-                result["severity_level"] = "LOW"
-                result["severity_score"] = float(abs(anomaly_score)) * 5
-        
-        # Add confidence assessment to details
-        result["details"]["confidence_assessment"] = "High" if result["confidence"] > 0.5 else "Medium" if result["confidence"] > 0.2 else "Low"
-        result["details"]["model_status"] = "Model loaded and functional"
-        
-        # Ensure all numeric values are JSON serializable Python types
-        result["anomaly_score"] = float(result["anomaly_score"])
-        result["severity_score"] = float(result["severity_score"])
-        result["confidence"] = float(result["confidence"])
-        result["is_anomaly"] = bool(result["is_anomaly"])
+        logger.info(f"Scored {len(rows)} readings, {sum(result['is_anomaly'] for result in results)} anomalous")
         
     except Exception as e:
         logger.error(f"Error in model-based anomaly detection: {e}")
-        result["details"]["model_error"] = str(e)
-        result["severity_level"] = "NORMAL"
-        result["details"]["model_status"] = "Model error - no detection performed"
-        return result
+        for result in results:
+            result.update({"is_anomaly": False, "anomaly_score": 0.0, "severity_level": "NORMAL",
+                           "severity_score": 0.0, "anomaly_type": [], "confidence": 0.0})
+            result["details"]["model_error"] = str(e)
+            result["details"]["model_status"] = "Model error - no detection performed"
     
-    return result
+    return results
+
+def detect_anomaly_with_model(sensor_data: Dict, device_id: str, environmental_data: Optional[Dict] = None) -> Dict:
+    """
+    Detect anomalies using the trained Isolation Forest model
+    Includes environmental data if provided
+    """
+    return detect_anomalies_batch([(sensor_data, device_id, environmental_data)])[0]
 
 class AnomalyAlert(BaseModel):
     device_id: str
@@ -270,41 +276,22 @@ def get_recent_vitals(device_id: str, hours: int = 1) -> List[Dict]:
     """Get recent vitals for trend analysis"""
     try:
         # First get the device to check current patient assignment
-        device_ref = get_ref(f"iotData/{device_id}")
-        device_data = device_ref.get()
+        device_info = mirror.device_info(device_id)
         
-        if not device_data:
+        if device_info is None:
             logger.warning(f"Device {device_id} not found")
             return []
         
         # Get current patient ID
-        current_patient_id = device_data.get("deviceInfo", {}).get("currentPatientId")
+        current_patient_id = device_info.get("currentPatientId")
         
         if not current_patient_id:
             logger.warning(f"No patient assigned to device {device_id}")
             return []
         
-        # Get vitals for the current patient
-        vitals_ref = get_ref(f"iotData/{device_id}/vitals/{current_patient_id}")
-        vitals_data = vitals_ref.get() or {}
-        
-        # Filter by time (last N hours)
+        # Read only the hour buckets covering the last N hours
         cutoff_time = datetime.now() - timedelta(hours=hours)
-        recent_vitals = []
-        
-        for timestamp, data in vitals_data.items():
-            try:
-                # Parse timestamp (handle sanitized format)
-                ts_clean = timestamp.replace('-', ':')
-                if '.' in ts_clean:
-                    ts_clean = ts_clean.split('.')[0]
-                data_time = datetime.fromisoformat(ts_clean)
-                
-                if data_time >= cutoff_time:
-                    recent_vitals.append(data)
-            except Exception as e:
-                logger.warning(f"Error parsing timestamp {timestamp}: {e}")
-                continue
+        recent_vitals = [data for _, data in read_range(device_id, current_patient_id, cutoff_time)]
         
         # Sort by timestamp and return last 10 readings
         return recent_vitals[-10:] if recent_vitals else []
@@ -313,41 +300,77 @@ def get_recent_vitals(device_id: str, hours: int = 1) -> List[Dict]:
         logger.error(f"Error getting recent vitals for {device_id}: {e}")
         return []
 
-def save_anomaly_log(anomaly_result: Dict):
-    """Save anomaly detection result to Firebase"""
-    try:
-        device_id = anomaly_result["device_id"]
-        timestamp = anomaly_result["timestamp"]
-        
-        # Sanitize timestamp for Firebase (handle string timestamp)
-        safe_timestamp = format_timestamp_string_for_firebase(timestamp)
-        
-        # Save to anomaly logs
-        anomaly_ref = get_ref(f"anomalies/{device_id}/{safe_timestamp}")
-        anomaly_ref.set(anomaly_result)
-        
-        # If it's an anomaly, also save as an alert
+def anomaly_log_paths(anomaly_result: Dict) -> Dict[str, Dict]:
+    """Root-relative paths and values that record one detection result"""
+    device_id = anomaly_result["device_id"]
+    timestamp = anomaly_result["timestamp"]
+    
+    # Sortable key so history can be read back with key-range queries
+    safe_timestamp = encode_key(timestamp)
+    
+    # Anomaly log entry
+    paths = {f"anomalies/{device_id}/{safe_timestamp}": anomaly_result}
+    
+    # If it's an anomaly, also save as an alert
+    if anomaly_result["is_anomaly"]:
+        paths[f"iotData/{device_id}/alerts/{safe_timestamp}"] = {
+            "device_id": device_id,
+            "timestamp": timestamp,
+            "severity_level": anomaly_result["severity_level"],
+            "severity_score": anomaly_result["severity_score"],
+            "anomaly_type": anomaly_result["anomaly_type"],
+            "message": generate_alert_message(anomaly_result),
+            "resolved": False,
+            "details": anomaly_result.get("details", {}),
+            "trend_analysis": anomaly_result.get("trend_analysis", {})
+        }
+    return paths
+
+# Hourly counters: anomalyStats/{YYYY-MM-DD-HH}/{device_id}/{counter}
+ANOMALY_STATS_ROOT = "anomalyStats"
+SEVERITY_LEVELS = ("CRITICAL", "HIGH", "MEDIUM", "LOW")
+
+def stats_bucket(moment: datetime) -> str:
+    """Hour bucket key; lexicographic order is time order"""
+    return moment.strftime("%Y-%m-%d-%H")
+
+def anomaly_stats_paths(anomaly_results: List[Dict]) -> Dict[str, Dict]:
+    """Server-side increments of the hourly counters for a set of detection results"""
+    counts = {}
+    for anomaly_result in anomaly_results:
+        moment = datetime.fromisoformat(anomaly_result["timestamp"])
+        counter_path = f"{ANOMALY_STATS_ROOT}/{stats_bucket(moment)}/{anomaly_result['device_id']}"
+        counters = [f"{counter_path}/readings"]
         if anomaly_result["is_anomaly"]:
-            alert_data = {
-                "device_id": device_id,
-                "timestamp": timestamp,
-                "severity_level": anomaly_result["severity_level"],
-                "severity_score": anomaly_result["severity_score"],
-                "anomaly_type": anomaly_result["anomaly_type"],
-                "message": generate_alert_message(anomaly_result),
-                "resolved": False,
-                "details": anomaly_result.get("details", {}),
-                "trend_analysis": anomaly_result.get("trend_analysis", {})
-            }
-            
-            alert_ref = get_ref(f"iotData/{device_id}/alerts/{safe_timestamp}")
-            alert_ref.set(alert_data)
-            
-            logger.info(f"Anomaly alert created for device {device_id}: {alert_data['severity_level']}")
+            counters.append(f"{counter_path}/anomalies")
+            if anomaly_result.get("severity_level") in SEVERITY_LEVELS:
+                counters.append(f"{counter_path}/{anomaly_result['severity_level']}")
+        for path in counters:
+            counts[path] = counts.get(path, 0) + 1
+    return {path: {".sv": {"increment": count}} for path, count in counts.items()}
+
+def save_anomaly_logs(anomaly_results: List[Dict]):
+    """Save many detection results and their hourly counters with a single multi-path update"""
+    try:
+        updates = {}
+        for anomaly_result in anomaly_results:
+            updates.update(anomaly_log_paths(anomaly_result))
+        # Counters are incremented in the same update, so they never drift from the logs
+        updates.update(anomaly_stats_paths(anomaly_results))
+        if updates:
+            get_ref("/").update(updates)
+        
+        for anomaly_result in anomaly_results:
+            if anomaly_result["is_anomaly"]:
+                logger.info(f"Anomaly alert created for device {anomaly_result['device_id']}: {anomaly_result['severity_level']}")
     
     except Exception as e:
         logger.error(f"Error saving anomaly log: {e}")
 
+def save_anomaly_log(anomaly_result: Dict):
+    """Save anomaly detection result to Firebase"""
+    save_anomaly_logs([anomaly_result])
+
 def generate_alert_message(anomaly_result: Dict) -> str:
     """Generate human-readable alert message"""
     device_id = anomaly_result["device_id"]
@@ -370,12 +393,14 @@ def get_model_status():
     """
     Get the status of the anomaly detection model
     """
+    anomaly_model_data = anomaly_models.get()
     if anomaly_model_data is None:
         return {
             "model_loaded": False,
             "status": "Model not found or failed to load",
             "features": None,
-            "training_samples": None
+            "training_samples": None,
+            "registry": anomaly_models.status()
         }
     
     return {
@@ -383,9 +408,42 @@ def get_model_status():
         "status": "Model loaded successfully",
         "features": anomaly_model_data.get('feature_names', []),
         "training_samples": anomaly_model_data.get('training_samples', 0),
-        "model_type": "Isolation Forest"
+        "model_type": "Isolation Forest",
+        "scorer": "compiled" if anomaly_model_data.get('compiled') is not None else "sklearn",
+        "version": anomaly_models.version(),
+        "registry": anomaly_models.status()
     }
 
+@router.post("/model/reload")
+def reload_anomaly_model(version: Optional[str] = None):
+    """
+    Load, smoke-test and activate a model version (default: re-read the active one)
+    Other workers pick the activated version up on their next registry check
+    """
+    try:
+        loaded = anomaly_models.load(version, activate=version is not None)
+        return {"message": f"Anomaly model version {loaded.version} active",
+                "version": loaded.version, "load_seconds": loaded.load_seconds,
+                "validation": loaded.validation}
+    except ModelVersionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reloading anomaly model: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to reload model: {str(e)}")
+
+def find_room_environment(room_id: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+    """Newest environmental reading in a room, or in any room if it has none"""
+    if room_id:
+        env_sensor_id, _, env_data = mirror.room_environment(room_id)
+        if env_data:
+            return env_sensor_id, env_data
+    
+    # Fallback: any environmental sensor that has data
+    env_sensor_id, _, env_data = mirror.newest_environment()
+    return env_sensor_id, env_data
+
 @router.get("/detect/{monitor_id}")
 async def detect_anomaly(monitor_id: str, background_tasks: BackgroundTasks = None):
     """
@@ -396,15 +454,13 @@ async def detect_anomaly(monitor_id: str, background_tasks: BackgroundTasks = No
         # Log the received parameters for debugging
         logger.info(f"🔍 Anomaly detection endpoint called for monitor: {monitor_id}")
         
-        # Get device data first to check if it exists and has a patient assigned
-        device_ref = get_ref(f"iotData/{monitor_id}")
-        device_data = device_ref.get()
+        # Get device info first to check if it exists and has a patient assigned
+        monitor_device_info = mirror.device_info(monitor_id)
         
-        if not device_data:
+        if monitor_device_info is None:
             raise HTTPException(status_code=404, detail=f"Monitor {monitor_id} not found")
         
         # Get monitor's room information
-        monitor_device_info = device_data.get("deviceInfo", {})
         monitor_room_id = monitor_device_info.get("roomId")
         
         logger.info(f"Monitor {monitor_id} is located in room: {monitor_room_id}")
@@ -415,90 +471,22 @@ async def detect_anomaly(monitor_id: str, background_tasks: BackgroundTasks = No
         if not current_patient_id:
             raise HTTPException(status_code=400, detail=f"No patient assigned to monitor {monitor_id}")
         
-        # Get vitals for the current patient
-        vitals_ref = get_ref(f"iotData/{monitor_id}/vitals/{current_patient_id}")
-        patient_vitals = vitals_ref.get() or {}
-        
-        if not patient_vitals:
-            raise HTTPException(status_code=404, detail=f"No vitals data found for patient {current_patient_id} on monitor {monitor_id}")
-        
         # Get the most recent reading for this patient
-        latest_timestamp = sorted(patient_vitals.keys())[-1]
-        latest_vitals = patient_vitals[latest_timestamp]
+        latest_timestamp, latest_vitals = mirror.latest_vitals(monitor_id, current_patient_id)
         
-        # Automatically find environmental sensor in the same room
-        env_data = None
-        env_sensor_id = None
+        if not latest_vitals:
+            raise HTTPException(status_code=404, detail=f"No vitals data found for patient {current_patient_id} on monitor {monitor_id}")
         
-        if monitor_room_id:
-            try:
-                logger.info(f"🔍 Searching for environmental sensor in room {monitor_room_id}")
-                
-                # Get all IoT devices to find environmental sensor in the same room
-                iot_data_ref = get_ref("iotData")
-                all_devices = iot_data_ref.get() or {}
-                
-                logger.info(f"📋 Total devices found: {len(all_devices)}")
-                
-                # Debug: Log all devices and their room assignments
-                for device_id, device_info in all_devices.items():
-                    device_details = device_info.get("deviceInfo", {})
-                    device_type = device_details.get("type")
-                    device_room_id = device_details.get("roomId")
-                    
-                    logger.debug(f"  Device {device_id}: type={device_type}, roomId={device_room_id}")
-                    
-                    # Check if this is an environmental sensor in the same room
-                    if device_type == "environmental_sensor":
-                        logger.info(f"🌡️ Found environmental sensor {device_id} in room {device_room_id}")
-                        logger.debug(f"🔍 Device structure keys: {list(device_info.keys())}")
-                        
-                        if device_room_id == monitor_room_id:
-                            env_sensor_id = device_id
-                            logger.info(f"✅ Found matching environmental sensor {env_sensor_id} in room {monitor_room_id}")
-                            
-                            # Get the most recent environmental data 
-                            env_vitals = device_info.get("vitals", {})
-                            logger.info(f"🔍 Environmental vitals found: {bool(env_vitals)}")
-                            if env_vitals:
-                                logger.info(f"🔍 Number of vitals timestamps: {len(env_vitals)}")
-                                latest_env_timestamp = sorted(env_vitals.keys())[-1]
-                                env_data = env_vitals[latest_env_timestamp]
-                                logger.info(f"📊 Retrieved environmental data from timestamp: {latest_env_timestamp}")
-                                logger.info(f"📊 Environmental data keys: {list(env_data.keys())}")
-                            else:
-                                logger.warning(f"⚠️ Environmental sensor {env_sensor_id} has no data")
-                                logger.warning(f"⚠️ Device info structure: {list(device_info.keys())}")
-                            break
-                
-                if not env_sensor_id:
-                    logger.warning(f"⚠️ No environmental sensor found in room {monitor_room_id}")
-                    logger.info(f"🔍 Available environmental sensors:")
-                    for device_id, device_info in all_devices.items():
-                        device_details = device_info.get("deviceInfo", {})
-                        if device_details.get("type") == "environmental_sensor":
-                            logger.info(f"  - {device_id} in room {device_details.get('roomId', 'NO_ROOM')}")
-                    
-                    # Fallback: Try to find any environmental sensor if exact room match fails
-                    logger.info(f"🔄 Attempting fallback - using any available environmental sensor")
-                    for device_id, device_info in all_devices.items():
-                        device_details = device_info.get("deviceInfo", {})
-                        if device_details.get("type") == "environmental_sensor":
-                            env_vitals = device_info.get("vitals", {})
-                            if env_vitals:
-                                env_sensor_id = device_id
-                                latest_env_timestamp = sorted(env_vitals.keys())[-1]
-                                env_data = env_vitals[latest_env_timestamp]
-                                logger.info(f"🔄 Using fallback environmental sensor {env_sensor_id} (not in same room)")
-                                logger.info(f"📊 Fallback environmental data keys: {list(env_data.keys())}")
-                                break
-                            else:
-                                logger.warning(f"⚠️ Environmental sensor {device_id} has no vitals data")
-                    
-            except Exception as e:
-                logger.error(f"❌ Error retrieving environmental data for room {monitor_room_id}: {e}")
-        else:
-            logger.warning(f"⚠️ Monitor {monitor_id} has no room information")
+        # Newest environmental reading in the same room, kept per room by the iotData mirror
+        env_sensor_id, env_data = None, None
+        try:
+            env_sensor_id, env_data = find_room_environment(monitor_room_id)
+            if env_data:
+                logger.info(f"📊 Using environmental data from sensor {env_sensor_id} for room {monitor_room_id}")
+            else:
+                logger.warning(f"⚠️ No environmental data available for room {monitor_room_id}")
+        except Exception as e:
+            logger.error(f"❌ Error retrieving environmental data for room {monitor_room_id}: {e}")
         
         # Perform anomaly detection with optional environmental data
         anomaly_result = detect_anomaly_with_model(
@@ -513,6 +501,7 @@ async def detect_anomaly(monitor_id: str, background_tasks: BackgroundTasks = No
         anomaly_result["room_id"] = monitor_room_id
         anomaly_result["env_sensor_id"] = env_sensor_id
         anomaly_result["env_data_included"] = env_data is not None
+        anomaly_result["trend_analysis"] = trends.features(current_patient_id)
         
         if env_data:
             logger.info(f"✅ Anomaly detection completed with environmental data from sensor {env_sensor_id}")
@@ -530,37 +519,156 @@ async def detect_anomaly(monitor_id: str, background_tasks: BackgroundTasks = No
         logger.error(f"Error in anomaly detection: {e}")
         raise HTTPException(status_code=500, detail=f"Anomaly detection failed: {str(e)}")
 
+class DetectBatchRequest(BaseModel):
+    monitor_ids: Union[List[str], str] = "all"
+
+@router.post("/detect:batch")
+def detect_anomalies_for_monitors(request: DetectBatchRequest, background_tasks: BackgroundTasks):
+    """
+    Detect anomalies for many monitors in one model call
+    Pass monitor_ids as a list, or "all" for every monitor with a patient assigned;
+    results are saved with one multi-path update
+    """
+    try:
+        if isinstance(request.monitor_ids, str):
+            if request.monitor_ids != "all":
+                raise HTTPException(status_code=400, detail='monitor_ids must be a list of IDs or "all"')
+            monitor_ids = [
+                monitor_id for monitor_id in mirror.devices_of_type("vitals_monitor")
+                if (mirror.device_info(monitor_id) or {}).get("currentPatientId")
+            ]
+        else:
+            monitor_ids = list(dict.fromkeys(request.monitor_ids))
+        
+        errors = {}
+        rows = []
+        contexts = []
+        room_environment = {}
+        
+        for monitor_id in monitor_ids:
+            monitor_device_info = mirror.device_info(monitor_id)
+            if monitor_device_info is None:
+                errors[monitor_id] = {"status_code": 404, "error": f"Monitor {monitor_id} not found"}
+                continue
+            
+            current_patient_id = monitor_device_info.get("currentPatientId")
+            if not current_patient_id:
+                errors[monitor_id] = {"status_code": 400, "error": f"No patient assigned to monitor {monitor_id}"}
+                continue
+            
+            latest_timestamp, latest_vitals = mirror.latest_vitals(monitor_id, current_patient_id)
+            if not latest_vitals:
+                errors[monitor_id] = {"status_code": 404, "error": f"No vitals data found for patient {current_patient_id} on monitor {monitor_id}"}
+                continue
+            
+            # Environmental reading looked up once per room
+            monitor_room_id = monitor_device_info.get("roomId")
+            if monitor_room_id not in room_environment:
+                room_environment[monitor_room_id] = find_room_environment(monitor_room_id)
+            env_sensor_id, env_data = room_environment[monitor_room_id]
+            
+            rows.append((latest_vitals, monitor_id, env_data))
+            contexts.append({
+                "patient_id": current_patient_id,
+                "vitals_timestamp": latest_timestamp,
+                "room_id": monitor_room_id,
+                "env_sensor_id": env_sensor_id,
+                "env_data_included": env_data is not None
+            })
+        
+        anomaly_results = detect_anomalies_batch(rows)
+        for anomaly_result, context in zip(anomaly_results, contexts):
+            anomaly_result.update(context)
+            anomaly_result["trend_analysis"] = trends.features(context["patient_id"])
+        
+        # Save results in background
+        background_tasks.add_task(save_anomaly_logs, anomaly_results)
+        
+        results = {anomaly_result["device_id"]: anomaly_result for anomaly_result in anomaly_results}
+        return {
+            "scored": len(anomaly_results),
+            "anomalies": sum(1 for anomaly_result in anomaly_results if anomaly_result["is_anomaly"]),
+            "results": results,
+            "errors": errors
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch anomaly detection: {e}")
+        raise HTTPException(status_code=500, detail=f"Anomaly detection failed: {str(e)}")
+
+@router.get("/statistics")
+def get_anomaly_statistics(hours: int = 24):
+    """
+    Get anomaly detection statistics
+    Summed from the hourly anomalyStats counters, so the window is counted in whole hours
+    """
+    try:
+        total_readings = 0
+        total_anomalies = 0
+        severity_counts = {severity: 0 for severity in SEVERITY_LEVELS}
+        device_stats = {}
+        
+        cutoff_bucket = stats_bucket(datetime.now() - timedelta(hours=hours))
+        
+        # One key-range query over the hour buckets in the window
+        buckets = get_ref(ANOMALY_STATS_ROOT, cached=False).order_by_key().start_at(cutoff_bucket).get() or {}
+        
+        for device_counters in buckets.values():
+            for device_id, counters in (device_counters or {}).items():
+                total_readings += counters.get("readings", 0)
+                total_anomalies += counters.get("anomalies", 0)
+                for severity in SEVERITY_LEVELS:
+                    severity_counts[severity] += counters.get(severity, 0)
+                device_stats[device_id] = device_stats.get(device_id, 0) + counters.get("anomalies", 0)
+        
+        anomaly_rate = (total_anomalies / total_readings * 100) if total_readings > 0 else 0
+        
+        return {
+            "time_period_hours": hours,
+            "total_readings": total_readings,
+            "total_anomalies": total_anomalies,
+            "anomaly_rate_percent": round(anomaly_rate, 2),
+            "severity_distribution": severity_counts,
+            "device_anomaly_counts": device_stats,
+            "engine_status": {
+                "model_loaded": anomaly_models.get() is not None,
+                "model_status": "Available" if anomaly_models.get() is not None else "Not loaded",
+                "model_version": anomaly_models.version()
+            }
+        }
+    
+    except Exception as e:
+        logger.error(f"Error getting anomaly statistics: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get statistics: {str(e)}")
+
 @router.get("/{device_id}")
-def get_device_anomalies(device_id: str, hours: int = 24):
+def get_device_anomalies(device_id: str, hours: int = 24, limit: Optional[int] = None,
+                         before: Optional[str] = None, after: Optional[str] = None):
     """
     Get anomaly history for a specific device
+    Pass limit (and before/after cursors) to page through it newest first
     """
     try:
         anomalies_ref = get_ref(f"anomalies/{device_id}")
-        anomalies_data = anomalies_ref.get() or {}
         
-        # Filter by time if needed
-        if hours < 24 * 30:  # Only filter if less than 30 days
+        if limit is not None or before is not None or after is not None:
+            since = datetime.now() - timedelta(hours=hours) if hours < 24 * 30 else None
+            page, next_cursor = paginate(anomalies_ref, limit or 50, before=before, after=after, since=since)
+            return {
+                "deviceId": device_id,
+                "anomalies": dict(page),
+                "count": len(page),
+                "next_cursor": next_cursor
+            }
+        
+        # Only fetch the requested window unless it spans 30 days or more
+        if hours < 24 * 30:
             cutoff_time = datetime.now() - timedelta(hours=hours)
-            filtered_anomalies = {}
-            
-            for timestamp, data in anomalies_data.items():
-                try:
-                    # Parse timestamp
-                    ts_clean = timestamp.replace('-', ':')
-                    if '.' in ts_clean:
-                        ts_clean = ts_clean.split('.')[0]
-                    data_time = datetime.fromisoformat(ts_clean)
-                    
-                    if data_time >= cutoff_time:
-                        filtered_anomalies[timestamp] = data
-                except Exception:
-                    
-                    filtered_anomalies[timestamp] = data
-            
-            return filtered_anomalies
+            return read_window(anomalies_ref, cutoff_time)
         
-        return anomalies_data
+        return anomalies_ref.get() or {}
     
     except Exception as e:
         logger.error(f"Error getting anomalies for {device_id}: {e}")
@@ -572,26 +680,15 @@ def get_all_anomalies(hours: int = 24, severity_filter: Optional[str] = None):
     Get all anomalies across all devices
     """
     try:
-        anomalies_ref = get_ref("anomalies")
-        all_anomalies_data = anomalies_ref.get() or {}
-        
         result = []
         cutoff_time = datetime.now() - timedelta(hours=hours)
         
-        for device_id, device_anomalies in all_anomalies_data.items():
+        # Device IDs only, then one key-range query per device for the window
+        device_ids = get_ref("anomalies").get(shallow=True) or {}
+        
+        for device_id in device_ids:
+            device_anomalies = read_window(get_ref(f"anomalies/{device_id}"), cutoff_time)
             for timestamp, anomaly_data in device_anomalies.items():
-                # Time filter
-                try:
-                    ts_clean = timestamp.replace('-', ':')
-                    if '.' in ts_clean:
-                        ts_clean = ts_clean.split('.')[0]
-                    data_time = datetime.fromisoformat(ts_clean)
-                    
-                    if data_time < cutoff_time:
-                        continue
-                except Exception:
-                    pass  # Include if timestamp parsing fails
-                
                 # Severity filter
                 if severity_filter and anomaly_data.get("severity_level") != severity_filter.upper():
                     continue
@@ -615,16 +712,11 @@ def get_active_alerts():
     Get all active (unresolved) anomaly alerts
     """
     try:
-        iot_data_ref = get_ref("iotData")
-        all_devices = iot_data_ref.get() or {}
-        
         active_alerts = []
         
-        for device_id, device_data in all_devices.items():
-            alerts = device_data.get("alerts", {})
-            for alert_id, alert in alerts.items():
-                if not alert.get("resolved", False):
-                    active_alerts.append(alert)
+        for device_id, alerts in mirror.unresolved_alerts().items():
+            # Include the alert key so clients can resolve it
+            active_alerts.extend({"id": alert_id, **alert} for alert_id, alert in alerts.items())
         
         # Sort by severity and timestamp
         severity_order = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
@@ -648,15 +740,11 @@ def resolve_alert(device_id: str, alert_timestamp: str):
     Mark an alert as resolved
     """
     try:
-        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_timestamp}")
-        alert_data = alert_ref.get()
-        
-        if not alert_data:
+        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_timestamp}", cached=False)
+        if not alert_ref.get(shallow=True):
             raise HTTPException(status_code=404, detail="Alert not found")
         
-        alert_data["resolved"] = True
-        alert_data["resolved_at"] = datetime.now().isoformat()
-        alert_ref.set(alert_data)
+        alert_ref.update({"resolved": True, "resolved_at": datetime.now().isoformat()})
         
         return {"message": "Alert resolved successfully"}
     
@@ -665,102 +753,45 @@ def resolve_alert(device_id: str, alert_timestamp: str):
         raise HTTPException(status_code=500, detail=f"Failed to resolve alert: {str(e)}")
 
 @router.post("/train")
-async def retrain_models(background_tasks: BackgroundTasks):
+def retrain_models(hours: int = RETRAIN_LOOKBACK_HOURS, register: bool = True):
     """
-    Retrain anomaly detection models with recent data
+    Retrain the anomaly model on stored non-anomalous readings from the last `hours`
+    Runs in the background; the new version is registered only if it passes the
+    holdout evaluation (register=false evaluates without registering)
     """
     try:
-        def train_models_task():
-            # Get recent data from all devices
-            iot_data_ref = get_ref("iotData")
-            all_devices = iot_data_ref.get() or {}
-            
-            training_data = []
-            
-            for device_id, device_data in all_devices.items():
-                vitals = device_data.get("vitals", {})
-                for timestamp, vital_data in vitals.items():
-                    # Only use non-anomalous data for training
-                    if isinstance(vital_data, dict):
-                        training_data.append(vital_data)
-            
-            if len(training_data) >= 50:  # Minimum training data
-                logger.info(f"Training data collected: {len(training_data)} samples")
-                # Note: Model retraining would require running the training script manually
-                logger.info("To retrain the model, run the train_anomaly.py script with new data")
-            else:
-                logger.warning(f"Insufficient training data: {len(training_data)} samples")
-        
-        background_tasks.add_task(train_models_task)
-        
-        return {"message": "Model retraining task queued (manual script execution required)"}
-    
+        job = anomaly_retrainer.start(hours=hours, register=register)
+        return {"message": "Model retraining job started", "job_id": job["job_id"],
+                "status_url": f"/anomalies/train/{job['job_id']}"}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error starting model retraining: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start retraining: {str(e)}")
 
-@router.get("/statistics")
-def get_anomaly_statistics(hours: int = 24):
+@router.get("/train/jobs")
+def get_training_jobs(limit: int = 20):
     """
-    Get anomaly detection statistics
+    Recent retraining jobs, newest first
     """
     try:
-        # Get all anomalies for the time period
-        anomalies_ref = get_ref("anomalies")
-        all_anomalies_data = anomalies_ref.get() or {}
-        
-        total_readings = 0
-        total_anomalies = 0
-        severity_counts = {"CRITICAL": 0, "HIGH": 0, "MEDIUM": 0, "LOW": 0}
-        device_stats = {}
-        
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        
-        for device_id, device_anomalies in all_anomalies_data.items():
-            device_anomaly_count = 0
-            
-            for timestamp, anomaly_data in device_anomalies.items():
-                # Time filter
-                try:
-                    ts_clean = timestamp.replace('-', ':')
-                    if '.' in ts_clean:
-                        ts_clean = ts_clean.split('.')[0]
-                    data_time = datetime.fromisoformat(ts_clean)
-                    
-                    if data_time < cutoff_time:
-                        continue
-                except Exception:
-                    pass
-                
-                total_readings += 1
-                
-                if anomaly_data.get("is_anomaly", False):
-                    total_anomalies += 1
-                    device_anomaly_count += 1
-                    
-                    severity = anomaly_data.get("severity_level", "LOW")
-                    if severity in severity_counts:
-                        severity_counts[severity] += 1
-            
-            if device_id not in device_stats:
-                device_stats[device_id] = 0
-            device_stats[device_id] += device_anomaly_count
-        
-        anomaly_rate = (total_anomalies / total_readings * 100) if total_readings > 0 else 0
-        
-        return {
-            "time_period_hours": hours,
-            "total_readings": total_readings,
-            "total_anomalies": total_anomalies,
-            "anomaly_rate_percent": round(anomaly_rate, 2),
-            "severity_distribution": severity_counts,
-            "device_anomaly_counts": device_stats,
-            "engine_status": {
-                "model_loaded": anomaly_model_data is not None,
-                "model_status": "Available" if anomaly_model_data else "Not loaded"
-            }
-        }
-    
+        return {"jobs": anomaly_retrainer.jobs(limit)}
     except Exception as e:
-        logger.error(f"Error getting anomaly statistics: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to get statistics: {str(e)}")
+        logger.error(f"Error getting retraining jobs: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get retraining jobs: {str(e)}")
+
+@router.get("/train/{job_id}")
+def get_training_job(job_id: str):
+    """
+    Stage, progress, evaluation metrics and registered version of a retraining job
+    """
+    try:
+        job = anomaly_retrainer.job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Retraining job {job_id} not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting retraining job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get retraining job: {str(e)}")
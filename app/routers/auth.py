@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from datetime import timedelta, datetime
 from typing import Dict, Any
 import uuid
@@ -7,7 +8,7 @@ import logging
 
 from app.models.auth_models import UserSignupRequest, UserLoginRequest, TokenResponse, UserResponse, UserRole
 from app.auth_utils import verify_password, get_password_hash, create_access_token, verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.firebase_config import get_ref
+from app.async_db import get_async_ref
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -58,8 +59,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             )
         
         # Try to get user from Firebase first
-        users_ref = get_ref('users')
-        users_data = users_ref.get() or {}
+        users_ref = get_async_ref('users')
+        users_data = await users_ref.get() or {}
         
         for uid, user_data in users_data.items():
             if uid == user_id:
@@ -86,8 +87,8 @@ async def signup(user_data: UserSignupRequest):
     """Register a new user"""
     try:
         # Check if user already exists
-        users_ref = get_ref('users')
-        users_data = users_ref.get() or {}
+        users_ref = get_async_ref('users', cached=False)
+        users_data = await users_ref.get() or {}
         
         # Check in Firebase users
         for uid, existing_user in users_data.items():
@@ -107,7 +108,8 @@ async def signup(user_data: UserSignupRequest):
         
         # Create new user
         user_id = str(uuid.uuid4())
-        hashed_password = get_password_hash(user_data.password)
+        # Password hashing is CPU-bound; keep it off the event loop
+        hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
         
         new_user = {
             "email": user_data.email,
@@ -122,8 +124,8 @@ async def signup(user_data: UserSignupRequest):
         }
         
         # Save to Firebase
-        user_ref = get_ref(f'users/{user_id}')
-        user_ref.set(new_user)
+        user_ref = get_async_ref(f'users/{user_id}')
+        await user_ref.set(new_user)
         
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -164,8 +166,8 @@ async def login(login_data: UserLoginRequest):
     """Authenticate user and return access token"""
     try:
         # First check Firebase users
-        users_ref = get_ref('users')
-        users_data = users_ref.get() or {}
+        users_ref = get_async_ref('users')
+        users_data = await users_ref.get() or {}
         
         user_found = None
         user_id = None
@@ -173,7 +175,7 @@ async def login(login_data: UserLoginRequest):
         # Check Firebase users
         for uid, user_data in users_data.items():
             if user_data.get('email') == login_data.email:
-                if verify_password(login_data.password, user_data.get('password_hash', '')):
+                if await run_in_threadpool(verify_password, login_data.password, user_data.get('password_hash', '')):
                     user_found = user_data
                     user_id = uid
                     break
@@ -182,7 +184,7 @@ async def login(login_data: UserLoginRequest):
         if not user_found:
             for user in MOCK_USERS:
                 if user['email'] == login_data.email:
-                    if verify_password(login_data.password, user['password_hash']):
+                    if await run_in_threadpool(verify_password, login_data.password, user['password_hash']):
                         user_found = user
                         user_id = user['id']
                         break
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from app.firebase_config import get_ref
+from app.async_db import get_async_ref
 import logging
 
 # Configure logging
@@ -24,8 +24,8 @@ class BedData(BaseModel):
 async def get_all_beds():
     """Get all beds"""
     try:
-        ref = get_ref("beds")
-        beds = ref.get() or {}
+        ref = get_async_ref("beds")
+        beds = await ref.get() or {}
         return beds
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch beds: {str(e)}")
@@ -34,8 +34,8 @@ async def get_all_beds():
 async def get_bed(bed_id: str):
     """Get a specific bed by ID"""
     try:
-        ref = get_ref(f"beds/{bed_id}")
-        bed = ref.get()
+        ref = get_async_ref(f"beds/{bed_id}")
+        bed = await ref.get()
         
         if not bed:
             raise HTTPException(status_code=404, detail="Bed not found")
@@ -50,8 +50,8 @@ async def get_bed(bed_id: str):
 async def get_room_beds(room_id: str):
     """Get all beds in a specific room"""
     try:
-        ref = get_ref("beds")
-        all_beds = ref.get() or {}
+        ref = get_async_ref("beds")
+        all_beds = await ref.get() or {}
         
         room_beds = {bed_id: bed_data for bed_id, bed_data in all_beds.items() 
                     if bed_data.get('roomId') == room_id}
@@ -64,8 +64,8 @@ async def get_room_beds(room_id: str):
 async def get_available_beds_in_room(room_id: str):
     """Get all available beds in a specific room"""
     try:
-        ref = get_ref("beds")
-        all_beds = ref.get() or {}
+        ref = get_async_ref("beds")
+        all_beds = await ref.get() or {}
         
         available_beds = {bed_id: bed_data for bed_id, bed_data in all_beds.items() 
                          if (bed_data.get('roomId') == room_id and 
@@ -80,8 +80,8 @@ async def assign_patient_to_bed(bed_id: str, patient_id: str):
     """Assign a patient to a specific bed"""
     try:
         # Check if bed exists and is available
-        bed_ref = get_ref(f"beds/{bed_id}")
-        bed_data = bed_ref.get()
+        bed_ref = get_async_ref(f"beds/{bed_id}", cached=False)
+        bed_data = await bed_ref.get()
         
         if not bed_data:
             raise HTTPException(status_code=404, detail="Bed not found")
@@ -90,33 +90,28 @@ async def assign_patient_to_bed(bed_id: str, patient_id: str):
             raise HTTPException(status_code=400, detail="Bed is not available")
             
         # Check if patient exists
-        patient_ref = get_ref(f"patients/{patient_id}")
-        patient_data = patient_ref.get()
-        
-        if not patient_data:
+        patient_ref = get_async_ref(f"patients/{patient_id}", cached=False)
+        if not await patient_ref.get(shallow=True):
             raise HTTPException(status_code=404, detail="Patient not found")
             
         # Check if patient is already assigned to another bed
-        current_bed_id = patient_data.get('personalInfo', {}).get('bedId')
+        personal_info = await patient_ref.child('personalInfo').get() or {}
+        current_bed_id = personal_info.get('bedId')
         if current_bed_id and current_bed_id != bed_id:
             # Discharge from current bed first
             await discharge_patient_from_bed(current_bed_id, patient_id)
         
         # Assign patient to bed
-        bed_data['patientId'] = patient_id
-        bed_data['status'] = 'occupied'
-        bed_ref.set(bed_data)
+        await bed_ref.update({'patientId': patient_id, 'status': 'occupied'})
         
         # Update patient's bed assignment
-        patient_data['personalInfo']['bedId'] = bed_id
-        patient_data['personalInfo']['roomId'] = bed_data['roomId']
-        patient_ref.set(patient_data)
+        await patient_ref.child('personalInfo').update({'bedId': bed_id, 'roomId': bed_data['roomId']})
         
         # Update room status to occupied if it wasn't already
-        room_ref = get_ref(f"rooms/{bed_data['roomId']}")
-        room_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{bed_data['roomId']}", cached=False)
+        room_data = await room_ref.get()
         if room_data and room_data.get('status') != 'occupied':
-            room_ref.update({'status': 'occupied'})
+            await room_ref.update({'status': 'occupied'})
         
         logger.info(f"Patient {patient_id} assigned to bed {bed_id} in room {bed_data['roomId']}")
         return {"message": f"Patient {patient_id} assigned to bed {bed_id} successfully"}
@@ -132,8 +127,8 @@ async def discharge_patient_from_bed(bed_id: str, patient_id: str):
     """Discharge a patient from a specific bed"""
     try:
         # Check if bed exists
-        bed_ref = get_ref(f"beds/{bed_id}")
-        bed_data = bed_ref.get()
+        bed_ref = get_async_ref(f"beds/{bed_id}", cached=False)
+        bed_data = await bed_ref.get()
         
         if not bed_data:
             raise HTTPException(status_code=404, detail="Bed not found")
@@ -143,18 +138,13 @@ async def discharge_patient_from_bed(bed_id: str, patient_id: str):
             raise HTTPException(status_code=400, detail="Patient is not assigned to this bed")
             
         # Update bed status
-        bed_data['patientId'] = None
-        bed_data['status'] = 'available'
-        bed_ref.set(bed_data)
+        await bed_ref.update({'patientId': None, 'status': 'available'})
         
         # Update patient record
-        patient_ref = get_ref(f"patients/{patient_id}")
-        patient_data = patient_ref.get()
+        patient_ref = get_async_ref(f"patients/{patient_id}", cached=False)
         
-        if patient_data:
-            patient_data['personalInfo']['bedId'] = None
-            patient_data['personalInfo']['roomId'] = None
-            patient_ref.set(patient_data)
+        if await patient_ref.get(shallow=True):
+            await patient_ref.child('personalInfo').update({'bedId': None, 'roomId': None})
         
         # Check if room should be marked as available
         room_id = bed_data['roomId']
@@ -174,8 +164,8 @@ async def get_patient_bed(patient_id: str):
     """Get the bed assigned to a specific patient"""
     try:
         # Get patient data
-        patient_ref = get_ref(f"patients/{patient_id}")
-        patient_data = patient_ref.get()
+        patient_ref = get_async_ref(f"patients/{patient_id}")
+        patient_data = await patient_ref.get()
         
         if not patient_data:
             raise HTTPException(status_code=404, detail="Patient not found")
@@ -185,8 +175,8 @@ async def get_patient_bed(patient_id: str):
             return {"message": "Patient is not assigned to any bed", "bed": None}
             
         # Get bed data
-        bed_ref = get_ref(f"beds/{bed_id}")
-        bed_data = bed_ref.get()
+        bed_ref = get_async_ref(f"beds/{bed_id}")
+        bed_data = await bed_ref.get()
         
         return {"bed_id": bed_id, "bed_data": bed_data}
         
@@ -200,8 +190,8 @@ async def update_room_status_based_on_beds(room_id: str):
     """Update room status based on bed occupancy"""
     try:
         # Get all beds in the room
-        beds_ref = get_ref("beds")
-        all_beds = beds_ref.get() or {}
+        beds_ref = get_async_ref("beds", cached=False)
+        all_beds = await beds_ref.get() or {}
         
         room_beds = [bed for bed in all_beds.values() if bed.get('roomId') == room_id]
         
@@ -209,13 +199,13 @@ async def update_room_status_based_on_beds(room_id: str):
         occupied_beds = [bed for bed in room_beds if bed.get('status') == 'occupied']
         
         # Update room status
-        room_ref = get_ref(f"rooms/{room_id}")
-        room_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{room_id}", cached=False)
+        room_data = await room_ref.get()
         
         if room_data:
             new_status = 'occupied' if occupied_beds else 'available'
             if room_data.get('status') != new_status:
-                room_ref.update({'status': new_status})
+                await room_ref.update({'status': new_status})
                 
     except Exception as e:
         logger.error(f"Error updating room status: {str(e)}")
@@ -223,8 +213,8 @@ async def update_room_status_based_on_beds(room_id: str):
 async def find_available_bed_in_room(room_id: str, bed_type: Optional[str] = None) -> Optional[str]:
     """Find an available bed in a room, optionally filtered by type"""
     try:
-        beds_ref = get_ref("beds")
-        all_beds = beds_ref.get() or {}
+        beds_ref = get_async_ref("beds")
+        all_beds = await beds_ref.get() or {}
         
         for bed_id, bed_data in all_beds.items():
             if (bed_data.get('roomId') == room_id and 
@@ -242,8 +232,8 @@ async def find_available_bed_in_room(room_id: str, bed_type: Optional[str] = Non
 async def get_bed_occupancy_stats():
     """Get bed occupancy statistics"""
     try:
-        beds_ref = get_ref("beds")
-        all_beds = beds_ref.get() or {}
+        beds_ref = get_async_ref("beds")
+        all_beds = await beds_ref.get() or {}
         
         stats = {
             'total': len(all_beds),
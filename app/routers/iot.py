@@ -1,22 +1,27 @@
 # app/routers/iot.py
 from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from app.anomaly_stream import anomaly_stream
 from app.firebase_config import get_ref
-from datetime import datetime
-import re
+from app.iot_mirror import mirror
+from app.timekeys import encode_key, latest_key, paginate, paginate_items, read_last, read_window
+from app.vitals_ingest import ENV_REQUIRED_FIELDS, VitalsReading, ingest_readings, summarize
+from app.vitals_store import write_vitals
+from app.vitals_trends import trends
+from datetime import datetime, timedelta
+from typing import List, Optional
 import logging
+import os
 
 router = APIRouter(prefix="/iotData", tags=["IoT Sensor Data"])
 logger = logging.getLogger(__name__)
 
+# Largest number of readings accepted by POST /iotData/vitals:batch
+VITALS_BATCH_MAX_ITEMS = int(os.getenv("VITALS_BATCH_MAX_ITEMS", "500"))
 
+class VitalsBatch(BaseModel):
+    readings: List[VitalsReading]
 
-def sanitize_timestamp(timestamp):
-        # Convert ISO timestamp to a Firebase-safe string
-        # Replace colons, periods, and other invalid characters
-        sanitized = re.sub(r'[.:]', '-', timestamp)
-        # Remove any other invalid characters for Firebase paths
-        sanitized = re.sub(r'[#\$\[\]]', '', sanitized)
-        return sanitized
 
 @router.get("/")
 def get_all_devices():
@@ -68,17 +73,17 @@ def get_env_sensor_by_id(sensor_id: str):
 def get_env_sensor_for_room(room_id: str):
     """Return environmental sensor data for a specific room."""
     try:
-        data = get_ref("iotData").get() or {}
-        
-        # Find environmental sensor for the specified room
-        for device_id, device_data in data.items():
-            device_info = device_data.get("deviceInfo", {})
-            if (device_info.get("type") == "environmental_sensor" and 
-                device_info.get("roomId") == room_id):
+        # Find environmental sensor for the specified room via the room index
+        # instead of reading every device under iotData
+        for device_id in mirror.devices_in_room(room_id, device_type="environmental_sensor"):
+            device_data = get_ref(f"iotData/{device_id}").get()
+            if device_data:
+                timestamp, reading = mirror.latest_vitals(device_id)
                 return {
                     "sensorId": device_id,
                     "roomId": room_id,
-                    **device_data
+                    **device_data,
+                    "latestReading": {"timestamp": timestamp, "data": reading} if reading else None
                 }
         
         raise HTTPException(status_code=404, detail=f"No environmental sensor found for room {room_id}")
@@ -93,27 +98,25 @@ def get_env_sensor_for_room(room_id: str):
 def get_latest_env_vitals(sensor_id: str):
     """Return the most recent environmental readings for a sensor."""
     try:
-        sensor_data = get_ref(f"iotData/{sensor_id}").get()
+        device_info = get_ref(f"iotData/{sensor_id}/deviceInfo").get()
         
-        if not sensor_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Environmental sensor not found")
         
         # Verify it's an environmental sensor
-        if sensor_data.get("deviceInfo", {}).get("type") != "environmental_sensor":
+        if device_info.get("type") != "environmental_sensor":
             raise HTTPException(status_code=400, detail="Device is not an environmental sensor")
         
-        # Get vitals (environmental readings)
-        vitals = sensor_data.get("vitals", {})
-        if not vitals:
+        # Read only the newest environmental reading
+        newest = read_last(get_ref(f"iotData/{sensor_id}/vitals"), 1)
+        if not newest:
             return {"message": "No environmental readings available"}
         
-        # Get the latest timestamp
-        latest_timestamp = max(vitals.keys())
-        latest_reading = vitals[latest_timestamp]
+        latest_timestamp, latest_reading = newest[0]
         
         return {
             "sensorId": sensor_id,
-            "roomId": sensor_data.get("deviceInfo", {}).get("roomId"),
+            "roomId": device_info.get("roomId"),
             "timestamp": latest_timestamp,
             "readings": latest_reading,
             "deviceStatus": latest_reading.get("deviceStatus", "unknown"),
@@ -128,37 +131,30 @@ def get_latest_env_vitals(sensor_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/env-sensors/{sensor_id}/vitals")
-def get_env_sensor_vitals_history(sensor_id: str, limit: int = 24):
-    """Return environmental readings history for a sensor (limited to recent readings)."""
+def get_env_sensor_vitals_history(sensor_id: str, limit: int = 24, before: Optional[str] = None, after: Optional[str] = None):
+    """Return environmental readings history for a sensor, newest first, paged with before/after cursors."""
     try:
-        sensor_data = get_ref(f"iotData/{sensor_id}").get()
+        device_info = get_ref(f"iotData/{sensor_id}/deviceInfo").get()
         
-        if not sensor_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Environmental sensor not found")
         
         # Verify it's an environmental sensor
-        if sensor_data.get("deviceInfo", {}).get("type") != "environmental_sensor":
+        if device_info.get("type") != "environmental_sensor":
             raise HTTPException(status_code=400, detail="Device is not an environmental sensor")
         
-        # Get vitals (environmental readings)
-        vitals = sensor_data.get("vitals", {})
-        if not vitals:
-            return {
-                "sensorId": sensor_id,
-                "roomId": sensor_data.get("deviceInfo", {}).get("roomId"),
-                "readings": [],
-                "count": 0
-            }
+        vitals_ref = get_ref(f"iotData/{sensor_id}/vitals")
         
-        # Sort timestamps and limit results
-        sorted_timestamps = sorted(vitals.keys(), reverse=True)
+        # Newest readings first, fetching only the requested page
+        next_cursor = None
         if limit > 0:
-            sorted_timestamps = sorted_timestamps[:limit]
+            newest, next_cursor = paginate(vitals_ref, limit, before=before, after=after)
+        else:
+            newest = list(reversed(list(read_window(vitals_ref).items())))
         
         # Build response with readings
         readings = []
-        for timestamp in sorted_timestamps:
-            reading_data = vitals[timestamp]
+        for timestamp, reading_data in newest:
             readings.append({
                 "timestamp": timestamp,
                 "temperature": reading_data.get("temperature"),
@@ -175,10 +171,10 @@ def get_env_sensor_vitals_history(sensor_id: str, limit: int = 24):
         
         return {
             "sensorId": sensor_id,
-            "roomId": sensor_data.get("deviceInfo", {}).get("roomId"),
+            "roomId": device_info.get("roomId"),
             "readings": readings,
             "count": len(readings),
-            "totalReadings": len(vitals)
+            "next_cursor": next_cursor
         }
         
     except HTTPException:
@@ -250,17 +246,15 @@ def post_env_sensor_vitals(sensor_id: str, data: dict):
     """Post new environmental readings for a sensor."""
     try:
         # Verify sensor exists and is environmental sensor
-        sensor_data = get_ref(f"iotData/{sensor_id}").get()
-        if not sensor_data:
+        sensor_info = mirror.device_info(sensor_id)
+        if not sensor_info:
             raise HTTPException(status_code=404, detail="Environmental sensor not found")
         
-        if sensor_data.get("deviceInfo", {}).get("type") != "environmental_sensor":
+        if sensor_info.get("type") != "environmental_sensor":
             raise HTTPException(status_code=400, detail="Device is not an environmental sensor")
         
         # Validate required environmental fields
-        required_fields = ["temperature", "humidity", "airQuality", "lightLevel", 
-                         "noiseLevel", "pressure", "co2Level"]
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in ENV_REQUIRED_FIELDS if field not in data]
         
         if missing_fields:
             raise HTTPException(
@@ -268,9 +262,9 @@ def post_env_sensor_vitals(sensor_id: str, data: dict):
                 detail=f"Missing required environmental fields: {', '.join(missing_fields)}"
             )
         
-        # Generate timestamp
-        timestamp = datetime.now().isoformat()
-        timestamp = sanitize_timestamp(timestamp)
+        # Generate sortable timestamp key
+        now = datetime.now()
+        timestamp = encode_key(now)
         
         # Add metadata if not provided
         environmental_data = {
@@ -278,18 +272,22 @@ def post_env_sensor_vitals(sensor_id: str, data: dict):
             "deviceStatus": data.get("deviceStatus", "online"),
             "batteryLevel": data.get("batteryLevel", 90),
             "signalStrength": data.get("signalStrength", 95),
-            "timestamp": timestamp
+            "timestamp": now.isoformat()
         }
         
         # Store environmental readings
         vitals_ref = get_ref(f"iotData/{sensor_id}/vitals/{timestamp}")
         vitals_ref.set(environmental_data)
         
+        # Becomes the room's latest environment for anomaly feature assembly
+        room_id = sensor_info.get("roomId")
+        mirror.record_env_reading(sensor_id, room_id, timestamp, environmental_data)
+        
         return {
             "message": f"Environmental readings saved for sensor {sensor_id}",
             "timestamp": timestamp,
             "sensorId": sensor_id,
-            "roomId": sensor_data.get("deviceInfo", {}).get("roomId")
+            "roomId": room_id
         }
         
     except HTTPException:
@@ -324,7 +322,7 @@ def get_env_sensors_summary():
             device_status = "offline"
             
             if vitals:
-                latest_timestamp = max(vitals.keys())
+                latest_timestamp = latest_key(vitals.keys())
                 latest_reading = vitals[latest_timestamp]
                 device_status = latest_reading.get("deviceStatus", "offline")
             
@@ -411,21 +409,20 @@ def get_device_data(device_id: str):
 @router.get("/{device_id}/vitals/latest")
 def get_latest_vitals(device_id: str):
     """Return the most recent vitals reading for current patient."""
-    device_data = get_ref(f"iotData/{device_id}").get()
-    if not device_data:
+    device_info = mirror.device_info(device_id)
+    if not device_info:
         return {}
     
-    current_patient_id = device_data.get("deviceInfo", {}).get("currentPatientId")
+    current_patient_id = device_info.get("currentPatientId")
     if not current_patient_id:
         return {}
     
     # Get vitals for current patient
-    vitals = get_ref(f"iotData/{device_id}/vitals/{current_patient_id}").get()
-    if not vitals:
+    latest_ts, latest_vitals = mirror.latest_vitals(device_id, current_patient_id)
+    if not latest_vitals:
         return {}
 
-    latest_ts = sorted(vitals.keys())[-1]
-    return {"timestamp": latest_ts, "data": vitals[latest_ts], "patientId": current_patient_id}
+    return {"timestamp": latest_ts, "data": latest_vitals, "patientId": current_patient_id}
 
 @router.get("/{device_id}/vitals/patient/{patient_id}")
 def get_patient_vitals(device_id: str, patient_id: str):
@@ -445,24 +442,26 @@ def get_patient_vitals(device_id: str, patient_id: str):
 def post_vitals(device_id: str, data: dict):
     """Post new vitals data for the currently assigned patient only"""
     try:
-        # Get device data to check current patient assignment
-        device_data = get_ref(f"iotData/{device_id}").get()
-        if not device_data:
+        # Get device info to check current patient assignment
+        device_info = get_ref(f"iotData/{device_id}/deviceInfo").get()
+        if not device_info:
             raise HTTPException(status_code=404, detail="Device not found")
         
         # Get currently assigned patient
-        current_patient_id = device_data.get("deviceInfo", {}).get("currentPatientId")
+        current_patient_id = device_info.get("currentPatientId")
         if not current_patient_id:
             raise HTTPException(status_code=400, detail="No patient assigned to this monitor. Cannot store vitals.")
         
-        # Generate timestamp
-        timestamp = datetime.now().isoformat()
-        timestamp = sanitize_timestamp(timestamp)
+        # Generate sortable timestamp key
+        timestamp = encode_key()
         
-        # Store vitals under current patient ID only
-        # Structure: vitals[patient_id][timestamp] = vital_record
-        vitals_ref = get_ref(f"iotData/{device_id}/vitals/{current_patient_id}/{timestamp}")
-        vitals_ref.set(data)
+        # Store vitals under current patient ID only: hour bucket, latestVitals pointer
+        # and (while enabled) the legacy vitals[patient_id][timestamp] map in one update
+        write_vitals(device_id, current_patient_id, timestamp, data)
+        
+        # Update the patient's rolling trends, then score the reading inline
+        trends.record(device_id, current_patient_id, timestamp, data)
+        anomaly_stream.submit(device_id, current_patient_id, timestamp, data)
         
         return {
             "message": f"Vitals saved for device {device_id}, patient {current_patient_id}",
@@ -476,20 +475,34 @@ def post_vitals(device_id: str, data: dict):
         logger.error(f"Error posting vitals: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/vitals:batch")
+def post_vitals_batch(batch: VitalsBatch):
+    """Store readings from many devices in one multi-path update, returning a status per reading"""
+    if len(batch.readings) > VITALS_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {VITALS_BATCH_MAX_ITEMS} readings per request")
+    
+    try:
+        results = ingest_readings(batch.readings)
+        anomaly_stream.submit_ingested(batch.readings, results)
+        return summarize(results)
+    
+    except Exception as e:
+        logger.error(f"Error posting vitals batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.put("/{device_id}/deviceInfo")
 def update_device_info(device_id: str, device_info: dict):
     """Update device information including room assignment"""
     try:
-        # Get existing device data
-        device_data = get_ref(f"iotData/{device_id}").get()
-        if not device_data:
+        # Get existing device info (not the device's vitals history)
+        if not get_ref(f"iotData/{device_id}/deviceInfo", cached=False).get():
             raise HTTPException(status_code=404, detail="Device not found")
         
-        # Update device info
-        device_data["deviceInfo"] = {**device_data.get("deviceInfo", {}), **device_info}
-        
-        # Save back to Firebase
-        get_ref(f"iotData/{device_id}").set(device_data)
+        # Update only the given deviceInfo fields; an empty body changes nothing
+        if device_info:
+            get_ref(f"iotData/{device_id}/deviceInfo").update(device_info)
+            for field, value in device_info.items():
+                mirror.record_write(f"iotData/{device_id}/deviceInfo/{field}", value)
         
         logger.info(f"Device {device_id} info updated")
         return {"message": "Device info updated successfully"}
@@ -504,19 +517,16 @@ def update_device_info(device_id: str, device_info: dict):
 def resolve_alert(device_id: str, alert_id: str, data: dict):
     """Resolve an alert for a device"""
     try:
-        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_id}")
-        alert_data = alert_ref.get()
-        
-        if not alert_data:
+        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_id}", cached=False)
+        if not alert_ref.get(shallow=True):
             raise HTTPException(status_code=404, detail="Alert not found")
         
         # Update alert with resolution data
-        alert_data["resolved"] = True
-        alert_data["resolvedBy"] = data.get("resolvedBy")
-        alert_data["resolvedAt"] = data.get("resolvedAt")
-        
-        # Save back to Firebase
-        alert_ref.set(alert_data)
+        alert_ref.update({
+            "resolved": True,
+            "resolvedBy": data.get("resolvedBy"),
+            "resolvedAt": data.get("resolvedAt")
+        })
         
         logger.info(f"Alert {alert_id} resolved for device {device_id}")
         return {"message": "Alert resolved successfully"}
@@ -529,17 +539,12 @@ def resolve_alert(device_id: str, alert_id: str, data: dict):
 def assign_alert(device_id: str, alert_id: str, data: dict):
     """Assign an alert to a staff member"""
     try:
-        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_id}")
-        alert_data = alert_ref.get()
-        
-        if not alert_data:
+        alert_ref = get_ref(f"iotData/{device_id}/alerts/{alert_id}", cached=False)
+        if not alert_ref.get(shallow=True):
             raise HTTPException(status_code=404, detail="Alert not found")
         
         # Update alert with assignment data
-        alert_data["assignedTo"] = data.get("assignedTo")
-        
-        # Save back to Firebase
-        alert_ref.set(alert_data)
+        alert_ref.update({"assignedTo": data.get("assignedTo")})
         
         logger.info(f"Alert {alert_id} assigned to {data.get('assignedTo')} for device {device_id}")
         return {"message": "Alert assigned successfully"}
@@ -556,15 +561,14 @@ def assign_patient_to_monitor(device_id: str, data: dict):
         if not patient_id:
             raise HTTPException(status_code=400, detail="Patient ID is required")
         
-        # Get device data
-        device_ref = get_ref(f"iotData/{device_id}")
-        device_data = device_ref.get()
+        # Get device info (not the device's vitals history)
+        device_info = get_ref(f"iotData/{device_id}/deviceInfo", cached=False).get()
         
-        if not device_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Device not found")
         
         # Check if device is a vitals monitor
-        if device_data.get("deviceInfo", {}).get("type") != "vitals_monitor":
+        if device_info.get("type") != "vitals_monitor":
             raise HTTPException(status_code=400, detail="Only vitals monitors can be assigned to patients")
         
         # Check if patient exists
@@ -575,7 +579,6 @@ def assign_patient_to_monitor(device_id: str, data: dict):
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Get device room and bed info
-        device_info = device_data.get("deviceInfo", {})
         device_room_id = device_info.get("roomId")
         device_bed_id = device_info.get("bedId")
         
@@ -596,26 +599,28 @@ def assign_patient_to_monitor(device_id: str, data: dict):
             )
         
         # Unassign patient from any other monitors
-        iot_ref = get_ref("iotData")
-        all_devices = iot_ref.get() or {}
-        
-        for other_device_id, other_device_data in all_devices.items():
-            if (other_device_id != device_id and 
-                other_device_data.get("deviceInfo", {}).get("currentPatientId") == patient_id):
-                # Remove patient from other device
-                other_device_data["deviceInfo"]["currentPatientId"] = None
-                get_ref(f"iotData/{other_device_id}").set(other_device_data)
-                logger.info(f"Removed patient {patient_id} from device {other_device_id}")
+        updates = {}
+        for other_device_id in mirror.devices_for_patient(patient_id):
+            if other_device_id == device_id:
+                continue
+            assigned_path = f"iotData/{other_device_id}/deviceInfo/currentPatientId"
+            if get_ref(assigned_path, cached=False).get() == patient_id:
+                updates[assigned_path] = None
+                logger.info(f"Removing patient {patient_id} from device {other_device_id}")
         
         # Assign patient to this monitor
-        device_data["deviceInfo"]["currentPatientId"] = patient_id
+        updates[f"iotData/{device_id}/deviceInfo/currentPatientId"] = patient_id
         
         # Clear all previous vitals since we only store current patient's vitals
         # New structure: vitals[patient_id][timestamp] = vital_record
-        device_data["vitals"] = {}
+        updates[f"iotData/{device_id}/vitals"] = None
+        updates[f"iotData/{device_id}/latestVitals"] = None
         
-        # Save device data
-        device_ref.set(device_data)
+        # Only these paths are written; the other monitors keep their readings, and alerts
+        # or deviceInfo fields changed meanwhile are not overwritten
+        get_ref("/").update(updates)
+        for path, value in updates.items():
+            mirror.record_write(path, value)
         
         logger.info(f"Patient {patient_id} assigned to monitor {device_id}")
         return {"message": f"Patient {patient_id} assigned to monitor {device_id} successfully"}
@@ -630,27 +635,27 @@ def assign_patient_to_monitor(device_id: str, data: dict):
 def unassign_patient_from_monitor(device_id: str):
     """Unassign/detach patient from a monitor device"""
     try:
-        # Get device data
-        device_ref = get_ref(f"iotData/{device_id}")
-        device_data = device_ref.get()
+        # Get device info (not the device's vitals history)
+        device_info = get_ref(f"iotData/{device_id}/deviceInfo", cached=False).get()
         
-        if not device_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Device not found")
         
         # Check if device has a patient assigned
-        current_patient_id = device_data.get("deviceInfo", {}).get("currentPatientId")
+        current_patient_id = device_info.get("currentPatientId")
         
         if not current_patient_id:
             raise HTTPException(status_code=400, detail="No patient is currently assigned to this monitor")
         
-        # Remove patient assignment
-        device_data["deviceInfo"]["currentPatientId"] = None
-        
-        # Clear all vitals since we don't store historical vitals
-        device_data["vitals"] = {}
-        
-        # Save device data
-        device_ref.set(device_data)
+        # Remove patient assignment and clear all vitals since we don't store historical vitals
+        updates = {
+            f"iotData/{device_id}/deviceInfo/currentPatientId": None,
+            f"iotData/{device_id}/vitals": None,
+            f"iotData/{device_id}/latestVitals": None
+        }
+        get_ref("/").update(updates)
+        for path, value in updates.items():
+            mirror.record_write(path, value)
         
         logger.info(f"Patient {current_patient_id} unassigned from monitor {device_id}")
         return {"message": f"Patient {current_patient_id} unassigned from monitor {device_id} successfully"}
@@ -662,60 +667,40 @@ def unassign_patient_from_monitor(device_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{device_id}/alerts/latest")
-def get_latest_alerts(device_id: str, limit: int = 10, include_resolved: bool = False):
-    """Get the latest alerts for a monitor device"""
+def get_latest_alerts(device_id: str, limit: int = 10, include_resolved: bool = False, hours: Optional[int] = None,
+                      before: Optional[str] = None, after: Optional[str] = None):
+    """Get the latest alerts for a monitor device, newest first, paged with before/after cursors"""
     try:
         # Check if device exists
-        device_ref = get_ref(f"iotData/{device_id}")
-        device_data = device_ref.get()
+        device_info = get_ref(f"iotData/{device_id}/deviceInfo").get()
         
-        if not device_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Device not found")
         
-        # Get alerts for the device
-        alerts_ref = get_ref(f"iotData/{device_id}/alerts")
-        alerts_data = alerts_ref.get() or {}
-        
-        if not alerts_data:
-            return {
-                "deviceId": device_id,
-                "alerts": [],
-                "count": 0,
-                "hasUnresolved": False
-            }
-        
-        # Convert alerts to list with IDs and filter based on resolved status
-        alerts_list = []
-        unresolved_count = 0
+        since = datetime.now() - timedelta(hours=hours) if hours is not None else None
         
-        for alert_id, alert_data in alerts_data.items():
-            alert_item = {
-                "id": alert_id,
-                **alert_data
-            }
-            
-            # Count unresolved alerts
-            if not alert_data.get("resolved", False):
-                unresolved_count += 1
-            
-            # Filter by resolved status if needed
-            if include_resolved or not alert_data.get("resolved", False):
-                alerts_list.append(alert_item)
-        
-        # Sort by timestamp (newest first)
-        alerts_list.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        # Unresolved alerts are held by the mirror; resolved ones are paged from the database
+        unresolved = mirror.device_unresolved_alerts(device_id)
+        if include_resolved:
+            alerts_ref = get_ref(f"iotData/{device_id}/alerts")
+            if limit > 0:
+                page, next_cursor = paginate(alerts_ref, limit, before=before, after=after, since=since)
+            else:
+                all_alerts = alerts_ref.get() or {}
+                page, next_cursor = paginate_items(all_alerts, len(all_alerts), before=before, after=after, since=since)
+        else:
+            page_size = limit if limit > 0 else len(unresolved)
+            page, next_cursor = paginate_items(unresolved, page_size, before=before, after=after, since=since)
         
-        # Limit results
-        if limit > 0:
-            alerts_list = alerts_list[:limit]
+        alerts_list = [{"id": alert_id, **alert_data} for alert_id, alert_data in page]
         
         return {
             "deviceId": device_id,
             "alerts": alerts_list,
             "count": len(alerts_list),
-            "totalAlerts": len(alerts_data),
-            "unresolvedCount": unresolved_count,
-            "hasUnresolved": unresolved_count > 0
+            "next_cursor": next_cursor,
+            "unresolvedCount": len(unresolved),
+            "hasUnresolved": len(unresolved) > 0
         }
         
     except HTTPException:
@@ -728,14 +713,12 @@ def get_latest_alerts(device_id: str, limit: int = 10, include_resolved: bool =
 def get_available_patients_for_monitor(device_id: str):
     """Get available patients in the same room as the monitor for assignment"""
     try:
-        # Get device data
-        device_ref = get_ref(f"iotData/{device_id}")
-        device_data = device_ref.get()
+        # Get device info (not the device's vitals history)
+        device_info = mirror.device_info(device_id)
         
-        if not device_data:
+        if not device_info:
             raise HTTPException(status_code=404, detail="Device not found")
         
-        device_info = device_data.get("deviceInfo", {})
         device_room_id = device_info.get("roomId")
         device_bed_id = device_info.get("bedId")
         
@@ -763,15 +746,7 @@ def get_available_patients_for_monitor(device_id: str):
                 continue
             
             # Check if patient is already assigned to another monitor
-            patient_has_monitor = False
-            iot_ref = get_ref("iotData")
-            all_devices = iot_ref.get() or {}
-            
-            for other_device_data in all_devices.values():
-                if (other_device_data.get("deviceInfo", {}).get("currentPatientId") == patient_id and
-                    other_device_data.get("deviceInfo", {}).get("type") == "vitals_monitor"):
-                    patient_has_monitor = True
-                    break
+            patient_has_monitor = bool(mirror.devices_for_patient(patient_id, device_type="vitals_monitor"))
             
             if not patient_has_monitor:
                 available_patients.append({
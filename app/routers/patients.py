@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException
 from typing import Optional
 import logging
 import re
-from app.firebase_config import get_ref
+from app.async_db import get_async_ref
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,11 +10,11 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/patients", tags=["Patients"])
 
-def get_next_patient_id() -> str:
+async def get_next_patient_id() -> str:
     """Generate the next sequential patient ID (patient_1, patient_2, etc.)"""
     try:
-        ref = get_ref("patients")
-        patients = ref.get() or {}
+        ref = get_async_ref("patients")
+        patients = await ref.get() or {}
         
         # Find all existing patient IDs that match the pattern patient_<number>
         patient_numbers = []
@@ -47,8 +47,8 @@ async def get_all_patients(
     - risk_level: Filter by risk level (Low, Moderate, High, Critical)
     """
     try:
-        ref = get_ref("patients")
-        patients = ref.get() or {}
+        ref = get_async_ref("patients")
+        patients = await ref.get() or {}
         
         # Apply filters if provided
         if ward or status or risk_level:
@@ -72,8 +72,8 @@ async def get_all_patients(
 async def get_patient(patient_id: str):
     """Get a specific patient's complete record"""
     try:
-        ref = get_ref(f"patients/{patient_id}")
-        patient = ref.get()
+        ref = get_async_ref(f"patients/{patient_id}")
+        patient = await ref.get()
         
         if not patient:
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
@@ -90,11 +90,11 @@ async def create_patient(patient: dict):
     """Create a new patient record with sequential ID"""
     try:
         # Generate the next sequential patient ID
-        patient_id = get_next_patient_id()
+        patient_id = await get_next_patient_id()
         
         # Set the patient data at the specific ID
-        ref = get_ref(f"patients/{patient_id}")
-        ref.set(patient)
+        ref = get_async_ref(f"patients/{patient_id}")
+        await ref.set(patient)
         
         return {
             "message": "Patient created successfully",
@@ -111,10 +111,10 @@ async def update_patient(
 ):
     """Update a patient's complete record"""
     try:
-        ref = get_ref(f"patients/{patient_id}")
-        if not ref.get():
+        ref = get_async_ref(f"patients/{patient_id}", cached=False)
+        if not await ref.get():
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
-        ref.set(patient)
+        await ref.set(patient)
         return {"message": f"Patient {patient_id} updated successfully"}
     except HTTPException as he:
         raise he
@@ -129,12 +129,12 @@ async def partial_update_patient(
 ):
     """Partially update a patient's record (no validation)"""
     try:
-        ref = get_ref(f"patients/{patient_id}")
-        current_data = ref.get()
+        ref = get_async_ref(f"patients/{patient_id}", cached=False)
+        current_data = await ref.get()
         if not current_data:
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
         update_data = {k: v for k, v in update.items() if v is not None}
-        ref.update(update_data)
+        await ref.update(update_data)
         return {"message": f"Patient {patient_id} updated successfully"}
     except HTTPException as he:
         raise he
@@ -146,11 +146,11 @@ async def partial_update_patient(
 async def delete_patient(patient_id: str):
     """Delete a patient record"""
     try:
-        ref = get_ref(f"patients/{patient_id}")
-        if not ref.get():
+        ref = get_async_ref(f"patients/{patient_id}", cached=False)
+        if not await ref.get():
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
-        ref.delete()
+        await ref.delete()
         return {"message": f"Patient {patient_id} deleted successfully"}
     except HTTPException as he:
         raise he
@@ -168,13 +168,13 @@ async def get_patient_vitals(
     """Get patient's vital signs history"""
     try:
         # First verify patient exists
-        patient_ref = get_ref(f"patients/{patient_id}")
-        if not patient_ref.get():
+        patient_ref = get_async_ref(f"patients/{patient_id}")
+        if not await patient_ref.get():
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
         
         # Get IoT data for the patient
-        iot_ref = get_ref("iotData")
-        monitors = iot_ref.get() or {}
+        iot_ref = get_async_ref("iotData")
+        monitors = await iot_ref.get() or {}
         
         vitals_history = []
         for monitor in monitors.values():
@@ -211,8 +211,8 @@ async def get_patient_treatments(
 ):
     """Get patient's treatment history"""
     try:
-        ref = get_ref(f"patients/{patient_id}")
-        patient = ref.get()
+        ref = get_async_ref(f"patients/{patient_id}")
+        patient = await ref.get()
         
         if not patient:
             raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
@@ -237,8 +237,8 @@ async def get_ward_patients(
 ):
     """Get all patients in a specific ward"""
     try:
-        ref = get_ref("patients")
-        all_patients = ref.get() or {}
+        ref = get_async_ref("patients")
+        all_patients = await ref.get() or {}
         
         # Filter patients by ward
         ward_patients = {}
@@ -260,8 +260,8 @@ async def get_patients_by_risk(
 ):
     """Get all patients with a specific risk level"""
     try:
-        ref = get_ref("patients")
-        all_patients = ref.get() or {}
+        ref = get_async_ref("patients")
+        all_patients = await ref.get() or {}
         
         # Filter patients by risk level
         risk_patients = {}
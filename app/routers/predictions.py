@@ -1,16 +1,64 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from app.firebase_config import get_ref
-import joblib
+from app.iot_mirror import mirror
+from app.model_registry import MODEL_MMAP, ModelLoadError, ModelRegistry, ModelVersionNotFound, share_arrays
+from app.prediction_cache import PredictionCache, prediction_key
+from app.risk_scorer import compile_model
+from app.timekeys import unique_key
+from app.vitals_trends import trends
+from app.write_behind import write_behind
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import List, Optional, Union
+import os
 import re
 router = APIRouter(prefix="/predict", tags=["Predictions"])
 
-# Loading the trained model
-model = joblib.load("models/patient_risk_model.pkl")
+def prepare_risk_model(pipeline) -> dict:
+    """Attach the array-backed copy of the pipeline, used only if it reproduces predict_proba exactly"""
+    compiled = compile_model(pipeline)
+    if compiled is not None and MODEL_MMAP:
+        # Score from memory maps shared by every worker instead of a private copy
+        compiled = compiled.with_arrays(share_arrays("risk_forest", compiled.arrays()))
+    return {"pipeline": pipeline, "compiled": compiled}
+
+def risk_probabilities(risk_model: dict, rows: List[dict]) -> np.ndarray:
+    """Class probabilities for feature dicts, from the compiled forest when there is one"""
+    compiled = risk_model.get("compiled")
+    if compiled is None:
+        return risk_model["pipeline"].predict_proba(pd.DataFrame(rows))
+    if len(rows) == 1:
+        return compiled.predict_proba_one(rows[0])[np.newaxis]
+    return compiled.predict_proba(rows)
+
+def risk_class_names(risk_model: dict) -> np.ndarray:
+    return risk_model["pipeline"].named_steps['classifier'].classes_
+
+def validate_risk_model(risk_model: dict) -> dict:
+    """Predict a few sample patients; the version is rejected unless it returns clean probabilities"""
+    samples = [
+        {"heart_rate": 75, "oxygen_level": 98, "temperature": 98.6, "systolic_bp": 120, "diastolic_bp": 80,
+         "age": 45, "glucose": 100, "respiratory_rate": 16, "num_conditions": 0, "conditions": ""},
+        {"heart_rate": 135, "oxygen_level": 86, "temperature": 103.1, "systolic_bp": 185, "diastolic_bp": 115,
+         "age": 78, "glucose": 260, "respiratory_rate": 30, "num_conditions": 2, "conditions": "Diabetes|Hypertension"}
+    ]
+    class_names = risk_class_names(risk_model)
+    probabilities = risk_probabilities(risk_model, samples)
+    ok = (probabilities.shape == (len(samples), len(class_names))
+          and bool(np.all(np.isfinite(probabilities)))
+          and bool(np.allclose(probabilities.sum(axis=1), 1.0)))
+    return {"ok": ok, "rows": len(samples), "classes": [str(class_name) for class_name in class_names],
+            "predictions": [str(class_names[i]) for i in probabilities.argmax(axis=1)],
+            "scorer": "compiled" if risk_model.get("compiled") is not None else "pipeline"}
+
+# Loading the trained model; new versions are swapped in without a restart
+risk_models = ModelRegistry("patient_risk_model", prepare=prepare_risk_model, validate=validate_risk_model)
+risk_models.load_initial()
+
+# Latest prediction per patient, returned again while its inputs are unchanged
+risk_prediction_cache = PredictionCache()
 
 # Pakistan Standard Time (UTC+5)
 PST = timezone(timedelta(hours=5))
@@ -25,52 +73,49 @@ def format_datetime_for_firebase(dt):
     """Format datetime in a Firebase-safe format (no colons or special chars)"""
     return dt.strftime("%Y-%m-%d_%H-%M-%S")
 
+def parse_firebase_datetime(value) -> Optional[datetime]:
+    """Datetime written by format_datetime_for_firebase, or None if the value is not one"""
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return None
+
+# Minutes until a patient's next scheduled prediction; higher risk is re-scored sooner
+RISK_RESCORE_MINUTES = int(os.getenv("RISK_RESCORE_MINUTES", "240"))
+RISK_RESCORE_MINUTES_BY_LEVEL = {
+    "Critical": int(os.getenv("RISK_RESCORE_MINUTES_CRITICAL", "15")),
+    "High": int(os.getenv("RISK_RESCORE_MINUTES_HIGH", "60"))
+}
+
+def next_prediction_time(risk_level: str, now: datetime) -> datetime:
+    """When a patient with this risk level is due to be re-scored"""
+    return now + timedelta(minutes=RISK_RESCORE_MINUTES_BY_LEVEL.get(risk_level, RISK_RESCORE_MINUTES))
+
 def get_latest_vitals(patient_id: str) -> Optional[dict]:
     """Fetch latest vitals for a patient from IoT monitors using new schema"""
     try:
         print(f"Getting latest vitals for patient: {patient_id}")
-        # Get all IoT devices
-        iot_ref = get_ref('iotData')
-        monitors = iot_ref.get()
+        # Vitals monitors assigned to this patient, from the patient -> monitor index
+        monitor_ids = mirror.devices_for_patient(patient_id, device_type='vitals_monitor')
         
-        print(f"Found {len(monitors) if monitors else 0} monitors")
+        print(f"Found {len(monitor_ids)} monitors")
         
-        if not monitors:
+        if not monitor_ids:
             print("No monitors found in database")
             return None
         
-        # Find monitor assigned to patient and get latest vitals
+        # Get latest vitals across the assigned monitors
         latest_vitals = None
         latest_timestamp = None
         
-        for monitor_id, data in monitors.items():
-            print(f"Checking monitor: {monitor_id}")
-            device_info = data.get('deviceInfo', {})
-            
-            # Check if this is a vitals monitor
-            if device_info.get('type') != 'vitals_monitor':
-                print(f"Monitor {monitor_id} is not a vitals monitor: {device_info.get('type')}")
-                continue
-                
-            # Check if patient is currently assigned to this monitor
-            current_patient_id = device_info.get('currentPatientId')
-            print(f"Monitor {monitor_id} current patient: {current_patient_id}")
-            
-            if current_patient_id == patient_id:
-                print(f"Found assigned monitor {monitor_id} for patient {patient_id}")
-                # Get vitals for this patient using new structure: vitals/{patient_id}/{timestamp}
-                vitals_data = data.get('vitals', {}).get(patient_id, {})
-                
-                print(f"Vitals data keys for patient: {list(vitals_data.keys()) if vitals_data else 'None'}")
-                
-                if vitals_data:
-                    # Find the latest timestamp
-                    for timestamp, vitals in vitals_data.items():
-                        print(f"Checking timestamp: {timestamp}")
-                        if latest_timestamp is None or timestamp > latest_timestamp:
-                            latest_timestamp = timestamp
-                            latest_vitals = vitals
-                            print(f"Updated latest vitals from timestamp: {timestamp}")
+        for monitor_id in monitor_ids:
+            print(f"Found assigned monitor {monitor_id} for patient {patient_id}")
+            # Latest reading under vitals/{patient_id}/{timestamp}
+            timestamp, vitals = mirror.latest_vitals(monitor_id, patient_id)
+            if vitals and (latest_timestamp is None or timestamp > latest_timestamp):
+                latest_timestamp = timestamp
+                latest_vitals = vitals
+                print(f"Updated latest vitals from timestamp: {timestamp}")
         
         print(f"Returning vitals: {latest_vitals is not None}")
         return latest_vitals
@@ -89,155 +134,190 @@ def get_patient_info(patient_id: str) -> dict:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching patient info: {str(e)}")
 
+def prediction_log_paths(patient_id: str, prediction_data: dict, input_data: dict, timestamp_str: str) -> dict:
+    """AI log entry and predictions history entry of a prediction, as multi-path update paths"""
+    log_entry = {
+        "modelId": "patient_risk_model",
+        "modelVersion": prediction_data.get("modelVersion", "1.0"),
+        "patientId": patient_id,
+        "inputData": {
+            "heartRate": input_data.get("heart_rate"),
+            "oxygenLevel": input_data.get("oxygen_level"),
+            "temperature": input_data.get("temperature"),
+            "bloodPressure": {
+                "systolic": input_data.get("systolic_bp"),
+                "diastolic": input_data.get("diastolic_bp")
+            },
+            "respiratoryRate": input_data.get("respiratory_rate"),
+            "contextData": {
+                "age": input_data.get("age"),
+                "conditions": input_data.get("conditions").split("|") if input_data.get("conditions") else []
+            }
+        },
+        "output": {
+            "riskLevel": prediction_data.get("riskLevel"),
+            "riskScore": prediction_data.get("riskScore"),
+            "confidence": prediction_data.get("confidence"),
+            "recommendations": prediction_data.get("recommendations", []),
+            "alertTriggered": prediction_data.get("riskScore", 0) > 75  # Alert if risk score > 75%
+        },
+        "timestamp": timestamp_str,
+        "processingTime": prediction_data.get("processingTime", 0.0),
+        "feedback": None  # Will be updated when staff provides feedback
+    }
+    return {
+        # AI logs with timestamp-based key
+        f"aiLogs/{patient_id}/{timestamp_str}": log_entry,
+        # Also the patient's predictions history
+        f"patients/{patient_id}/predictionsHistory/{timestamp_str}": prediction_data
+    }
+
 def log_prediction(patient_id: str, prediction_data: dict, input_data: dict):
     """Log the prediction in AI logs with timestamp-based key"""
     try:
-        timestamp = get_pst_now()
-        timestamp_str = format_datetime_for_firebase(timestamp)
-        # Create AI log entry
-        log_entry = {
-            "modelId": "patient_risk_model",
-            "modelVersion": "1.0",
-            "patientId": patient_id,
-            "inputData": {
-                "heartRate": input_data.get("heart_rate"),
-                "oxygenLevel": input_data.get("oxygen_level"),
-                "temperature": input_data.get("temperature"),
-                "bloodPressure": {
-                    "systolic": input_data.get("systolic_bp"),
-                    "diastolic": input_data.get("diastolic_bp")
-                },
-                "respiratoryRate": input_data.get("respiratory_rate"),
-                "contextData": {
-                    "age": input_data.get("age"),
-                    "conditions": input_data.get("conditions").split("|") if input_data.get("conditions") else []
-                }
-            },
-            "output": {
-                "riskLevel": prediction_data.get("riskLevel"),
-                "riskScore": prediction_data.get("riskScore"),
-                "confidence": prediction_data.get("confidence"),
-                "recommendations": prediction_data.get("recommendations", []),
-                "alertTriggered": prediction_data.get("riskScore", 0) > 75  # Alert if risk score > 75%
-            },
-            "timestamp": timestamp_str,
-            "processingTime": 0.0,  # TODO: Add actual processing time measurement
-            "feedback": None  # Will be updated when staff provides feedback
-        }
-        
-        # Store in AI logs with timestamp-based key
-        ai_logs_ref = get_ref(f'aiLogs/{patient_id}/{timestamp_str}')
-        ai_logs_ref.set(log_entry)
-        
-        # Also store in patient's predictions history
-        predictions_history_ref = get_ref(f'patients/{patient_id}/predictionsHistory/{timestamp_str}')
-        predictions_history_ref.set(prediction_data)
-        
+        timestamp_str = format_datetime_for_firebase(get_pst_now())
+        get_ref('/').update(prediction_log_paths(patient_id, prediction_data, input_data, timestamp_str))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error logging prediction: {str(e)}")
 
+def alert_paths(patient_id: str, risk_level: str, risk_score: int, vitals: dict, monitor_id: str,
+                timestamp: datetime) -> tuple[str, dict]:
+    """Key of a risk alert and its monitor and central alert entries, as multi-path update paths"""
+    timestamp_str = format_datetime_for_firebase(timestamp)
+    # Random tail: API workers and the scheduler can raise alerts in the same millisecond
+    alert_key = unique_key(timestamp)
+    alert_message = f"High Risk Alert: Patient risk level {risk_level} (Score: {risk_score}%)"
+    if risk_level == "Critical":
+        alert_type = "critical"
+    else:
+        alert_type = "warning"
+        
+    # Create alert details
+    alert = {
+        "type": alert_type,
+        "message": alert_message,
+        "timestamp": timestamp_str,
+        "resolved": False,
+        "resolvedBy": None,
+        "resolvedAt": None,
+        "vitals": {
+            "heartRate": vitals.get('heartRate'),
+            "oxygenLevel": vitals.get('oxygenLevel'),
+            "temperature": vitals.get('temperature'),
+            "bloodPressure": vitals.get('bloodPressure'),
+            "respiratoryRate": vitals.get('respiratoryRate')
+        }
+    }
+    
+    # Also the central alerts collection for easier querying
+    central_alert = {
+        **alert,
+        "patientId": patient_id,
+        "monitorId": monitor_id,
+        "location": {
+            "roomId": vitals.get("roomId"),
+            "bedId": vitals.get("bedId")
+        }
+    }
+    return alert_key, {
+        f"iotData/{monitor_id}/alerts/{alert_key}": alert,
+        f"alerts/{alert_key}": central_alert
+    }
+
 def create_alert(patient_id: str, risk_level: str, risk_score: int, vitals: dict, monitor_id: str):
     """Create an alert in the patient's monitor"""
     try:
-        timestamp = datetime.now()
-        timestamp_str = format_datetime_for_firebase(timestamp)
-        alert_message = f"High Risk Alert: Patient risk level {risk_level} (Score: {risk_score}%)"
-        if risk_level == "Critical":
-            alert_type = "critical"
-        else:
-            alert_type = "warning"
-            
-        # Create alert details
-        alert = {
-            "type": alert_type,
-            "message": alert_message,
-            "timestamp": timestamp_str,
-            "resolved": False,
-            "resolvedBy": None,
-            "resolvedAt": None,
-            "vitals": {
-                "heartRate": vitals.get('heartRate'),
-                "oxygenLevel": vitals.get('oxygenLevel'),
-                "temperature": vitals.get('temperature'),
-                "bloodPressure": vitals.get('bloodPressure'),
-                "respiratoryRate": vitals.get('respiratoryRate')
-            }
-        }
-        
-        # Add alert to monitor
-        monitor_ref = get_ref(f'iotData/{monitor_id}/alerts/{timestamp_str}')
-        monitor_ref.set(alert)
-        
-        # Also add to central alerts collection for easier querying
-        central_alert = {
-            **alert,
-            "patientId": patient_id,
-            "monitorId": monitor_id,
-            "location": {
-                "roomId": vitals.get("roomId"),
-                "bedId": vitals.get("bedId")
-            }
-        }
-        central_alerts_ref = get_ref(f'alerts/{timestamp_str}')
-        central_alerts_ref.set(central_alert)
-        
-        # logger.info(f"Created {alert_type} alert for patient {patient_id}") # logger is not defined
-        return timestamp_str
+        alert_key, paths = alert_paths(patient_id, risk_level, risk_score, vitals, monitor_id, datetime.now())
+        get_ref('/').update(paths)
+        return alert_key
         
     except Exception as e:
-        # logger.error(f"Error creating alert: {str(e)}") # logger is not defined
+        print(f"Error creating alert: {str(e)}")
         return None
 
+def build_risk_features(vitals: dict, patient_info: dict) -> dict:
+    """Model input row for a patient from their latest vitals and medical history"""
+    conditions = patient_info.get("medicalHistory", {}).get("conditions", [])
+    return {
+        "heart_rate": vitals.get('heartRate', 0),
+        "oxygen_level": vitals.get('oxygenLevel', 0),
+        "temperature": vitals.get('temperature', 0),
+        "systolic_bp": (vitals.get('bloodPressure') or {}).get('systolic', 0),
+        "diastolic_bp": (vitals.get('bloodPressure') or {}).get('diastolic', 0),
+        "age": patient_info.get('personalInfo', {}).get('age', 0),
+        "glucose": vitals.get('glucose', 0),
+        "respiratory_rate": vitals.get('respiratoryRate', 0),
+        "num_conditions": len(conditions),
+        "conditions": "|".join(conditions) if conditions else ""
+    }
+
+def risk_recommendations(prediction: str, risk_score: int, vitals: dict, conditions: list) -> List[str]:
+    """Recommendations based on risk level and vitals"""
+    recommendations = []
+    if prediction == "Critical":
+        recommendations.append("Immediate medical attention required")
+        if (vitals.get('heartRate') or 0) > 100:
+            recommendations.append("Monitor heart rate closely")
+        if (vitals.get('oxygenLevel') or 0) < 95:
+            recommendations.append("Check oxygen supplementation")
+    elif prediction == "High":
+        recommendations.append("Increase monitoring frequency")
+        if len(conditions) > 2:
+            recommendations.append("Review medication interactions")
+    elif risk_score > 50:  # Moderate risk
+        recommendations.append("Regular monitoring required")
+        if len(conditions) > 2:
+            recommendations.append("Review medication plan")
+    return recommendations
+
+def build_prediction_data(prediction: str, confidence: float, conditions: list, vitals: dict,
+                          processing_time: float, alert_id: Optional[str], model_version: str) -> dict:
+    """Prediction record stored under patients/{id}/predictions"""
+    risk_score = int(confidence * 100)
+    now = datetime.now()
+    return {
+        'riskLevel': prediction,
+        'riskScore': risk_score,
+        'confidence': confidence,
+        'predictedAt': format_datetime_for_firebase(now),
+        'nextPrediction': format_datetime_for_firebase(next_prediction_time(prediction, now)),
+        'factors': conditions,
+        'recommendations': risk_recommendations(prediction, risk_score, vitals, conditions),
+        'vitalsUsed': {
+            'heartRate': vitals.get('heartRate'),
+            'oxygenLevel': vitals.get('oxygenLevel'),
+            'temperature': vitals.get('temperature'),
+            'bloodPressure': vitals.get('bloodPressure'),
+            'respiratoryRate': vitals.get('respiratoryRate'),
+            'glucose': vitals.get('glucose')
+        },
+        'processingTime': processing_time,
+        'alertId': alert_id,
+        'modelVersion': model_version
+    }
+
 def get_patient_monitor(patient_id: str) -> tuple[Optional[str], Optional[dict]]:
     """Find the monitor assigned to a patient and get its latest vitals using new schema"""
     try:
         print(f"Finding monitor for patient: {patient_id}")
-        iot_ref = get_ref('iotData')
-        monitors = iot_ref.get()
+        monitor_ids = mirror.devices_for_patient(patient_id, device_type='vitals_monitor')
         
-        print(f"Retrieved {len(monitors) if monitors else 0} monitors from database")
+        print(f"Retrieved {len(monitor_ids)} monitors from database")
         
-        if not monitors:
+        if not monitor_ids:
             print("No monitors found in database")
             return None, None
         
-        for monitor_id, data in monitors.items():
-            print(f"Examining monitor: {monitor_id}")
-            device_info = data.get('deviceInfo', {})
-            
-            # Check if this is a vitals monitor
-            if device_info.get('type') != 'vitals_monitor':
-                print(f"Skipping monitor {monitor_id} - not a vitals monitor: {device_info.get('type')}")
-                continue
-                
-            # Check if patient is currently assigned to this monitor
-            current_patient_id = device_info.get('currentPatientId')
-            print(f"Monitor {monitor_id} current patient: {current_patient_id}")
+        for monitor_id in monitor_ids:
+            print(f"Found matching monitor {monitor_id} for patient {patient_id}")
+            # Latest reading under vitals/{patient_id}/{timestamp}
+            latest_timestamp, latest_vitals = mirror.latest_vitals(monitor_id, patient_id)
             
-            if current_patient_id == patient_id:
-                print(f"Found matching monitor {monitor_id} for patient {patient_id}")
-                # Get vitals for this patient using new structure: vitals/{patient_id}/{timestamp}
-                vitals_data = data.get('vitals', {}).get(patient_id, {})
-                
-                print(f"Vitals data structure: {list(vitals_data.keys()) if vitals_data else 'No vitals data'}")
-                
-                if vitals_data:
-                    # Find the latest timestamp and vitals
-                    latest_timestamp = None
-                    latest_vitals = None
-                    
-                    for timestamp, vitals in vitals_data.items():
-                        print(f"Checking vitals timestamp: {timestamp}")
-                        if latest_timestamp is None or timestamp > latest_timestamp:
-                            latest_timestamp = timestamp
-                            latest_vitals = vitals
-                            print(f"Updated latest vitals from: {timestamp}")
-                    
-                    if latest_vitals:
-                        print(f"Returning monitor {monitor_id} with vitals from {latest_timestamp}")
-                        return monitor_id, latest_vitals
-                else:
-                    print(f"Monitor {monitor_id} has no vitals data for patient {patient_id}")
+            if latest_vitals:
+                print(f"Returning monitor {monitor_id} with vitals from {latest_timestamp}")
+                return monitor_id, latest_vitals
+            else:
+                print(f"Monitor {monitor_id} has no vitals data for patient {patient_id}")
                 
         print(f"No suitable monitor found for patient {patient_id}")
         return None, None
@@ -251,6 +331,12 @@ def predict_risk(patient_id: str):
         print(f"Starting risk prediction for patient: {patient_id}")
         start_time = datetime.now()
         
+        # One model version for the whole request, even if a new one is swapped in meanwhile
+        active_model = risk_models.active
+        if active_model is None:
+            raise HTTPException(status_code=503, detail="Risk model not loaded")
+        model = active_model.artifact
+        
         # Find patient's monitor and get latest vitals
         print(f"Finding monitor for patient: {patient_id}")
         monitor_id, vitals = get_patient_monitor(patient_id)
@@ -275,34 +361,27 @@ def predict_risk(patient_id: str):
         print(f"Medical conditions found: {conditions}")
         
         # Prepare features for prediction
-        features_dict = {
-            "heart_rate": vitals.get('heartRate', 0),
-            "oxygen_level": vitals.get('oxygenLevel', 0),
-            "temperature": vitals.get('temperature', 0),
-            "systolic_bp": vitals.get('bloodPressure', {}).get('systolic', 0),
-            "diastolic_bp": vitals.get('bloodPressure', {}).get('diastolic', 0),
-            "age": patient_info.get('personalInfo', {}).get('age', 0),
-            "glucose": vitals.get('glucose', 0),
-            "respiratory_rate": vitals.get('respiratoryRate', 0),
-            "num_conditions": len(conditions),
-            "conditions": "|".join(conditions) if conditions else ""
-        }
+        features_dict = build_risk_features(vitals, patient_info)
         
         print(f"Features prepared: {features_dict}")
         
-        features = pd.DataFrame([features_dict])
-        print(f"DataFrame created with shape: {features.shape}")
+        # Unchanged inputs: the stored prediction is still current, so skip scoring and the writes.
+        # It is returned as stored (predictedAt, nextPrediction), matching patients/{id}/predictions
+        cache_key = prediction_key(patient_id, active_model.version, features_dict)
+        cached_response = risk_prediction_cache.get(patient_id, cache_key)
+        if cached_response is not None:
+            print(f"Returning cached prediction for patient {patient_id}")
+            return {**cached_response, "cached": True}
         
-        # Making prediction
+        # Making prediction; the class with the highest probability, as model.predict returns
         print("Making prediction with model...")
-        prediction = model.predict(features)[0]
-        probabilities = model.predict_proba(features)[0]
+        probabilities = risk_probabilities(model, [features_dict])[0]
+        class_names = risk_class_names(model)
+        prediction = class_names[probabilities.argmax()]
         max_prob = float(np.max(probabilities))
         
         print(f"Prediction: {prediction}, Max probability: {max_prob}")
 
-        # Getting class names
-        class_names = model.named_steps['classifier'].classes_
         prob_dict = {class_name: float(prob) for class_name, prob in zip(class_names, probabilities)}
         
         print(f"Probability distribution: {prob_dict}")
@@ -310,81 +389,45 @@ def predict_risk(patient_id: str):
         # Calculate processing time
         processing_time = (datetime.now() - start_time).total_seconds()
         
-        # Generate recommendations based on risk level and vitals
-        recommendations = []
         risk_score = int(max_prob * 100)
         
         print(f"Risk score calculated: {risk_score}")
         
         # Create alert for high or critical risk
+        updates = {}
         alert_id = None
         if prediction in ["High", "Critical"]:
             print(f"Creating alert for {prediction} risk")
-            alert_id = create_alert(
-                patient_id=patient_id,
-                risk_level=prediction,
-                risk_score=risk_score,
-                vitals=vitals,
-                monitor_id=monitor_id
-            )
+            alert_id, alert_writes = alert_paths(patient_id, prediction, risk_score, vitals, monitor_id, datetime.now())
+            updates.update(alert_writes)
             print(f"Alert created with ID: {alert_id}")
-            
-            if prediction == "Critical":
-                recommendations.append("Immediate medical attention required")
-                if vitals.get('heartRate', 0) > 100:
-                    recommendations.append("Monitor heart rate closely")
-                if vitals.get('oxygenLevel', 0) < 95:
-                    recommendations.append("Check oxygen supplementation")
-            else:  # High risk
-                recommendations.append("Increase monitoring frequency")
-                if len(conditions) > 2:
-                    recommendations.append("Review medication interactions")
-        elif risk_score > 50:  # Moderate risk
-            recommendations.append("Regular monitoring required")
-            if len(conditions) > 2:
-                recommendations.append("Review medication plan")
-        
-        # Prepare prediction data
-        prediction_data = {
-            'riskLevel': prediction,
-            'riskScore': risk_score,
-            'confidence': max_prob,
-            'predictedAt': format_datetime_for_firebase(datetime.now()),
-            'nextPrediction': format_datetime_for_firebase(datetime.now() + timedelta(hours=4)),
-            'factors': conditions,
-            'recommendations': recommendations,
-            'vitalsUsed': {
-                'heartRate': vitals.get('heartRate'),
-                'oxygenLevel': vitals.get('oxygenLevel'),
-                'temperature': vitals.get('temperature'),
-                'bloodPressure': vitals.get('bloodPressure'),
-                'respiratoryRate': vitals.get('respiratoryRate'),
-                'glucose': vitals.get('glucose')
-            },
-            'processingTime': processing_time,
-            'alertId': alert_id
-        }
+        
+        # Prepare prediction data, with recommendations based on risk level and vitals
+        prediction_data = build_prediction_data(prediction, max_prob, conditions, vitals,
+                                                processing_time, alert_id, active_model.version)
         
         print(f"Prediction data prepared: {prediction_data}")
         
-        # Update current patient predictions
-        print("Updating patient predictions...")
-        patient_predictions_ref = get_ref(f'patients/{patient_id}/predictions')
-        patient_predictions_ref.set(prediction_data)
+        # Current patient predictions, and the prediction logged with its input data
+        updates[f'patients/{patient_id}/predictions'] = prediction_data
+        updates.update(prediction_log_paths(patient_id, prediction_data, features_dict,
+                                            format_datetime_for_firebase(get_pst_now())))
         
-        # Log the prediction with input data
-        print("Logging prediction...")
-        log_prediction(patient_id, prediction_data, features_dict)
+        # Written by the write-behind queue, coalesced with other predictions' writes
+        print("Queueing prediction writes...")
+        write_behind.submit(updates)
         
         print("Risk prediction completed successfully")
         
-        return {
+        response = {
             "patient_id": patient_id,
             "prediction": prediction,
             "probabilities": prob_dict,
             "prediction_details": prediction_data,
             "alert_created": alert_id is not None
         }
+        risk_prediction_cache.put(patient_id, cache_key, response)
+        return {**response, "cached": False}
 
     except HTTPException as he:
         print(f"HTTP Exception: {he.detail}")
@@ -395,6 +438,180 @@ def predict_risk(patient_id: str):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+def predict_patients(patient_ids: List[str], patients: dict) -> tuple[dict, dict]:
+    """
+    Predict risk for many patients with one model call
+    patients is one snapshot of the patients collection; vitals come from the IoT
+    mirror. Every prediction, AI log and alert is saved with one multi-path update.
+    Returns (results by patient ID, errors by patient ID)
+    """
+    start_time = datetime.now()
+    active_model = risk_models.active
+    if active_model is None:
+        raise HTTPException(status_code=503, detail="Risk model not loaded")
+    model = active_model.artifact
+    
+    errors = {}
+    rows = []
+    for patient_id in patient_ids:
+        patient_info = patients.get(patient_id)
+        if not isinstance(patient_info, dict):
+            errors[patient_id] = {"status_code": 404, "error": f"Patient {patient_id} not found"}
+            continue
+        # First assigned monitor with a reading, as for a single prediction
+        monitor_id, vitals = None, None
+        for candidate_id in mirror.devices_for_patient(patient_id, device_type='vitals_monitor'):
+            _, latest_vitals = mirror.latest_vitals(candidate_id, patient_id)
+            if latest_vitals:
+                monitor_id, vitals = candidate_id, latest_vitals
+                break
+        if not vitals:
+            errors[patient_id] = {"status_code": 404, "error": "No recent vitals found for patient"}
+            continue
+        rows.append((patient_id, monitor_id, vitals, patient_info))
+    
+    if not rows:
+        return {}, errors
+    
+    # One feature matrix and one model call for the whole batch
+    features_rows = [build_risk_features(vitals, patient_info) for _, _, vitals, patient_info in rows]
+    probabilities = risk_probabilities(model, features_rows)
+    class_names = risk_class_names(model)
+    # Same as model.predict: the class with the highest probability
+    predictions = class_names[probabilities.argmax(axis=1)]
+    # The batch's processing time is shared evenly between its predictions
+    processing_time = (datetime.now() - start_time).total_seconds() / len(rows)
+    
+    updates = {}
+    results = {}
+    alert_time = datetime.now()
+    log_timestamp_str = format_datetime_for_firebase(get_pst_now())
+    for (patient_id, monitor_id, vitals, patient_info), features_dict, row_probabilities, prediction in zip(
+            rows, features_rows, probabilities, predictions):
+        prediction = str(prediction)
+        max_prob = float(np.max(row_probabilities))
+        conditions = patient_info.get("medicalHistory", {}).get("conditions", [])
+        
+        alert_id = None
+        if prediction in ["High", "Critical"]:
+            alert_id, alert_writes = alert_paths(patient_id, prediction, int(max_prob * 100), vitals,
+                                                 monitor_id, alert_time)
+            updates.update(alert_writes)
+        
+        prediction_data = build_prediction_data(prediction, max_prob, conditions, vitals,
+                                                processing_time, alert_id, active_model.version)
+        updates[f"patients/{patient_id}/predictions"] = prediction_data
+        updates.update(prediction_log_paths(patient_id, prediction_data, features_dict, log_timestamp_str))
+        
+        results[patient_id] = {
+            "patient_id": patient_id,
+            "prediction": prediction,
+            "probabilities": {str(class_name): float(prob) for class_name, prob in zip(class_names, row_probabilities)},
+            "prediction_details": prediction_data,
+            "alert_created": alert_id is not None
+        }
+    
+    get_ref('/').update(updates)
+    for (patient_id, _, _, _), features_dict in zip(rows, features_rows):
+        risk_prediction_cache.put(patient_id, prediction_key(patient_id, active_model.version, features_dict),
+                                  results[patient_id])
+    return results, errors
+
+class RiskBatchRequest(BaseModel):
+    patient_ids: Union[List[str], str] = "all"
+    ward: Optional[str] = None
+
+@router.post("/risk:batch")
+def predict_risk_batch(request: RiskBatchRequest):
+    """
+    Predict risk for many patients in one model call
+    Pass patient_ids as a list, or "all" for every patient; ward narrows the
+    selection to one ward. Patients are read in one snapshot and the results
+    are saved with one multi-path update
+    """
+    try:
+        start_time = datetime.now()
+        if isinstance(request.patient_ids, str) and request.patient_ids != "all":
+            raise HTTPException(status_code=400, detail='patient_ids must be a list of IDs or "all"')
+        
+        patients = get_ref('patients').get() or {}
+        if isinstance(request.patient_ids, str):
+            patient_ids = list(patients.keys())
+        else:
+            patient_ids = list(dict.fromkeys(request.patient_ids))
+        if request.ward:
+            patient_ids = [
+                patient_id for patient_id in patient_ids
+                if patient_id not in patients
+                or (patients[patient_id] or {}).get("personalInfo", {}).get("ward") == request.ward
+            ]
+        
+        results, errors = predict_patients(patient_ids, patients)
+        print(f"Batch risk prediction: {len(results)} scored, {len(errors)} skipped")
+        
+        return {
+            "scored": len(results),
+            "alerts": sum(1 for result in results.values() if result["alert_created"]),
+            "processingTime": (datetime.now() - start_time).total_seconds(),
+            "results": results,
+            "errors": errors
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in batch risk prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+@router.get("/model/status")
+def get_risk_model_status():
+    """Active risk model version, when and how fast it was loaded, and the versions on disk"""
+    active_model = risk_models.active
+    return {
+        "model_loaded": active_model is not None,
+        "status": "Model loaded successfully" if active_model is not None else "Model not found or failed to load",
+        "model_type": "Random Forest Pipeline",
+        "scorer": active_model.validation.get("scorer") if active_model is not None else None,
+        "classes": active_model.validation.get("classes") if active_model is not None else None,
+        "version": active_model.version if active_model is not None else None,
+        "registry": risk_models.status()
+    }
+
+@router.post("/model/reload")
+def reload_risk_model(version: Optional[str] = None):
+    """Load, smoke-test and activate a risk model version (default: re-read the active one)"""
+    try:
+        loaded = risk_models.load(version, activate=version is not None)
+        return {"message": f"Risk model version {loaded.version} active",
+                "version": loaded.version, "load_seconds": loaded.load_seconds,
+                "validation": loaded.validation}
+    except ModelVersionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error reloading risk model: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reload model: {str(e)}")
+
+@router.get("/cache/stats")
+def get_prediction_cache_stats():
+    """Hit rate of the risk prediction cache"""
+    return risk_prediction_cache.stats()
+
+@router.get("/trends/{patient_id}")
+def get_patient_trends(patient_id: str):
+    """Rolling EWMA, mean, standard deviation and slope of each vital sign per window"""
+    try:
+        snapshot = trends.snapshot(patient_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail=f"No vitals found for patient {patient_id}")
+        return snapshot
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting trends for patient {patient_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/debug/monitors")
 def debug_monitor_structure():
     """Debug endpoint to show the current monitor data structure"""
@@ -1,9 +1,28 @@
 # routers/realtime.py
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.anomaly_stream import anomaly_stream
+from app.async_db import run_db
+from app.vitals_ingest import VitalsReading, ingest_readings
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
 
-router = APIRouter()
+router = APIRouter(tags=["Realtime"])
+logger = logging.getLogger(__name__)
 clients = []
 
+# Readings a connection may have queued but not yet stored; the receiver stops
+# reading from the socket while the queue is full
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+# Readings written per multi-path update, and how long a partial batch may wait
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "50"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.2"))
+
+stream_stats = {"connections": 0, "received": 0, "stored": 0, "rejected": 0, "batches": 0}
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -21,3 +40,189 @@ async def broadcast_message(message: str):
             await ws.send_text(message)
         except:
             clients.remove(ws)
+
+def parse_reading(item, received_at: datetime):
+    """Build a VitalsReading from a decoded message item; returns (reading, error)"""
+    if not isinstance(item, dict):
+        return None, "Reading must be a JSON object"
+    try:
+        reading = VitalsReading(**{key: value for key, value in item.items() if key != "seq"})
+    except ValidationError as e:
+        return None, f"Invalid reading: {e.errors()[0].get('msg', 'validation failed')}"
+    if not reading.timestamp:
+        # Stamp on arrival so queueing delay does not shift the reading's time
+        reading.timestamp = received_at.isoformat()
+    return reading, None
+
+async def store_batch(batch):
+    """Store queued (seq, reading) pairs with one multi-path update; returns per-reading results"""
+    readings = [reading for _, reading in batch]
+    results = await run_db(ingest_readings, readings)
+    anomaly_stream.submit_ingested(readings, results)
+    stream_stats["batches"] += 1
+    for (seq, _), result in zip(batch, results):
+        result["seq"] = seq
+        result.pop("index", None)
+        stream_stats["stored" if result["status"] == "stored" else "rejected"] += 1
+    return results
+
+@router.websocket("/ws/vitals")
+async def stream_vitals(websocket: WebSocket):
+    """
+    Persistent ingestion channel for monitors and environmental sensors
+    Send readings as JSON objects (or arrays of them) with an optional "seq";
+    every stored batch is acknowledged with per-reading results and the
+    number of readings the client may send before waiting for the next ack
+    """
+    await websocket.accept()
+    stream_stats["connections"] += 1
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    send_lock = asyncio.Lock()
+    next_seq = 0
+    connected = True
+
+    async def send(message):
+        nonlocal connected
+        if not connected:
+            return
+        async with send_lock:
+            try:
+                await websocket.send_json(message)
+            except Exception:
+                # Client went away; keep storing what it already sent
+                connected = False
+
+    async def writer():
+        while True:
+            first = await queue.get()
+            if first is None:
+                return
+            batch = [first]
+            closing = False
+            deadline = asyncio.get_running_loop().time() + STREAM_FLUSH_INTERVAL
+            while len(batch) < STREAM_BATCH_SIZE:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                results = await store_batch(batch)
+                await send({"type": "ack", "results": results,
+                            "credit": STREAM_QUEUE_SIZE - queue.qsize()})
+            except Exception as e:
+                logger.error(f"Error storing streamed readings: {e}")
+                await send({"type": "error", "seqs": [seq for seq, _ in batch], "error": str(e)})
+            if closing:
+                return
+
+    writer_task = asyncio.create_task(writer())
+    await send({"type": "ready", "credit": STREAM_QUEUE_SIZE, "batchSize": STREAM_BATCH_SIZE})
+    try:
+        while not writer_task.done():
+            message = await websocket.receive_text()
+            received_at = datetime.now()
+            try:
+                payload = json.loads(message)
+            except json.JSONDecodeError:
+                await send({"type": "ack", "results": [{"seq": None, "status": "rejected", "error": "Invalid JSON"}]})
+                continue
+            for item in payload if isinstance(payload, list) else [payload]:
+                seq = item.get("seq") if isinstance(item, dict) and "seq" in item else next_seq
+                next_seq = (seq + 1) if isinstance(seq, int) else next_seq + 1
+                stream_stats["received"] += 1
+                reading, error = parse_reading(item, received_at)
+                if error is not None:
+                    stream_stats["rejected"] += 1
+                    await send({"type": "ack", "results": [{"seq": seq, "status": "rejected", "error": error}]})
+                    continue
+                # Blocks while the queue is full, which stops reads from this socket
+                await queue.put((seq, reading))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connected = False
+        stream_stats["connections"] -= 1
+        # Flush what is already queued; acks can no longer be delivered after a disconnect
+        await queue.put(None)
+        try:
+            await writer_task
+        except Exception:
+            pass
+
+@router.post("/stream/vitals")
+async def stream_vitals_ndjson(request: Request):
+    """
+    Chunked NDJSON ingestion: one reading per line, stored in batches while the body streams in
+    The body is read one chunk at a time and only after the previous batch is stored,
+    so a slow database slows the sender instead of growing memory
+    """
+    # Only rejections are kept per line so long streams do not grow the response
+    errors = []
+    batch = []
+    buffer = b""
+    line_number = 0
+    stored = 0
+
+    async def flush():
+        nonlocal batch, stored
+        if batch:
+            for result in await store_batch(batch):
+                if result["status"] == "stored":
+                    stored += 1
+                else:
+                    errors.append(result)
+            batch = []
+
+    async def handle(line: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not line.strip():
+            return
+        stream_stats["received"] += 1
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            stream_stats["rejected"] += 1
+            errors.append({"seq": line_number, "status": "rejected", "error": "Invalid JSON"})
+            return
+        seq = item.get("seq", line_number) if isinstance(item, dict) else line_number
+        reading, error = parse_reading(item, datetime.now())
+        if error is not None:
+            stream_stats["rejected"] += 1
+            errors.append({"seq": seq, "status": "rejected", "error": error})
+            return
+        batch.append((seq, reading))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            await flush()
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                await handle(line)
+        if buffer:
+            await handle(buffer)
+        await flush()
+    except Exception as e:
+        logger.error(f"Error ingesting NDJSON stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "message": f"Stored {stored} of {stored + len(errors)} readings",
+        "stored": stored,
+        "rejected": len(errors),
+        "errors": errors
+    }
+
+@router.get("/stream/stats")
+def get_stream_stats():
+    """Counters for the streaming ingestion channels"""
+    return {**stream_stats, "queueSize": STREAM_QUEUE_SIZE, "batchSize": STREAM_BATCH_SIZE}
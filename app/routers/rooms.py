@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from app.firebase_config import get_ref
+from app.async_db import get_async_ref, run_db
+from app.iot_mirror import mirror
+import asyncio
 import uuid
 from datetime import datetime
 
@@ -21,8 +23,8 @@ class RoomData(BaseModel):
 async def get_all_rooms():
     """Get all rooms"""
     try:
-        ref = get_ref("rooms")
-        rooms = ref.get() or {}
+        ref = get_async_ref("rooms")
+        rooms = await ref.get() or {}
         return rooms
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch rooms: {str(e)}")
@@ -31,8 +33,8 @@ async def get_all_rooms():
 async def get_room(room_id: str):
     """Get a specific room by ID"""
     try:
-        ref = get_ref(f"rooms/{room_id}")
-        room = ref.get()
+        ref = get_async_ref(f"rooms/{room_id}")
+        room = await ref.get()
         
         if not room:
             raise HTTPException(status_code=404, detail="Room not found")
@@ -47,23 +49,15 @@ async def get_room_devices(room_id: str):
     """Get all IoT devices assigned to a specific room"""
     try:
         # Check if room exists
-        room_ref = get_ref(f"rooms/{room_id}")
-        room_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{room_id}")
+        room_data = await room_ref.get()
         if not room_data:
             raise HTTPException(status_code=404, detail="Room not found")
         
-        # Get all IoT devices
-        iot_ref = get_ref("iotData")
-        all_devices = iot_ref.get() or {}
-        
-        # Filter devices assigned to this room
-        room_devices = {}
-        for device_id, device_data in all_devices.items():
-            device_info = device_data.get('deviceInfo', {})
-            device_room_id = device_info.get('roomId')
-            
-            if device_room_id == room_id:
-                room_devices[device_id] = device_data
+        # Look up devices assigned to this room in the room index and fetch them concurrently
+        device_ids = await run_db(mirror.devices_in_room, room_id)
+        devices = await asyncio.gather(*(get_async_ref(f"iotData/{device_id}").get() for device_id in device_ids))
+        room_devices = {device_id: device_data for device_id, device_data in zip(device_ids, devices) if device_data}
         
         return {
             "roomId": room_id,
@@ -80,8 +74,8 @@ async def create_room(room_data: RoomData):
     """Create a new room"""
     try:
         # Check if room already exists
-        existing_room_ref = get_ref(f"rooms/{room_data.roomId}")
-        existing_room = existing_room_ref.get()
+        existing_room_ref = get_async_ref(f"rooms/{room_data.roomId}", cached=False)
+        existing_room = await existing_room_ref.get()
         if existing_room:
             raise HTTPException(status_code=400, detail="Room already exists")
         
@@ -91,8 +85,8 @@ async def create_room(room_data: RoomData):
         room_dict['updatedAt'] = datetime.now().isoformat()
         
         # Create room document
-        room_ref = get_ref(f"rooms/{room_data.roomId}")
-        room_ref.set(room_dict)
+        room_ref = get_async_ref(f"rooms/{room_data.roomId}")
+        await room_ref.set(room_dict)
         
         # Update patient assignment if provided
         if room_data.assignedPatient:
@@ -113,8 +107,8 @@ async def update_room(room_id: str, room_data: RoomData):
     """Update an existing room"""
     try:
         # Check if room exists
-        room_ref = get_ref(f"rooms/{room_id}")
-        current_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{room_id}", cached=False)
+        current_data = await room_ref.get()
         if not current_data:
             raise HTTPException(status_code=404, detail="Room not found")
         
@@ -124,7 +118,7 @@ async def update_room(room_id: str, room_data: RoomData):
         room_dict['createdAt'] = current_data.get('createdAt', datetime.now().isoformat())
         
         # Update room document
-        room_ref.set(room_dict)
+        await room_ref.set(room_dict)
         
         # Handle patient assignment changes
         current_patient = current_data.get('assignedPatient')
@@ -193,8 +187,8 @@ async def delete_room(room_id: str):
     """Delete a room"""
     try:
         # Check if room exists
-        room_ref = get_ref(f"rooms/{room_id}")
-        room_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{room_id}", cached=False)
+        room_data = await room_ref.get()
         if not room_data:
             raise HTTPException(status_code=404, detail="Room not found")
         
@@ -207,7 +201,7 @@ async def delete_room(room_id: str):
             await unassign_device_from_room(device_id)
         
         # Delete room
-        room_ref.delete()
+        await room_ref.delete()
         
         return {"message": "Room deleted successfully"}
     except HTTPException:
@@ -255,8 +249,8 @@ async def unassign_device_from_room_endpoint(device_id: str):
 async def find_available_bed_in_room(room_id: str, bed_type: Optional[str] = None) -> Optional[str]:
     """Find an available bed in a room, optionally filtered by type"""
     try:
-        beds_ref = get_ref("beds")
-        all_beds = beds_ref.get() or {}
+        beds_ref = get_async_ref("beds", cached=False)
+        all_beds = await beds_ref.get() or {}
         
         for bed_id, bed_data in all_beds.items():
             if (bed_data.get('roomId') == room_id and 
@@ -272,10 +266,8 @@ async def find_available_bed_in_room(room_id: str, bed_type: Optional[str] = Non
 async def assign_patient_to_room(room_id: str, patient_id: str):
     """Helper function to assign patient to room and find an available bed"""
     # Check if patient exists
-    patient_ref = get_ref(f"patients/{patient_id}")
-    patient_data = patient_ref.get()
-    
-    if not patient_data:
+    patient_ref = get_async_ref(f"patients/{patient_id}", cached=False)
+    if not await patient_ref.get(shallow=True):
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # Find an available bed in the room
@@ -285,32 +277,26 @@ async def assign_patient_to_room(room_id: str, patient_id: str):
         raise HTTPException(status_code=400, detail=f"No available beds in room {room_id}")
     
     # Assign patient to the bed
-    bed_ref = get_ref(f"beds/{available_bed_id}")
-    bed_data = bed_ref.get()
-    
-    if not bed_data:
+    bed_ref = get_async_ref(f"beds/{available_bed_id}", cached=False)
+    if not await bed_ref.get(shallow=True):
         raise HTTPException(status_code=404, detail=f"Bed {available_bed_id} not found")
     
     # Update bed status
-    bed_data['patientId'] = patient_id
-    bed_data['status'] = 'occupied'
-    bed_ref.set(bed_data)
+    await bed_ref.update({'patientId': patient_id, 'status': 'occupied'})
     
     # Update patient's bed and room assignment
-    patient_data['personalInfo']['bedId'] = available_bed_id
-    patient_data['personalInfo']['roomId'] = room_id
-    patient_ref.set(patient_data)
+    await patient_ref.child('personalInfo').update({'bedId': available_bed_id, 'roomId': room_id})
     
     # Update room's patient assignment
-    room_ref = get_ref(f"rooms/{room_id}")
-    room_ref.update({'assignedPatient': patient_id, 'status': 'occupied'})
+    room_ref = get_async_ref(f"rooms/{room_id}")
+    await room_ref.update({'assignedPatient': patient_id, 'status': 'occupied'})
 
 async def update_room_status_based_on_beds(room_id: str):
     """Update room status based on bed occupancy"""
     try:
         # Get all beds in the room
-        beds_ref = get_ref("beds")
-        all_beds = beds_ref.get() or {}
+        beds_ref = get_async_ref("beds", cached=False)
+        all_beds = await beds_ref.get() or {}
         
         room_beds = [bed for bed in all_beds.values() if bed.get('roomId') == room_id]
         
@@ -318,8 +304,8 @@ async def update_room_status_based_on_beds(room_id: str):
         occupied_beds = [bed for bed in room_beds if bed.get('status') == 'occupied']
         
         # Update room status
-        room_ref = get_ref(f"rooms/{room_id}")
-        room_data = room_ref.get()
+        room_ref = get_async_ref(f"rooms/{room_id}", cached=False)
+        room_data = await room_ref.get()
         
         if room_data:
             new_status = 'occupied' if occupied_beds else 'available'
@@ -329,7 +315,7 @@ async def update_room_status_based_on_beds(room_id: str):
             if occupied_beds:
                 assigned_patient = occupied_beds[0].get('patientId')
             
-            room_ref.update({
+            await room_ref.update({
                 'status': new_status,
                 'assignedPatient': assigned_patient
             })
@@ -340,28 +326,22 @@ async def update_room_status_based_on_beds(room_id: str):
 async def unassign_patient_from_room(patient_id: str):
     """Helper function to unassign patient from room and discharge from bed"""
     # Get current patient data
-    patient_ref = get_ref(f"patients/{patient_id}")
-    patient_data = patient_ref.get()
-    
-    if patient_data:
-        old_room_id = patient_data.get('personalInfo', {}).get('roomId')
-        old_bed_id = patient_data.get('personalInfo', {}).get('bedId')
+    patient_ref = get_async_ref(f"patients/{patient_id}", cached=False)
+    if await patient_ref.get(shallow=True):
+        personal_info = await patient_ref.child('personalInfo').get() or {}
+        old_room_id = personal_info.get('roomId')
+        old_bed_id = personal_info.get('bedId')
         
         # Discharge from bed if assigned
         if old_bed_id:
-            bed_ref = get_ref(f"beds/{old_bed_id}")
-            bed_data = bed_ref.get()
+            bed_ref = get_async_ref(f"beds/{old_bed_id}", cached=False)
             
-            if bed_data:
+            if await bed_ref.get(shallow=True):
                 # Update bed status
-                bed_data['patientId'] = None
-                bed_data['status'] = 'available'
-                bed_ref.set(bed_data)
+                await bed_ref.update({'patientId': None, 'status': 'available'})
         
         # Remove room and bed assignment from patient
-        patient_data['personalInfo']['roomId'] = None
-        patient_data['personalInfo']['bedId'] = None
-        patient_ref.set(patient_data)
+        await patient_ref.child('personalInfo').update({'roomId': None, 'bedId': None})
         
         # Update room status based on remaining bed occupancy
         if old_room_id:
@@ -370,64 +350,28 @@ async def unassign_patient_from_room(patient_id: str):
 async def assign_device_to_room(room_id: str, device_id: str):
     """Helper function to assign device to room"""
     # Update device's room assignment
-    device_ref = get_ref(f"iotData/{device_id}")
-    device_data = device_ref.get()
-    
-    if not device_data:
+    device_info_ref = get_async_ref(f"iotData/{device_id}/deviceInfo", cached=False)
+    if not await device_info_ref.get(shallow=True):
         raise HTTPException(status_code=404, detail="Device not found")
     
-    device_data['deviceInfo']['roomId'] = room_id
-    device_ref.set(device_data)
+    await device_info_ref.update({'roomId': room_id})
+    mirror.record_write(f"iotData/{device_id}/deviceInfo/roomId", room_id)
 
 async def unassign_device_from_room(device_id: str):
     """Helper function to unassign device from room"""
     # Remove room assignment from device
-    device_ref = get_ref(f"iotData/{device_id}")
-    device_data = device_ref.get()
+    device_info_ref = get_async_ref(f"iotData/{device_id}/deviceInfo", cached=False)
     
-    if device_data:
-        device_data['deviceInfo']['roomId'] = None
-        device_ref.set(device_data)
-
-@router.get("/{room_id}/devices")
-async def get_room_devices(room_id: str):
-    """Get all IoT devices assigned to a specific room"""
-    try:
-        # Check if room exists
-        room_ref = get_ref(f"rooms/{room_id}")
-        room_data = room_ref.get()
-        if not room_data:
-            raise HTTPException(status_code=404, detail="Room not found")
-        
-        # Get all IoT devices
-        iot_ref = get_ref("iotData")
-        all_devices = iot_ref.get() or {}
-        
-        # Filter devices assigned to this room
-        room_devices = {}
-        for device_id, device_data in all_devices.items():
-            device_info = device_data.get('deviceInfo', {})
-            device_room_id = device_info.get('roomId')
-            
-            if device_room_id == room_id:
-                room_devices[device_id] = device_data
-        
-        return {
-            "roomId": room_id,
-            "deviceCount": len(room_devices),
-            "devices": room_devices
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch room devices: {str(e)}")
+    if await device_info_ref.get(shallow=True):
+        await device_info_ref.update({'roomId': None})
+        mirror.record_write(f"iotData/{device_id}/deviceInfo/roomId", None)
 
 @router.get("/stats/occupancy")
 async def get_room_occupancy_stats():
     """Get room occupancy statistics"""
     try:
-        rooms_ref = get_ref("rooms")
-        rooms = rooms_ref.get() or {}
+        rooms_ref = get_async_ref("rooms")
+        rooms = await rooms_ref.get() or {}
         
         stats = {
             'total': 0,
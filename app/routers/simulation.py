@@ -7,6 +7,9 @@ import psutil
 import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+from app.firebase_config import get_ref
+from app.async_db import run_db
+from app.timekeys import paginate
 
 logger = logging.getLogger(__name__)
 
@@ -230,28 +233,26 @@ async def get_simulation_logs():
         raise HTTPException(status_code=500, detail=f"Failed to get logs: {str(e)}")
 
 @router.get("/alerts/recent")
-async def get_recent_alerts(limit: int = Query(default=50, ge=1, le=200)):
-    """Get recent alerts generated by the simulation"""
+async def get_recent_alerts(limit: int = Query(default=50, ge=1, le=200),
+                            before: Optional[str] = None, after: Optional[str] = None):
+    """Get recent alerts generated by the simulation, newest first, paged with before/after cursors"""
     try:
-        from firebase_admin import db
+        alerts_ref = get_ref('alerts')
+        page, next_cursor = await run_db(paginate, alerts_ref, limit, before=before, after=after)
         
-        alerts_ref = db.reference('alerts')
-        alerts_data = alerts_ref.order_by_child('timestamp').limit_to_last(limit).get()
+        if not page:
+            return {"alerts": [], "count": 0, "next_cursor": None}
         
-        if not alerts_data:
-            return {"alerts": [], "count": 0}
-        
-        # Convert to list and sort by timestamp (newest first)
+        # Alerts are keyed by timestamp, so the page is already newest first
         alerts_list = []
-        for alert_id, alert_data in alerts_data.items():
+        for alert_id, alert_data in page:
             alert_data['id'] = alert_id
             alerts_list.append(alert_data)
         
-        alerts_list.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
         return {
             "alerts": alerts_list,
-            "count": len(alerts_list)
+            "count": len(alerts_list),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -262,13 +263,11 @@ async def get_recent_alerts(limit: int = Query(default=50, ge=1, le=200)):
 async def get_critical_alerts():
     """Get all critical alerts from the last 24 hours"""
     try:
-        from firebase_admin import db
-        
         # Calculate 24 hours ago timestamp
         twenty_four_hours_ago = datetime.now() - timedelta(hours=24)
         cutoff_timestamp = twenty_four_hours_ago.strftime("%Y-%m-%d_%H-%M-%S")
         
-        alerts_ref = db.reference('alerts')
+        alerts_ref = get_ref('alerts')
         alerts_data = alerts_ref.order_by_child('timestamp').start_at(cutoff_timestamp).get()
         
         if not alerts_data:
@@ -297,10 +296,8 @@ async def get_critical_alerts():
 async def get_simulation_statistics():
     """Get simulation statistics and metrics"""
     try:
-        from firebase_admin import db
-        
         # Get recent alerts for statistics
-        alerts_ref = db.reference('alerts')
+        alerts_ref = get_ref('alerts')
         alerts_data = alerts_ref.order_by_child('timestamp').limit_to_last(100).get()
         
         stats = {
@@ -370,9 +367,7 @@ async def trigger_specific_anomaly(request: TriggerAnomalyRequest):
     try:
         # This would be implemented by writing a trigger to a Firebase location
         # that the simulation script monitors
-        from firebase_admin import db
-        
-        trigger_ref = db.reference('simulation_triggers')
+        trigger_ref = get_ref('simulation_triggers')
         trigger_data = {
             'deviceId': request.deviceId,
             'anomalyType': request.anomalyType,
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional, Dict
 from datetime import datetime, date, timedelta
-from app.firebase_config import get_ref
+from app.async_db import get_async_ref
 import logging
 
 # Configure logging
@@ -16,8 +16,8 @@ router = APIRouter(prefix="/staff", tags=["Staff"])
 async def get_staff(staff_id: str):
     """Get staff member details by ID"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
@@ -35,8 +35,8 @@ async def list_staff(
 ):
     """List all staff members with optional filters"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return []
@@ -62,8 +62,8 @@ async def list_staff(
 async def create_staff(staff: dict):
     """Create a new staff member (no validation)"""
     try:
-        staff_ref = get_ref('staff')
-        new_staff_ref = staff_ref.push(staff)
+        staff_ref = get_async_ref('staff')
+        new_staff_ref = await staff_ref.push(staff)
         return {"id": new_staff_ref.key, "data": staff}
     except Exception as e:
         logger.error(f"Error creating staff: {str(e)}")
@@ -74,12 +74,12 @@ async def create_staff(staff: dict):
 async def update_staff(staff_id: str, staff: dict):
     """Update staff member details (no validation)"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        current_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        current_data = await staff_ref.get()
         if not current_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
         update_data = {k: v for k, v in staff.items() if v is not None}
-        staff_ref.update(update_data)
+        await staff_ref.update(update_data)
         return {"message": "Staff updated successfully"}
     except Exception as e:
         logger.error(f"Error updating staff: {str(e)}")
@@ -89,11 +89,11 @@ async def update_staff(staff_id: str, staff: dict):
 async def delete_staff(staff_id: str):
     """Delete a staff member"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        if not staff_ref.get():
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        if not await staff_ref.get():
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
             
-        staff_ref.delete()
+        await staff_ref.delete()
         return {"message": "Staff deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting staff: {str(e)}")
@@ -107,8 +107,8 @@ async def get_staff_schedule(
 ):
     """Get staff schedule for a date range"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
@@ -131,11 +131,11 @@ async def get_staff_schedule(
 async def update_staff_schedule(staff_id: str, date: str, shift: dict):
     """Update staff schedule for a specific date (no validation)"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        if not staff_ref.get():
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        if not await staff_ref.get():
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
         schedule_ref = staff_ref.child('schedule')
-        schedule_ref.child(date).set(shift)
+        await schedule_ref.child(date).set(shift)
         return {"message": "Schedule updated successfully"}
     except Exception as e:
         logger.error(f"Error updating staff schedule: {str(e)}")
@@ -145,8 +145,8 @@ async def update_staff_schedule(staff_id: str, date: str, shift: dict):
 async def get_staff_load():
     """Get current staff workload by department"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {}
@@ -179,8 +179,8 @@ async def get_staff_load():
 async def get_staff_patients(staff_id: str):
     """Get list of patients assigned to staff member"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
@@ -191,11 +191,11 @@ async def get_staff_patients(staff_id: str):
         patient_ids = schedule.get('patientAssignments', [])
         
         # Fetch patient details
-        patients_ref = get_ref('patients')
+        patients_ref = get_async_ref('patients')
         patients_data = {}
         
         for patient_id in patient_ids:
-            patient_data = patients_ref.child(patient_id).get()
+            patient_data = await patients_ref.child(patient_id).get()
             if patient_data:
                 patients_data[patient_id] = patient_data
                 
@@ -209,11 +209,11 @@ async def get_staff_patients(staff_id: str):
 async def update_staff_status(staff_id: str, status: dict):
     """Update staff member's current status (no validation)"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        if not staff_ref.get():
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        if not await staff_ref.get():
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
         status_ref = staff_ref.child('currentStatus')
-        status_ref.set(status)
+        await status_ref.set(status)
         return {"message": "Status updated successfully"}
     except Exception as e:
         logger.error(f"Error updating staff status: {str(e)}")
@@ -223,8 +223,8 @@ async def update_staff_status(staff_id: str, status: dict):
 async def get_staff_statistics():
     """Get comprehensive staff statistics for dashboard"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {
@@ -288,8 +288,8 @@ async def get_staff_statistics():
 async def get_on_duty_staff():
     """Get all currently on-duty staff members"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {}
@@ -308,8 +308,8 @@ async def get_on_duty_staff():
 async def get_staff_by_ward(ward_id: str):
     """Get all staff assigned to a specific ward"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {}
@@ -333,8 +333,8 @@ async def get_staff_by_ward(ward_id: str):
 async def toggle_duty_status(staff_id: str, on_duty: bool):
     """Toggle staff member's duty status"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
@@ -346,7 +346,7 @@ async def toggle_duty_status(staff_id: str, on_duty: bool):
         }
         
         status_ref = staff_ref.child('currentStatus')
-        status_ref.update(status_update)
+        await status_ref.update(status_update)
         
         return {
             "message": f"Staff duty status updated to {'on duty' if on_duty else 'off duty'}",
@@ -364,8 +364,8 @@ async def get_staff_workload_history(
 ):
     """Get staff workload history for analytics"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref(f'staff/{staff_id}')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
@@ -396,15 +396,15 @@ async def get_staff_workload_history(
 async def update_bulk_schedule(staff_id: str, schedule_data: dict):
     """Update multiple days of schedule at once"""
     try:
-        staff_ref = get_ref(f'staff/{staff_id}')
-        if not staff_ref.get():
+        staff_ref = get_async_ref(f'staff/{staff_id}', cached=False)
+        if not await staff_ref.get():
             raise HTTPException(status_code=404, detail=f"Staff member {staff_id} not found")
         
         schedule_ref = staff_ref.child('schedule')
         
         # Update multiple dates
         for date_str, shift_data in schedule_data.items():
-            schedule_ref.child(date_str).set(shift_data)
+            await schedule_ref.child(date_str).set(shift_data)
         
         return {
             "message": f"Bulk schedule updated for {len(schedule_data)} days",
@@ -419,8 +419,8 @@ async def update_bulk_schedule(staff_id: str, schedule_data: dict):
 async def get_departments():
     """Get list of all departments with staff counts"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {}
@@ -457,8 +457,8 @@ async def search_staff(
 ):
     """Search staff members by name, role, or department"""
     try:
-        staff_ref = get_ref('staff')
-        staff_data = staff_ref.get()
+        staff_ref = get_async_ref('staff')
+        staff_data = await staff_ref.get()
         
         if not staff_data:
             return {}
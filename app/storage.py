@@ -0,0 +1,493 @@
+"""
+Local storage backends for the Firebase Realtime Database reference API.
+
+`app.firebase_config.get_ref` hands out these references instead of
+`firebase_admin.db.Reference` objects when STORAGE_BACKEND is set to
+"memory" or "sqlite". They support the subset of the Admin SDK used by the
+routers (get/set/update/push/delete/child/listen and ordered queries) with the
+same semantics: null values delete nodes, empty objects do not exist,
+ordered queries come back as OrderedDicts, and {".sv": "timestamp"} /
+{".sv": {"increment": n}} server values are resolved on write.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+PATH_SEPARATOR = "/"
+
+
+def split_path(path: str) -> List[str]:
+    """Split a database path into its non-empty segments"""
+    return [segment for segment in str(path).split(PATH_SEPARATOR) if segment]
+
+
+def join_path(segments: List[str]) -> str:
+    """Join path segments back into a database path"""
+    return PATH_SEPARATOR.join(segments)
+
+
+def normalize_value(value: Any) -> Any:
+    """Round-trip a value through JSON and drop nulls and empty objects like RTDB does"""
+    if value is None:
+        return None
+    return _prune(json.loads(json.dumps(value)))
+
+
+def _prune(value: Any) -> Any:
+    if isinstance(value, dict):
+        pruned = {}
+        for key, child in value.items():
+            child = _prune(child)
+            if child is not None:
+                pruned[str(key)] = child
+        return pruned or None
+    if isinstance(value, list):
+        pruned = [_prune(child) for child in value]
+        return pruned if any(child is not None for child in pruned) else None
+    return value
+
+
+def _is_server_value(value: Any) -> bool:
+    return isinstance(value, dict) and list(value) == [".sv"]
+
+
+def _copy(value: Any) -> Any:
+    """Return a detached copy so callers never alias the stored tree"""
+    if value is None:
+        return None
+    return json.loads(json.dumps(value))
+
+
+# Firebase orders mixed-type indexes as: null < false < true < numbers < strings < objects
+_TYPE_NONE, _TYPE_FALSE, _TYPE_TRUE, _TYPE_NUMBER, _TYPE_STRING, _TYPE_OBJECT = range(6)
+
+
+def _index_key(index: Any) -> tuple:
+    if index is None:
+        return (_TYPE_NONE, 0)
+    if isinstance(index, bool):
+        return (_TYPE_TRUE if index else _TYPE_FALSE, 0)
+    if isinstance(index, (int, float)):
+        return (_TYPE_NUMBER, index)
+    if isinstance(index, str):
+        return (_TYPE_STRING, index)
+    return (_TYPE_OBJECT, 0)
+
+
+def _extract_child(value: Any, path: str) -> Any:
+    current = value
+    for segment in split_path(path):
+        if not isinstance(current, dict):
+            return None
+        current = current.get(segment)
+    return current
+
+
+class LocalEvent:
+    """Mirror of firebase_admin.db.Event for local listeners"""
+
+    def __init__(self, event_type: str, path: str, data: Any):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class LocalListenerRegistration:
+    """Handle returned by LocalReference.listen(); call close() to stop receiving events"""
+
+    def __init__(self, store: "BaseStore", segments: List[str], callback: Callable):
+        self._store = store
+        self.segments = segments
+        self.callback = callback
+
+    def close(self):
+        self._store.remove_listener(self)
+
+
+class BaseStore:
+    """Common listener bookkeeping and event fan-out for local stores"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._listeners: List[LocalListenerRegistration] = []
+
+    # Subclasses implement the tree primitives
+    def read(self, segments: List[str]) -> Any:
+        raise NotImplementedError
+
+    def write(self, segments: List[str], value: Any):
+        raise NotImplementedError
+
+    def reference(self, path: str = "/") -> "LocalReference":
+        return LocalReference(self, split_path(path))
+
+    def get(self, segments: List[str]) -> Any:
+        with self._lock:
+            return _copy(self.read(segments))
+
+    def set(self, segments: List[str], value: Any):
+        value = normalize_value(value)
+        with self._lock:
+            value = self._resolve_server_values(segments, value)
+            self.write(segments, value)
+        self._notify("put", segments, value)
+
+    def update(self, segments: List[str], values: Dict[str, Any]):
+        changes = [(segments + split_path(key), normalize_value(value)) for key, value in values.items()]
+        with self._lock:
+            changes = [(target, self._resolve_server_values(target, value)) for target, value in changes]
+            for target, value in changes:
+                self.write(target, value)
+        self._notify_update(segments, changes)
+
+    def _resolve_server_values(self, segments: List[str], value: Any) -> Any:
+        """Replace {".sv": ...} placeholders (timestamp, increment) with what RTDB would store"""
+        if _is_server_value(value):
+            spec = value[".sv"]
+            if spec == "timestamp":
+                return int(time.time() * 1000)
+            if isinstance(spec, dict) and "increment" in spec:
+                current = self.read(segments)
+                if not isinstance(current, (int, float)) or isinstance(current, bool):
+                    current = 0
+                return current + spec["increment"]
+            return value
+        if isinstance(value, dict):
+            return {key: self._resolve_server_values(segments + [key], child) for key, child in value.items()}
+        return value
+
+    def add_listener(self, segments: List[str], callback: Callable) -> LocalListenerRegistration:
+        registration = LocalListenerRegistration(self, segments, callback)
+        with self._lock:
+            self._listeners.append(registration)
+            snapshot = _copy(self.read(segments))
+        callback(LocalEvent("put", "/", snapshot))
+        return registration
+
+    def remove_listener(self, registration: LocalListenerRegistration):
+        with self._lock:
+            if registration in self._listeners:
+                self._listeners.remove(registration)
+
+    def _notify(self, event_type: str, segments: List[str], data: Any):
+        for registration, relative in self._matching_listeners(segments):
+            if relative is None:
+                # The write replaced an ancestor of the listener, resend its whole subtree
+                registration.callback(LocalEvent("put", "/", self.get(registration.segments)))
+            else:
+                registration.callback(LocalEvent(event_type, "/" + join_path(relative), _copy(data)))
+
+    def _notify_update(self, segments: List[str], changes: List[tuple]):
+        for registration, relative in self._matching_listeners(segments):
+            if relative is None:
+                listen_at = registration.segments
+                if any(target[:len(listen_at)] == listen_at or listen_at[:len(target)] == target
+                       for target, _ in changes):
+                    registration.callback(LocalEvent("put", "/", self.get(listen_at)))
+                continue
+            patch = {}
+            for target, value in changes:
+                patch[join_path(target[len(segments):])] = _copy(value)
+            registration.callback(LocalEvent("patch", "/" + join_path(relative), patch))
+
+    def _matching_listeners(self, segments: List[str]):
+        with self._lock:
+            listeners = list(self._listeners)
+        for registration in listeners:
+            listen_at = registration.segments
+            if segments[:len(listen_at)] == listen_at:
+                yield registration, segments[len(listen_at):]
+            elif listen_at[:len(segments)] == segments:
+                yield registration, None
+
+
+class MemoryStore(BaseStore):
+    """Whole database held as a nested dict in this process"""
+
+    def __init__(self, initial_data: Optional[Dict] = None):
+        super().__init__()
+        self._root: Dict[str, Any] = normalize_value(initial_data) or {}
+
+    def read(self, segments: List[str]) -> Any:
+        node: Any = self._root
+        for segment in segments:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(segment)
+            if node is None:
+                return None
+        return None if node == {} else node
+
+    def write(self, segments: List[str], value: Any):
+        if not segments:
+            self._root = value if isinstance(value, dict) else {}
+            return
+
+        parents = [self._root]
+        node = self._root
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+                node[segment] = child
+            node = child
+            parents.append(node)
+
+        if value is None:
+            node.pop(segments[-1], None)
+            # Prune parents that became empty so they read back as missing
+            for depth in range(len(segments) - 1, 0, -1):
+                if parents[depth]:
+                    break
+                parents[depth - 1].pop(segments[depth - 1], None)
+        else:
+            node[segments[-1]] = value
+
+
+class SQLiteStore(BaseStore):
+    """Database flattened into one row per leaf value in a SQLite file"""
+
+    def __init__(self, db_path: str, initial_data: Optional[Dict] = None):
+        super().__init__()
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if initial_data:
+            self.set([], initial_data)
+
+    @staticmethod
+    def _subtree_clause(path: str):
+        # '0' sorts directly after '/', so [path + '/', path + '0') spans every descendant
+        return "path = ? OR (path >= ? AND path < ?)", (path, path + "/", path + "0")
+
+    def read(self, segments: List[str]) -> Any:
+        path = join_path(segments)
+        if path:
+            clause, params = self._subtree_clause(path)
+            rows = self._conn.execute(f"SELECT path, value FROM nodes WHERE {clause}", params).fetchall()
+        else:
+            rows = self._conn.execute("SELECT path, value FROM nodes").fetchall()
+
+        result: Any = None
+        for row_path, raw in rows:
+            relative = split_path(row_path)[len(segments):]
+            value = json.loads(raw)
+            if not relative:
+                return value
+            if result is None:
+                result = {}
+            node = result
+            for segment in relative[:-1]:
+                node = node.setdefault(segment, {})
+            node[relative[-1]] = value
+        return result
+
+    def write(self, segments: List[str], value: Any):
+        path = join_path(segments)
+        self._conn.execute("BEGIN")
+        try:
+            if path:
+                clause, params = self._subtree_clause(path)
+                self._conn.execute(f"DELETE FROM nodes WHERE {clause}", params)
+                # A leaf stored at an ancestor would shadow the new subtree
+                ancestors = [join_path(segments[:depth]) for depth in range(1, len(segments))]
+                if ancestors:
+                    placeholders = ",".join("?" * len(ancestors))
+                    self._conn.execute(f"DELETE FROM nodes WHERE path IN ({placeholders})", ancestors)
+            else:
+                self._conn.execute("DELETE FROM nodes")
+            if value is not None:
+                self._conn.executemany(
+                    "INSERT INTO nodes (path, value) VALUES (?, ?)",
+                    list(self._flatten(segments, value)),
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _flatten(self, segments: List[str], value: Any):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                yield from self._flatten(segments + [key], child)
+        else:
+            yield join_path(segments), json.dumps(value)
+
+
+class LocalReference:
+    """Drop-in stand-in for firebase_admin.db.Reference backed by a local store"""
+
+    def __init__(self, store: BaseStore, segments: List[str]):
+        self._store = store
+        self._segments = segments
+
+    @property
+    def key(self) -> Optional[str]:
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self) -> str:
+        return "/" + join_path(self._segments)
+
+    @property
+    def parent(self) -> Optional["LocalReference"]:
+        if not self._segments:
+            return None
+        return LocalReference(self._store, self._segments[:-1])
+
+    def child(self, path: str) -> "LocalReference":
+        return LocalReference(self._store, self._segments + split_path(path))
+
+    def get(self, etag: bool = False, shallow: bool = False):
+        value = self._store.get(self._segments)
+        if shallow and isinstance(value, dict):
+            value = {key: True for key in value}
+        if etag:
+            return value, str(hash(json.dumps(value, sort_keys=True)))
+        return value
+
+    def set(self, value: Any):
+        if value is None:
+            raise ValueError("Value must not be None.")
+        self._store.set(self._segments, value)
+
+    def update(self, value: Dict[str, Any]):
+        if not value or not isinstance(value, dict):
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        if None in value.keys():
+            raise ValueError("Dictionary must not contain None keys.")
+        self._store.update(self._segments, value)
+
+    def push(self, value: Any = "") -> "LocalReference":
+        if value is None:
+            raise ValueError("Value must not be None.")
+        # Time-prefixed ids keep pushed children in insertion order, like RTDB push ids
+        push_id = f"-{time.time_ns():020d}{uuid.uuid4().hex[:8]}"
+        new_ref = self.child(push_id)
+        new_ref.set(value)
+        return new_ref
+
+    def delete(self):
+        self._store.set(self._segments, None)
+
+    def transaction(self, transaction_update: Callable[[Any], Any]) -> Any:
+        with self._store._lock:
+            new_value = transaction_update(self._store.get(self._segments))
+            self._store.set(self._segments, new_value)
+        return new_value
+
+    def listen(self, callback: Callable[[LocalEvent], None]) -> LocalListenerRegistration:
+        return self._store.add_listener(self._segments, callback)
+
+    def order_by_child(self, path: str) -> "LocalQuery":
+        if not path or path.startswith("$"):
+            raise ValueError(f'Illegal child path: "{path}"')
+        return LocalQuery(self, path)
+
+    def order_by_key(self) -> "LocalQuery":
+        return LocalQuery(self, "$key")
+
+    def order_by_value(self) -> "LocalQuery":
+        return LocalQuery(self, "$value")
+
+
+class LocalQuery:
+    """Ordered, range-filtered and limited read of a LocalReference"""
+
+    def __init__(self, ref: LocalReference, order_by: str):
+        self._ref = ref
+        self._order_by = order_by
+        self._start = None
+        self._end = None
+        self._limit_first: Optional[int] = None
+        self._limit_last: Optional[int] = None
+
+    def limit_to_first(self, limit: int) -> "LocalQuery":
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError("Limit must be a non-negative integer.")
+        if self._limit_last is not None:
+            raise ValueError("Cannot set both first and last limits.")
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit: int) -> "LocalQuery":
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError("Limit must be a non-negative integer.")
+        if self._limit_first is not None:
+            raise ValueError("Cannot set both first and last limits.")
+        self._limit_last = limit
+        return self
+
+    def start_at(self, start: Any) -> "LocalQuery":
+        if start is None:
+            raise ValueError("Start value must not be None.")
+        self._start = _index_key(start)
+        return self
+
+    def end_at(self, end: Any) -> "LocalQuery":
+        if end is None:
+            raise ValueError("End value must not be None.")
+        self._end = _index_key(end)
+        return self
+
+    def equal_to(self, value: Any) -> "LocalQuery":
+        if value is None:
+            raise ValueError("Equal to value must not be None.")
+        self._start = self._end = _index_key(value)
+        return self
+
+    def _index(self, key: str, value: Any) -> Any:
+        if self._order_by == "$key":
+            return key
+        if self._order_by == "$value":
+            return value
+        return _extract_child(value, self._order_by)
+
+    def get(self):
+        data = self._ref.get()
+        if isinstance(data, list):
+            data = {str(position): item for position, item in enumerate(data) if item is not None}
+        if not isinstance(data, dict):
+            return data
+
+        entries = []
+        for key, value in data.items():
+            index_key = _index_key(self._index(key, value))
+            if self._start is not None and index_key < self._start:
+                continue
+            if self._end is not None and index_key > self._end:
+                continue
+            entries.append((index_key, key, value))
+
+        # Same-typed numeric/string indexes compare by value; everything else ties on key
+        entries.sort(key=lambda entry: (entry[0][0], entry[0][1] if entry[0][0] in (_TYPE_NUMBER, _TYPE_STRING) else 0, entry[1]))
+        if self._limit_first is not None:
+            entries = entries[:self._limit_first]
+        elif self._limit_last is not None:
+            entries = entries[-self._limit_last:] if self._limit_last else []
+        return collections.OrderedDict((key, value) for _, key, value in entries)
+
+
+def create_store(backend: str, seed_path: Optional[str] = None) -> BaseStore:
+    """Build the local store selected by STORAGE_BACKEND, optionally seeded from a JSON export"""
+    initial_data = None
+    if seed_path:
+        with open(seed_path, "r", encoding="utf-8") as seed_file:
+            initial_data = json.load(seed_file)
+
+    if backend == "memory":
+        return MemoryStore(initial_data)
+    if backend == "sqlite":
+        db_path = os.getenv("LOCAL_DB_PATH", "local_db.sqlite3")
+        return SQLiteStore(db_path, initial_data)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'. Use 'firebase', 'memory' or 'sqlite'.")
@@ -0,0 +1,194 @@
+"""
+Sortable timestamp keys for time-series children (vitals, alerts, anomalies).
+
+New keys are epoch milliseconds zero-padded to KEY_WIDTH digits, e.g.
+"001760642687264". Fixed width makes lexicographic key order equal time
+order, so windows can be read with order_by_key().start_at().end_at()
+instead of downloading a whole subtree and parsing every key. unique_key adds
+a random tail ("001760642687264-9f1c2a7b") for collections that several
+writers append to in the same millisecond; it still sorts by time.
+
+Older data is keyed by sanitized ISO strings (2025-01-31T14-05-09-123456) or
+"%Y-%m-%d_%H-%M-%S". decode_key understands all three, and the query helpers
+below also read the legacy key range (legacy keys start with the year, so
+they always sort after the zero-padded ones) until old data has aged out.
+paginate() pages through a collection newest-first with before/after key
+cursors, one bounded key query at a time.
+"""
+
+import re
+import secrets
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+KEY_WIDTH = 15
+
+# Every epoch-millis key sorts inside [KEY_MIN, KEY_MAX]; legacy keys sort after it
+KEY_MIN = "0" * KEY_WIDTH
+KEY_MAX = "0" + "9" * (KEY_WIDTH - 1)
+
+# Matches sanitized ISO keys (2025-01-31T14-05-09-123456) and 2025-01-31_14-05-09
+_LEGACY_KEY = re.compile(r"^(\d{4}-\d{2}-\d{2})[T_ ](\d{2})-(\d{2})-(\d{2})(?:-(\d{1,6}))?")
+# High code point that sorts after any legacy key sharing its date prefix
+_LEGACY_END = "\uf8ff"
+
+
+def encode_key(moment: Union[datetime, str, None] = None) -> str:
+    """Key for a moment (datetime or ISO string, default now)"""
+    if moment is None:
+        moment = datetime.now()
+    elif isinstance(moment, str):
+        moment = datetime.fromisoformat(moment.replace("Z", "+00:00"))
+    return f"{int(round(moment.timestamp() * 1000)):0{KEY_WIDTH}d}"
+
+
+def unique_key(moment: Union[datetime, str, None] = None) -> str:
+    """encode_key with a random tail, so concurrent writers never reuse a key"""
+    return f"{encode_key(moment)}-{secrets.token_hex(4)}"
+
+
+def decode_key(key: Any) -> Optional[datetime]:
+    """Datetime a key stands for (new, unique or legacy format), or None if it is not a timestamp key"""
+    key = str(key)
+    millis = key[:KEY_WIDTH]
+    if millis.isdigit() and len(millis) == KEY_WIDTH and key[KEY_WIDTH:KEY_WIDTH + 1] in ("", "-"):
+        return datetime.fromtimestamp(int(millis) / 1000)
+    match = _LEGACY_KEY.match(key)
+    if not match:
+        return None
+    day, hour, minute, second, fraction = match.groups()
+    parsed = datetime.strptime(f"{day} {hour}:{minute}:{second}", "%Y-%m-%d %H:%M:%S")
+    if fraction:
+        parsed = parsed.replace(microsecond=int(fraction.ljust(6, "0")))
+    return parsed
+
+
+def key_order(key: Any) -> Tuple[float, str]:
+    """Sort key putting new and legacy keys in time order (non-timestamp keys first)"""
+    moment = decode_key(key)
+    return (moment.timestamp() if moment else float("-inf"), str(key))
+
+
+def latest_key(keys) -> Optional[str]:
+    keys = list(keys)
+    return max(keys, key=key_order) if keys else None
+
+
+def read_window(ref, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Children of ref keyed inside [start, end], oldest first, read with key-range queries"""
+    start_key = encode_key(start) if start else KEY_MIN
+    # Unique keys in the last millisecond sort after its plain key
+    end_key = encode_key(end) + _LEGACY_END if end else KEY_MAX
+    window = dict(ref.order_by_key().start_at(start_key).end_at(end_key).get() or {})
+
+    # Legacy keys: day-granular key range, then exact filtering on the decoded time
+    legacy_start = start.strftime("%Y-%m-%d") if start else "1"
+    legacy_end = end.strftime("%Y-%m-%d") + _LEGACY_END if end else _LEGACY_END
+    legacy = ref.order_by_key().start_at(legacy_start).end_at(legacy_end).get() or {}
+    for key, value in legacy.items():
+        moment = decode_key(key)
+        if moment is None or (start and moment < start) or (end and moment > end):
+            continue
+        window[key] = value
+
+    return dict(sorted(window.items(), key=lambda item: key_order(item[0])))
+
+
+def read_last(ref, count: int) -> List[Tuple[str, Any]]:
+    """The newest `count` children of ref as (key, value) pairs, newest first"""
+    if count <= 0:
+        return []
+    newest = ref.order_by_key().start_at(KEY_MIN).end_at(KEY_MAX).limit_to_last(count).get() or {}
+    items = sorted(newest.items(), key=lambda item: key_order(item[0]), reverse=True)
+    if len(items) < count:
+        # Legacy keys are all older than epoch-millis ones, so they only fill the remainder
+        legacy = ref.order_by_key().start_at("1").end_at(_LEGACY_END).limit_to_last(count - len(items)).get() or {}
+        items.extend(sorted(legacy.items(), key=lambda item: key_order(item[0]), reverse=True))
+    return items
+
+
+# Key ranges holding timestamp keys, newest first: epoch-millis keys, then legacy keys
+_SEGMENTS = ((KEY_MIN, KEY_MAX), ("1", _LEGACY_END))
+
+
+def _segment_of(key: str) -> int:
+    return 0 if KEY_MIN <= key <= KEY_MAX else 1
+
+
+def _iter_children(ref, cursor: Optional[str], newer: bool, page_size: int):
+    """Yield children strictly before (or, if newer, after) cursor in time order, page by page"""
+    order = [1, 0] if newer else [0, 1]
+    if cursor is not None:
+        order = order[order.index(_segment_of(cursor)):]
+    for index in order:
+        low, high = _SEGMENTS[index]
+        bound = cursor if cursor is not None and index == _segment_of(cursor) else None
+        while True:
+            fetch = page_size + (1 if bound is not None else 0)
+            query = ref.order_by_key()
+            if newer:
+                query = query.start_at(bound if bound is not None else low).end_at(high).limit_to_first(fetch)
+            else:
+                query = query.start_at(low).end_at(bound if bound is not None else high).limit_to_last(fetch)
+            batch = sorted(((key, value) for key, value in (query.get() or {}).items() if key != bound),
+                           key=lambda item: item[0], reverse=not newer)
+            yield from batch
+            if len(batch) < page_size:
+                break
+            bound = batch[-1][0]
+
+
+def paginate(ref, limit: int, before: Optional[str] = None, after: Optional[str] = None,
+             since: Optional[datetime] = None, accept: Optional[Callable[[Any], bool]] = None
+             ) -> Tuple[List[Tuple[str, Any]], Optional[str]]:
+    """
+    One page of timestamp-keyed children of ref, newest first, plus the cursor for the next page.
+
+    Without a cursor the page holds the newest `limit` children; `before` pages back
+    into older children and `after` pages forward to newer ones. next_cursor is the
+    key to pass back in the same parameter, or None when there is nothing further.
+    `since` drops children older than a moment and `accept` filters on the value.
+    """
+    newer = after is not None
+    items = []
+    for key, value in _iter_children(ref, after if newer else before, newer, limit + 1):
+        if since is not None:
+            moment = decode_key(key)
+            if moment is None or moment < since:
+                if moment is not None and not newer:
+                    break
+                continue
+        if accept is not None and not accept(value):
+            continue
+        items.append((key, value))
+        if len(items) > limit:
+            break
+    return _finish_page(items, limit, newer)
+
+
+def paginate_items(children: Dict[str, Any], limit: int, before: Optional[str] = None, after: Optional[str] = None,
+                   since: Optional[datetime] = None) -> Tuple[List[Tuple[str, Any]], Optional[str]]:
+    """paginate() over children already in memory, with the same cursor semantics"""
+    newer = after is not None
+    cursor = after if newer else before
+    ordered = sorted(children.items(), key=lambda item: key_order(item[0]), reverse=not newer)
+    items = []
+    for key, value in ordered:
+        if cursor is not None and (key_order(key) <= key_order(cursor) if newer else key_order(key) >= key_order(cursor)):
+            continue
+        if since is not None:
+            moment = decode_key(key)
+            if moment is None or moment < since:
+                continue
+        items.append((key, value))
+        if len(items) > limit:
+            break
+    return _finish_page(items, limit, newer)
+
+
+def _finish_page(items: List[Tuple[str, Any]], limit: int, newer: bool):
+    next_cursor = items[limit - 1][0] if len(items) > limit and limit > 0 else None
+    items = items[:limit]
+    if newer:
+        items.reverse()
+    return items, next_cursor
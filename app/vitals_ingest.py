@@ -0,0 +1,141 @@
+"""
+Shared ingestion path for device readings.
+
+POST /iotData/vitals:batch and the streaming channels in app/routers/realtime.py
+all validate and persist readings through `ingest_readings`, so a reading is
+accepted or rejected by the same rules whichever way it arrives. Device
+assignments come from the iotData mirror, and every accepted reading of a call
+is written with a single root multi-path update.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.firebase_config import get_ref
+from app.iot_mirror import ENV_SENSOR_TYPE, mirror
+from app.timekeys import KEY_WIDTH, encode_key, key_order
+from app.vitals_store import vitals_write_paths
+from app.vitals_trends import trends
+
+ENV_REQUIRED_FIELDS = ["temperature", "humidity", "airQuality", "lightLevel",
+                       "noiseLevel", "pressure", "co2Level"]
+
+
+class VitalsReading(BaseModel):
+    deviceId: str
+    data: Dict[str, Any]
+    patientId: Optional[str] = None
+    timestamp: Optional[str] = None
+
+
+def _validate(reading: VitalsReading, device_info: Optional[Dict]) -> Optional[str]:
+    """Reason a reading cannot be stored, or None if it is valid"""
+    if not device_info:
+        return "Device not found"
+    if reading.timestamp:
+        try:
+            datetime.fromisoformat(reading.timestamp.replace("Z", "+00:00"))
+        except ValueError:
+            return f"Invalid timestamp: {reading.timestamp}"
+    if device_info.get("type") == ENV_SENSOR_TYPE:
+        missing_fields = [field for field in ENV_REQUIRED_FIELDS if field not in reading.data]
+        if missing_fields:
+            return f"Missing required environmental fields: {', '.join(missing_fields)}"
+        return None
+    current_patient_id = device_info.get("currentPatientId")
+    if not current_patient_id:
+        return "No patient assigned to this monitor. Cannot store vitals."
+    if reading.patientId and reading.patientId != current_patient_id:
+        return "Patient is not currently assigned to this device"
+    return None
+
+
+def ingest_readings(readings: List[VitalsReading]) -> List[Dict[str, Any]]:
+    """Validate and store readings with one multi-path update; returns a result per reading"""
+    updates = {}
+    results = []
+    device_infos = {}
+    used_keys = set()
+    newest_pointers = {}
+
+    env_readings = []
+    monitor_readings = []
+
+    for index, reading in enumerate(readings):
+        device_id = reading.deviceId
+
+        # Assignments come from the iotData mirror, read once per device per call
+        if device_id not in device_infos:
+            device_infos[device_id] = mirror.device_info(device_id)
+        device_info = device_infos[device_id]
+
+        error = _validate(reading, device_info)
+        if error is not None:
+            results.append({"index": index, "deviceId": device_id, "status": "rejected", "error": error})
+            continue
+
+        moment = datetime.fromisoformat(reading.timestamp.replace("Z", "+00:00")) if reading.timestamp else datetime.now()
+
+        # Readings of one device in the same millisecond get consecutive keys
+        timestamp = encode_key(moment)
+        while (device_id, timestamp) in used_keys:
+            timestamp = f"{int(timestamp) + 1:0{KEY_WIDTH}d}"
+        used_keys.add((device_id, timestamp))
+
+        if device_info.get("type") == ENV_SENSOR_TYPE:
+            environmental_data = {
+                **reading.data,
+                "deviceStatus": reading.data.get("deviceStatus", "online"),
+                "batteryLevel": reading.data.get("batteryLevel", 90),
+                "signalStrength": reading.data.get("signalStrength", 95),
+                "timestamp": moment.isoformat()
+            }
+            updates[f"iotData/{device_id}/vitals/{timestamp}"] = environmental_data
+            env_readings.append((device_id, device_info.get("roomId"), timestamp, environmental_data))
+            results.append({"index": index, "deviceId": device_id, "status": "stored", "timestamp": timestamp})
+            continue
+
+        patient_id = device_info["currentPatientId"]
+        paths = vitals_write_paths(device_id, patient_id, timestamp, reading.data)
+        pointer_path = f"iotData/{device_id}/latestVitals/{patient_id}"
+        pointer = paths.pop(pointer_path)
+        updates.update(paths)
+
+        # Only the newest reading per patient may move the latestVitals pointer
+        current = newest_pointers.get(pointer_path)
+        if current is None or key_order(timestamp) >= key_order(current[0]):
+            newest_pointers[pointer_path] = (timestamp, pointer, device_id, patient_id)
+
+        monitor_readings.append((device_id, patient_id, timestamp, reading.data))
+        results.append({"index": index, "deviceId": device_id, "status": "stored",
+                        "timestamp": timestamp, "patientId": patient_id})
+
+    # Devices may backfill older readings; keep a newer stored pointer in place
+    for pointer_path, (timestamp, pointer, device_id, patient_id) in newest_pointers.items():
+        stored_timestamp, _ = mirror.latest_vitals(device_id, patient_id)
+        if stored_timestamp is None or key_order(timestamp) >= key_order(stored_timestamp):
+            updates[pointer_path] = pointer
+
+    if updates:
+        get_ref("/").update(updates)
+
+    # Rolling trends take readings oldest first
+    for device_id, patient_id, timestamp, data in sorted(monitor_readings, key=lambda item: key_order(item[2])):
+        trends.record(device_id, patient_id, timestamp, data)
+
+    # Keep each room's latest environment current for anomaly feature assembly
+    for device_id, room_id, timestamp, environmental_data in env_readings:
+        mirror.record_env_reading(device_id, room_id, timestamp, environmental_data)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stored = sum(1 for result in results if result["status"] == "stored")
+    return {
+        "message": f"Stored {stored} of {len(results)} readings",
+        "stored": stored,
+        "rejected": len(results) - stored,
+        "results": results
+    }
@@ -5,9 +5,15 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import threading
 import logging
-import re
 from firebase_admin import db
 
+try:
+    from app.timekeys import encode_key
+    from app.vitals_store import vitals_write_paths
+except ImportError:
+    from timekeys import encode_key
+    from vitals_store import vitals_write_paths
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -447,14 +453,6 @@ class VitalsSimulator:
         
         return vitals
 
-    def sanitize_timestamp(self, timestamp: str) -> str:
-        """Convert ISO timestamp to a Firebase-safe string"""
-        # Replace colons, periods, and other invalid characters
-        sanitized = re.sub(r'[.:]', '-', timestamp)
-        # Remove any other invalid characters for Firebase paths
-        sanitized = re.sub(r'[#\$\[\]]', '', sanitized)
-        return sanitized
-    
     def generate_patient_vitals(self, patient_id: str) -> Optional[Dict]:
         """Generate realistic vitals for a patient"""
         patient = self.patients.get(patient_id)
@@ -688,7 +686,7 @@ class VitalsSimulator:
         """Post vitals data to Firebase with patient-based organization"""
         try:
             # Get current timestamp
-            timestamp = self.sanitize_timestamp(datetime.now().isoformat())
+            timestamp = encode_key()
             
             # Get patient ID from vitals data
             patient_id = vitals_data.get('patientId')
@@ -704,9 +702,9 @@ class VitalsSimulator:
                 logger.warning(f"Patient {patient_id} is not currently assigned to device {device_id}. Skipping vitals storage.")
                 return False
             
-            # Store vitals using the new structure: vitals[patient_id][timestamp] = vital_record
-            vitals_ref = db.reference(f'iotData/{device_id}/vitals/{patient_id}/{timestamp}')
-            vitals_ref.set(vitals_data)
+            # Store vitals in the hour bucket, the latestVitals pointer and the
+            # legacy vitals[patient_id][timestamp] map with one multi-path update
+            db.reference('/').update(vitals_write_paths(device_id, patient_id, timestamp, vitals_data))
             
             logger.info(f"✓ Successfully posted vitals for {device_id} (Patient: {patient_id})")
             return True
@@ -0,0 +1,110 @@
+"""
+Storage layout for patient monitor vitals.
+
+Each reading is written in one multi-path update to:
+
+- vitalsHistory/{device}/{patient}/{YYYY-MM-DD}/{HH}/{timestamp}  hour buckets for range reads
+- iotData/{device}/latestVitals/{patient}                        {"timestamp", "data"} pointer
+- iotData/{device}/vitals/{patient}/{timestamp}                  legacy flat map (VITALS_LEGACY_WRITE)
+
+The history lives outside iotData so reading device info no longer drags the
+full vitals history along. The legacy flat map keeps existing readers and
+clients working until they move over; set VITALS_LEGACY_WRITE=false once
+they have, and run migrate_vitals_layout.py to bucket data written before.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from app.firebase_config import get_ref
+    from app.timekeys import decode_key, read_last, read_window
+except ImportError:
+    # Scripts that put app/ on sys.path import modules top-level
+    from firebase_config import get_ref
+    from timekeys import decode_key, read_last, read_window
+
+VITALS_HISTORY_ROOT = "vitalsHistory"
+VITALS_LEGACY_WRITE = os.getenv("VITALS_LEGACY_WRITE", "true").lower() in ("1", "true", "yes")
+
+
+def bucket_for_key(timestamp_key: str) -> Optional[Tuple[str, str]]:
+    """(day, hour) bucket a timestamp key belongs to"""
+    moment = decode_key(timestamp_key)
+    if moment is None:
+        return None
+    return moment.strftime("%Y-%m-%d"), moment.strftime("%H")
+
+
+def history_path(device_id: str, patient_id: str, day: Optional[str] = None, hour: Optional[str] = None) -> str:
+    path = f"{VITALS_HISTORY_ROOT}/{device_id}/{patient_id}"
+    if day is not None:
+        path = f"{path}/{day}"
+        if hour is not None:
+            path = f"{path}/{hour}"
+    return path
+
+
+def vitals_write_paths(device_id: str, patient_id: str, timestamp_key: str, record: Dict[str, Any],
+                       legacy: bool = VITALS_LEGACY_WRITE) -> Dict[str, Any]:
+    """Root-relative multi-path update that stores one reading in every layout"""
+    updates = {
+        f"iotData/{device_id}/latestVitals/{patient_id}": {"timestamp": timestamp_key, "data": record},
+    }
+    bucket = bucket_for_key(timestamp_key)
+    if bucket:
+        day, hour = bucket
+        updates[f"{history_path(device_id, patient_id, day, hour)}/{timestamp_key}"] = record
+    if legacy or not bucket:
+        updates[f"iotData/{device_id}/vitals/{patient_id}/{timestamp_key}"] = record
+    return updates
+
+
+def write_vitals(device_id: str, patient_id: str, timestamp_key: str, record: Dict[str, Any], root_ref=None):
+    """Store one reading atomically; root_ref lets callers pass their own root reference"""
+    updates = vitals_write_paths(device_id, patient_id, timestamp_key, record)
+    (root_ref if root_ref is not None else get_ref("/")).update(updates)
+    return updates
+
+
+def read_latest(device_id: str, patient_id: str) -> Tuple[Optional[str], Optional[Dict]]:
+    """Latest reading from the latestVitals pointer, falling back to the legacy map"""
+    pointer = get_ref(f"iotData/{device_id}/latestVitals/{patient_id}").get()
+    if isinstance(pointer, dict) and pointer.get("timestamp"):
+        return pointer["timestamp"], pointer.get("data")
+    legacy = read_last(get_ref(f"iotData/{device_id}/vitals/{patient_id}"), 1)
+    if legacy:
+        return legacy[0]
+    return None, None
+
+
+def read_range(device_id: str, patient_id: str, start: datetime, end: Optional[datetime] = None) -> List[Tuple[str, Dict]]:
+    """Readings between start and end (inclusive), oldest first, reading only the hour buckets involved"""
+    end = end or datetime.now()
+    readings = {}
+
+    # One ranged query per day touched by the window
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end:
+        day_key = day.strftime("%Y-%m-%d")
+        first_hour = start.strftime("%H") if day.date() == start.date() else "00"
+        last_hour = end.strftime("%H") if day.date() == end.date() else "23"
+        hours = get_ref(history_path(device_id, patient_id, day_key)) \
+            .order_by_key().start_at(first_hour).end_at(last_hour).get() or {}
+        for bucket in hours.values():
+            if isinstance(bucket, dict):
+                readings.update(bucket)
+        day += timedelta(days=1)
+
+    if not readings and not get_ref(history_path(device_id, patient_id)).get(shallow=True):
+        # Not migrated yet: range-read the legacy flat map instead
+        readings = read_window(get_ref(f"iotData/{device_id}/vitals/{patient_id}"), start, end)
+
+    in_range = []
+    for timestamp_key, record in readings.items():
+        parsed = decode_key(timestamp_key)
+        if parsed is not None and start <= parsed <= end:
+            in_range.append((timestamp_key, record))
+    in_range.sort(key=lambda item: item[0])
+    return in_range
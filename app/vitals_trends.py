@@ -0,0 +1,282 @@
+"""
+Incremental rolling trend features per patient.
+
+Every stored monitor reading is pushed into its patient's `TrendState`: a
+fixed-size ring buffer of the last max(TREND_WINDOWS) readings plus running
+sums per window and field (count, Σx, Σx², Σy, Σy², Σxy with x = seconds).
+A field missing from a reading is left out of that field's sums and EWMA, so
+each field's statistics cover only the readings that measured it. Adding a
+reading updates the EWMA and every window's sums in O(windows × fields),
+independent of history length; mean, standard deviation and least-squares
+slope per window are read straight off the sums. The sums are rebuilt from
+the buffer once per buffer length to shed floating point drift, which keeps
+the amortized cost per reading O(1).
+
+Readings written by this process are recorded as they are stored. Readings
+written elsewhere (e.g. the simulator processes) are caught up when a
+patient's trends are read: the iotData mirror says whether a newer reading
+exists and only the readings after the last one seen are read.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.iot_mirror import mirror
+from app.timekeys import decode_key, key_order
+from app.vitals_store import read_range
+
+logger = logging.getLogger(__name__)
+
+# Window lengths in readings; the largest one sets the ring buffer size
+TREND_WINDOWS = sorted({int(window) for window in os.getenv("TREND_WINDOWS", "5,20,60").split(",") if window.strip()})
+TREND_EWMA_ALPHA = float(os.getenv("TREND_EWMA_ALPHA", "0.3"))
+# History read the first time a patient's trends are needed
+TREND_BOOTSTRAP_HOURS = float(os.getenv("TREND_BOOTSTRAP_HOURS", "1"))
+
+# Tracked series, named like the anomaly model's features
+TREND_FIELDS = ("heart_rate", "systolic_bp", "diastolic_bp", "oxygen_level",
+                "respiratory_rate", "temperature", "glucose")
+
+_FIELD_SOURCES = {
+    "heart_rate": "heartRate",
+    "oxygen_level": "oxygenLevel",
+    "respiratory_rate": "respiratoryRate",
+    "temperature": "temperature",
+    "glucose": "glucose",
+}
+
+
+def reading_values(vitals: Dict) -> np.ndarray:
+    """Tracked values of one reading in TREND_FIELDS order (NaN where missing)"""
+    values = np.full(len(TREND_FIELDS), np.nan)
+    for position, field in enumerate(TREND_FIELDS):
+        if field in _FIELD_SOURCES:
+            value = vitals.get(_FIELD_SOURCES[field])
+        else:
+            blood_pressure = vitals.get("bloodPressure")
+            side = "systolic" if field == "systolic_bp" else "diastolic"
+            value = blood_pressure.get(side) if isinstance(blood_pressure, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[position] = float(value)
+    return values
+
+
+def _value(number: float) -> Optional[float]:
+    return None if not np.isfinite(number) else round(float(number), 4)
+
+
+class TrendState:
+    """Ring buffer and running window sums for one patient"""
+
+    def __init__(self, windows: List[int] = TREND_WINDOWS, alpha: float = TREND_EWMA_ALPHA):
+        self.windows = list(windows)
+        self.window_sizes = np.array(self.windows, dtype=np.float64)
+        self._window_slots = np.array(self.windows, dtype=np.intp)
+        self.alpha = alpha
+        self.capacity = max(self.windows)
+        n_windows, n_fields = len(self.windows), len(TREND_FIELDS)
+
+        self.values = np.zeros((self.capacity, n_fields))
+        self.times = np.zeros(self.capacity)
+        self.head = 0
+        self.count = 0
+        self.device_id: Optional[str] = None
+        self.last_key: Optional[str] = None
+        self.last = np.full(n_fields, np.nan)
+        self.ewma = np.full(n_fields, np.nan)
+
+        # x is seconds after base_time and y is the value minus a per-field offset,
+        # both re-based on every rebuild so Σy² - (Σy)²/n does not cancel away the variance.
+        # n counts the readings in each window; the other sums only cover readings
+        # where the field is present, so they are kept per window and field
+        self.base_time = 0.0
+        self.offset = np.full(n_fields, np.nan)
+        self.n = np.zeros(n_windows)
+        self.ny = np.zeros((n_windows, n_fields))
+        self.sx = np.zeros((n_windows, n_fields))
+        self.sxx = np.zeros((n_windows, n_fields))
+        self.sy = np.zeros((n_windows, n_fields))
+        self.syy = np.zeros((n_windows, n_fields))
+        self.sxy = np.zeros((n_windows, n_fields))
+        self.updates_since_rebuild = 0
+
+    def add(self, seconds: float, values: np.ndarray):
+        """Push one reading (epoch seconds, values in TREND_FIELDS order, NaN where missing)"""
+        if self.count == 0:
+            self.base_time = seconds
+        x = seconds - self.base_time
+        present = ~np.isnan(values)
+        # A field seen for the first time since the last rebuild has no sums yet
+        self.offset = np.where(np.isnan(self.offset), values, self.offset)
+        y = np.where(present, values - self.offset, 0.0)
+        xs = np.where(present, x, 0.0)
+
+        # Windows already full drop their oldest reading; its slot is read before being overwritten
+        full = self.n == self.window_sizes
+        slots = (self.head - self._window_slots) % self.capacity
+        old_values = self.values[slots]
+        old_present = full[:, None] & ~np.isnan(old_values)
+        old_y = np.where(old_present, old_values - self.offset, 0.0)
+        old_xs = np.where(old_present, (self.times[slots] - self.base_time)[:, None], 0.0)
+        self.n += ~full
+        self.ny += present.astype(np.float64) - old_present
+        self.sx += xs - old_xs
+        self.sxx += xs * xs - old_xs * old_xs
+        self.sy += y - old_y
+        self.syy += y * y - old_y * old_y
+        self.sxy += xs * y - old_xs * old_y
+
+        self.values[self.head] = values
+        self.times[self.head] = seconds
+        self.head = (self.head + 1) % self.capacity
+        self.count += 1
+        # last and ewma keep their previous value for a missing field
+        self.last = np.where(present, values, self.last)
+        self.ewma = np.where(~present, self.ewma,
+                             np.where(np.isnan(self.ewma), values, self.alpha * values + (1 - self.alpha) * self.ewma))
+
+        self.updates_since_rebuild += 1
+        if self.updates_since_rebuild >= self.capacity:
+            self._rebuild()
+
+    def _rebuild(self):
+        """Recompute every window's sums from the buffer (once per capacity updates)"""
+        retained = min(self.count, self.capacity)
+        order = (self.head - retained + np.arange(retained)) % self.capacity
+        times, values = self.times[order], self.values[order]
+        self.base_time = float(times[0]) if retained else 0.0
+        # Offset each field by its oldest retained value (NaN while the buffer has none)
+        measured = ~np.isnan(values)
+        oldest = values[measured.argmax(axis=0), np.arange(values.shape[1])] if retained else np.nan
+        self.offset = np.where(measured.any(axis=0), oldest, np.nan)
+        for i, window in enumerate(self.windows):
+            present = ~np.isnan(values[-window:])
+            y = np.where(present, values[-window:] - self.offset, 0.0)
+            x = np.where(present, (times[-window:] - self.base_time)[:, None], 0.0)
+            self.n[i] = len(y)
+            self.ny[i] = present.sum(axis=0)
+            self.sx[i] = x.sum(axis=0)
+            self.sxx[i] = (x * x).sum(axis=0)
+            self.sy[i] = y.sum(axis=0)
+            self.syy[i] = (y * y).sum(axis=0)
+            self.sxy[i] = (x * y).sum(axis=0)
+        self.updates_since_rebuild = 0
+
+    def window_stats(self, i: int):
+        """(mean, std, slope per minute) arrays for window i; NaN where a field has too few readings"""
+        n = self.ny[i]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shifted_mean = self.sy[i] / n
+            mean = np.where(n > 0, self.offset + shifted_mean, np.nan)
+            variance = np.where(n > 1, np.maximum(self.syy[i] / n - shifted_mean * shifted_mean, 0.0), 0.0)
+            std = np.where(n > 0, np.sqrt(variance), np.nan)
+            denominator = n * self.sxx[i] - self.sx[i] ** 2
+            slope = np.where((n >= 2) & (denominator > 1e-9),
+                             (n * self.sxy[i] - self.sx[i] * self.sy[i]) / denominator * 60, np.nan)
+        return mean, std, slope
+
+    def snapshot(self) -> Dict[str, Any]:
+        fields = {field: {"last": _value(self.last[f]), "ewma": _value(self.ewma[f]), "windows": {}}
+                  for f, field in enumerate(TREND_FIELDS)}
+        for i, window in enumerate(self.windows):
+            mean, std, slope = self.window_stats(i)
+            for f, field in enumerate(TREND_FIELDS):
+                fields[field]["windows"][str(window)] = {
+                    "readings": int(self.ny[i, f]),
+                    "mean": _value(mean[f]),
+                    "std": _value(std[f]),
+                    "slopePerMinute": _value(slope[f])
+                }
+        return {"deviceId": self.device_id, "readings": self.count,
+                "lastTimestamp": self.last_key, "fields": fields}
+
+    def features(self) -> Dict[str, Optional[float]]:
+        """Flat {name: value} trend features, e.g. heart_rate_ewma, heart_rate_slope_20"""
+        features = {}
+        for f, field in enumerate(TREND_FIELDS):
+            features[f"{field}_ewma"] = _value(self.ewma[f])
+        for i, window in enumerate(self.windows):
+            mean, std, slope = self.window_stats(i)
+            for f, field in enumerate(TREND_FIELDS):
+                features[f"{field}_mean_{window}"] = _value(mean[f])
+                features[f"{field}_std_{window}"] = _value(std[f])
+                features[f"{field}_slope_{window}"] = _value(slope[f])
+        return features
+
+
+class VitalsTrendTracker:
+    """Trend state for every patient with recent readings"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._states: Dict[str, TrendState] = {}
+        self.recorded = 0
+        self.skipped = 0
+        self.catch_up_reads = 0
+
+    def record(self, device_id: str, patient_id: str, timestamp_key: str, vitals: Dict) -> bool:
+        """Add a stored reading; readings not newer than the patient's last one are skipped"""
+        moment = decode_key(timestamp_key)
+        if moment is None or not isinstance(vitals, dict):
+            return False
+        with self._lock:
+            state = self._states.get(patient_id)
+            if state is None:
+                state = self._states[patient_id] = TrendState()
+            if state.last_key is not None and key_order(timestamp_key) <= key_order(state.last_key):
+                self.skipped += 1
+                return False
+            state.add(moment.timestamp(), reading_values(vitals))
+            state.device_id = device_id
+            state.last_key = timestamp_key
+            self.recorded += 1
+            return True
+
+    def _catch_up(self, patient_id: str) -> Optional[TrendState]:
+        """Bring a patient's state up to the newest stored reading, reading only what it has not seen"""
+        with self._lock:
+            state = self._states.get(patient_id)
+            device_id = state.device_id if state is not None else None
+            last_key = state.last_key if state is not None else None
+
+        monitors = mirror.devices_for_patient(patient_id, "vitals_monitor")
+        if monitors and device_id not in monitors:
+            device_id = monitors[0]
+        if device_id is None:
+            return state
+
+        latest_key, _ = mirror.latest_vitals(device_id, patient_id)
+        if latest_key is None or (last_key is not None and key_order(latest_key) <= key_order(last_key)):
+            return state
+
+        start = decode_key(last_key) if last_key is not None else datetime.now() - timedelta(hours=TREND_BOOTSTRAP_HOURS)
+        self.catch_up_reads += 1
+        for timestamp_key, record in read_range(device_id, patient_id, start):
+            self.record(device_id, patient_id, timestamp_key, record)
+        with self._lock:
+            return self._states.get(patient_id)
+
+    def snapshot(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Trend summary per field and window, or None if the patient has no readings"""
+        state = self._catch_up(patient_id)
+        if state is None:
+            return None
+        with self._lock:
+            return {"patientId": patient_id, "windows": list(state.windows),
+                    "ewmaAlpha": state.alpha, **state.snapshot()}
+
+    def features(self, patient_id: str) -> Dict[str, Optional[float]]:
+        """Flat trend features for a patient ({} if it has no readings)"""
+        state = self._catch_up(patient_id)
+        if state is None:
+            return {}
+        with self._lock:
+            return state.features()
+
+
+trends = VitalsTrendTracker()
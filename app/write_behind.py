@@ -0,0 +1,263 @@
+"""
+Write-behind queue for database writes a response does not need to wait for.
+
+`submit` takes a multi-path update ({path: value}) and returns at once; a
+background thread merges everything submitted into one pending update and
+writes it with a single root update every WRITE_BEHIND_FLUSH_INTERVAL seconds,
+or sooner once WRITE_BEHIND_MAX_PATHS paths are waiting. A path written again
+before the flush keeps only its latest value, and a path nested under a
+pending one is merged into that value, so the update never contains a path
+and its ancestor. Alerts are keyed uniquely, so a pending alert that is
+overwritten before it is written is a lost alert: those are logged and
+counted as droppedAlerts rather than as coalesced writes.
+
+A flush that fails is queued again underneath anything written since, and
+retried on the next interval. Stopping the queue (app shutdown, or interpreter
+exit) flushes what is pending. Until the queue is started, and when
+WRITE_BEHIND_ENABLED is off, `submit` writes synchronously.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.firebase_config import get_ref
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds between flushes, and pending paths that trigger an early flush
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.25"))
+WRITE_BEHIND_MAX_PATHS = int(os.getenv("WRITE_BEHIND_MAX_PATHS", "500"))
+
+# Flush lag samples kept for the percentiles reported by stats()
+LAG_WINDOW = 1000
+
+# Alert entries (None matches any key); overwriting one of these while pending drops an alert
+ALERT_PATHS = (("alerts", None), ("iotData", None, "alerts", None))
+
+
+def _segments(path: str) -> Tuple[str, ...]:
+    return tuple(segment for segment in str(path).split("/") if segment)
+
+
+def _is_alert(segments: Tuple[str, ...]) -> bool:
+    return any(len(segments) == len(pattern) and all(part is None or part == segment
+                                                      for part, segment in zip(pattern, segments))
+               for pattern in ALERT_PATHS)
+
+
+def _value_at(value: Any, segments: Tuple[str, ...]) -> Any:
+    for segment in segments:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(segment)
+    return value
+
+
+def _merge(pending: Dict[Tuple[str, ...], list], segments: Tuple[str, ...], value: Any,
+           enqueued_at: float) -> Tuple[bool, List[Tuple[str, ...]]]:
+    """
+    Add one path to a pending update; pending maps path segments to [value, first enqueue time]
+    Returns whether the write replaced or was folded into one already pending, and the
+    pending alert entries it overwrote with a different value
+    """
+    for depth in range(1, len(segments)):
+        ancestor = pending.get(segments[:depth])
+        if ancestor is None:
+            continue
+        # Write into the pending ancestor's value, without changing the caller's objects
+        tree = ancestor[0] = copy.deepcopy(ancestor[0]) if isinstance(ancestor[0], dict) else {}
+        for segment in segments[depth:-1]:
+            child = tree.get(segment)
+            child = dict(child) if isinstance(child, dict) else {}
+            tree[segment] = child
+            tree = child
+        previous = tree.get(segments[-1])
+        if value is None:
+            tree.pop(segments[-1], None)
+        else:
+            tree[segments[-1]] = value
+        dropped = [segments] if _is_alert(segments) and previous is not None and previous != value else []
+        return True, dropped
+
+    replaced = segments in pending
+    dropped = []
+    if replaced and _is_alert(segments) and pending[segments][0] is not None and pending[segments][0] != value:
+        dropped.append(segments)
+    # Pending descendants are overwritten by this value
+    for key in [key for key in pending if len(key) > len(segments) and key[:len(segments)] == segments]:
+        descendant_value, descendant_enqueued_at = pending.pop(key)
+        enqueued_at = min(enqueued_at, descendant_enqueued_at)
+        if _is_alert(key) and descendant_value is not None and descendant_value != _value_at(value, key[len(segments):]):
+            dropped.append(key)
+        replaced = True
+    if replaced:
+        enqueued_at = min(enqueued_at, pending.get(segments, [None, enqueued_at])[1])
+    pending[segments] = [value, enqueued_at]
+    return replaced, dropped
+
+
+class WriteBehindQueue:
+    """Coalesces submitted multi-path updates and writes them from a background thread"""
+
+    def __init__(self, name: str = "write-behind"):
+        self.name = name
+        self._lock = threading.Lock()
+        # One flush at a time, so a retried batch is never overtaken by a newer one
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, ...], list] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self._counters = {"submitted": 0, "pathsSubmitted": 0, "coalesced": 0, "droppedAlerts": 0,
+                          "flushes": 0, "pathsWritten": 0, "failedFlushes": 0, "syncWrites": 0}
+        self._last_flush_at: Optional[str] = None
+        self._last_error: Optional[str] = None
+        self._atexit_registered = False
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the flushing thread"""
+        if not WRITE_BEHIND_ENABLED or self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            # Daemon threads die with the interpreter; write what is left on the way out
+            atexit.register(self.stop)
+            self._atexit_registered = True
+        logger.info(f"Write-behind queue {self.name} started")
+
+    def stop(self):
+        """Stop the thread and write everything still pending"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join(timeout=10)
+        if self.pending_count():
+            self.flush()
+        if self.pending_count():
+            logger.error(f"Write-behind queue {self.name} stopped with {self.pending_count()} unwritten paths")
+
+    def submit(self, updates: Dict[str, Any]) -> bool:
+        """Queue a multi-path update; returns False if it was written synchronously instead"""
+        if not updates:
+            return True
+        if not self.is_running():
+            get_ref("/").update(updates)
+            self._count("syncWrites")
+            return False
+        now = time.monotonic()
+        dropped = []
+        with self._lock:
+            for path, value in updates.items():
+                coalesced, overwritten = _merge(self._pending, _segments(path), value, now)
+                if overwritten:
+                    dropped.extend(overwritten)
+                elif coalesced:
+                    self._counters["coalesced"] += 1
+            self._counters["droppedAlerts"] += len(dropped)
+            self._counters["submitted"] += 1
+            self._counters["pathsSubmitted"] += len(updates)
+            full = len(self._pending) >= WRITE_BEHIND_MAX_PATHS
+        if dropped:
+            logger.warning(f"Write-behind queue {self.name} overwrote {len(dropped)} pending alerts: "
+                           f"{', '.join('/'.join(segments) for segments in dropped)}")
+        if full:
+            self._wake.set()
+        return True
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Write everything pending with one multi-path update; returns the number of paths written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                get_ref("/").update({"/".join(segments): value for segments, (value, _) in batch.items()})
+            except Exception as e:
+                with self._lock:
+                    # Put the batch back underneath anything submitted since
+                    newer, self._pending = self._pending, batch
+                    for segments, (value, enqueued_at) in newer.items():
+                        self._counters["droppedAlerts"] += len(_merge(self._pending, segments, value, enqueued_at)[1])
+                    self._counters["failedFlushes"] += 1
+                    self._last_error = str(e)
+                logger.error(f"Write-behind flush of {len(batch)} paths failed, will retry: {e}")
+                return 0
+            finished = time.monotonic()
+            with self._lock:
+                self._counters["flushes"] += 1
+                self._counters["pathsWritten"] += len(batch)
+                self._lags.extend(finished - enqueued_at for _, enqueued_at in batch.values())
+                self._last_flush_at = datetime.now().isoformat()
+                self._last_error = None
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(WRITE_BEHIND_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in write-behind queue {self.name}: {e}")
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, pending paths and submit-to-write lag in milliseconds"""
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            lags = sorted(self._lags)
+            pending = len(self._pending)
+            oldest = min((enqueued_at for _, enqueued_at in self._pending.values()), default=None)
+            last_flush_at = self._last_flush_at
+            last_error = self._last_error
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not lags:
+                return None
+            return round(lags[min(len(lags) - 1, int(fraction * len(lags)))] * 1000, 2)
+
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "running": self.is_running(),
+            "flushIntervalSeconds": WRITE_BEHIND_FLUSH_INTERVAL,
+            "pendingPaths": pending,
+            # Age of the oldest write not yet in the database
+            "oldestPendingMs": round((now - oldest) * 1000, 2) if oldest is not None else None,
+            **counters,
+            "lastFlushAt": last_flush_at,
+            "lastError": last_error,
+            "flushLagMs": {
+                "samples": len(lags),
+                "avg": round(sum(lags) / len(lags) * 1000, 2) if lags else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(lags[-1] * 1000, 2) if lags else None
+            }
+        }
+
+
+write_behind = WriteBehindQueue()
@@ -0,0 +1,150 @@
+"""
+Vitals Layout Migration Script
+
+Copies monitor vitals stored in the legacy flat map
+iotData/{device}/vitals/{patient}/{timestamp} into the hour-bucketed
+vitalsHistory/{device}/{patient}/{day}/{hour}/{timestamp} layout and writes
+the iotData/{device}/latestVitals/{patient} pointer for every patient.
+
+Readings are read page by page and written with multi-path updates, so the
+script is safe to re-run. Pass --drop-legacy to delete the flat maps after
+they have been copied (only once nothing reads them any more).
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Make the app package importable when run from another directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.firebase_config import init_firebase, get_ref
+from app.vitals_store import bucket_for_key, history_path
+
+# Load environment variables
+load_dotenv()
+
+def iter_readings(device_id, patient_id, page_size):
+    """Yield (timestamp, reading) from the legacy map in key order, one page at a time"""
+    vitals_ref = get_ref(f"iotData/{device_id}/vitals/{patient_id}")
+    last_key = None
+    while True:
+        query = vitals_ref.order_by_key()
+        if last_key is not None:
+            query = query.start_at(last_key)
+        page = query.limit_to_first(page_size + (1 if last_key is not None else 0)).get() or {}
+        items = [(key, value) for key, value in page.items() if key != last_key]
+        if not items:
+            return
+        for item in items:
+            yield item
+        last_key = items[-1][0]
+
+def migrate_patient(device_id, patient_id, page_size, dry_run):
+    """Copy one patient's readings into hour buckets; returns (copied, skipped)"""
+    root_ref = get_ref("/")
+    updates = {}
+    copied = skipped = 0
+    latest = None
+
+    for timestamp, reading in iter_readings(device_id, patient_id, page_size):
+        bucket = bucket_for_key(timestamp)
+        if bucket is None or not isinstance(reading, dict):
+            skipped += 1
+            continue
+        day, hour = bucket
+        updates[f"{history_path(device_id, patient_id, day, hour)}/{timestamp}"] = reading
+        latest = (timestamp, reading)
+        copied += 1
+        if len(updates) >= page_size:
+            if not dry_run:
+                root_ref.update(updates)
+            updates = {}
+
+    if latest is not None:
+        updates[f"iotData/{device_id}/latestVitals/{patient_id}"] = {"timestamp": latest[0], "data": latest[1]}
+    if updates and not dry_run:
+        root_ref.update(updates)
+    return copied, skipped
+
+def migrate_unkeyed_device(device_id, dry_run):
+    """Bucket readings from the older vitals/{timestamp} layout using each reading's patientId"""
+    vitals = get_ref(f"iotData/{device_id}/vitals").get() or {}
+    updates = {}
+    latest = {}
+    copied = skipped = 0
+
+    for timestamp, reading in vitals.items():
+        bucket = bucket_for_key(timestamp)
+        patient_id = reading.get("patientId") if isinstance(reading, dict) else None
+        if bucket is None or not patient_id:
+            skipped += 1
+            continue
+        day, hour = bucket
+        updates[f"{history_path(device_id, patient_id, day, hour)}/{timestamp}"] = reading
+        if patient_id not in latest or timestamp > latest[patient_id][0]:
+            latest[patient_id] = (timestamp, reading)
+        copied += 1
+
+    for patient_id, (timestamp, reading) in latest.items():
+        updates[f"iotData/{device_id}/latestVitals/{patient_id}"] = {"timestamp": timestamp, "data": reading}
+    if updates and not dry_run:
+        get_ref("/").update(updates)
+    return copied, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate monitor vitals to the hour-bucketed layout")
+    parser.add_argument("--page-size", type=int, default=500, help="readings per read/write batch")
+    parser.add_argument("--drop-legacy", action="store_true", help="delete the flat vitals maps after copying")
+    parser.add_argument("--dry-run", action="store_true", help="count readings without writing anything")
+    args = parser.parse_args()
+
+    try:
+        print("🔧 Initializing Firebase connection...")
+        init_firebase()
+        print("✅ Firebase connected successfully!")
+
+        device_ids = list((get_ref("iotData").get(shallow=True) or {}).keys())
+        print(f"\n📡 Found {len(device_ids)} devices")
+
+        total_copied = total_skipped = 0
+        for device_id in device_ids:
+            device_info = get_ref(f"iotData/{device_id}/deviceInfo").get() or {}
+            if device_info.get("type") != "vitals_monitor":
+                continue
+
+            vitals_keys = list((get_ref(f"iotData/{device_id}/vitals").get(shallow=True) or {}).keys())
+            if any(bucket_for_key(key) for key in vitals_keys):
+                # Readings keyed directly by timestamp (before vitals were grouped per patient)
+                copied, skipped = migrate_unkeyed_device(device_id, args.dry_run)
+                total_copied += copied
+                total_skipped += skipped
+                print(f"  📍 {device_id} (ungrouped): {copied} readings bucketed, {skipped} skipped")
+
+                if args.drop_legacy and not args.dry_run and skipped == 0:
+                    get_ref(f"iotData/{device_id}/vitals").delete()
+                    print(f"     🗑️  Removed legacy vitals for {device_id}")
+                continue
+
+            for patient_id in vitals_keys:
+                copied, skipped = migrate_patient(device_id, patient_id, args.page_size, args.dry_run)
+                total_copied += copied
+                total_skipped += skipped
+                print(f"  📍 {device_id}/{patient_id}: {copied} readings bucketed, {skipped} skipped")
+
+                if args.drop_legacy and not args.dry_run and skipped == 0:
+                    get_ref(f"iotData/{device_id}/vitals/{patient_id}").delete()
+                    print(f"     🗑️  Removed legacy vitals for {patient_id}")
+
+        print("\n✅ Migration complete!" if not args.dry_run else "\n✅ Dry run complete!")
+        print("\n📈 Summary:")
+        print(f"  • {total_copied} readings bucketed")
+        print(f"  • {total_skipped} readings skipped (unrecognised timestamp keys or no patient)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
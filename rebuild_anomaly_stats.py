@@ -0,0 +1,97 @@
+"""
+Anomaly Statistics Rebuild Script
+
+Recomputes the hourly counters at anomalyStats/{YYYY-MM-DD-HH}/{device_id}
+from the anomaly logs under anomalies/{device_id}. The counters are normally
+maintained as logs are written; run this once for logs saved before they
+existed, or to repair them after logs were deleted by hand.
+
+Counters are rebuilt in memory and written over the existing ones, so the
+script is safe to re-run. Use --dry-run to print the totals only.
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Make the app package importable when run from another directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.firebase_config import init_firebase, get_ref
+from app.routers.anomalies import ANOMALY_STATS_ROOT, SEVERITY_LEVELS, stats_bucket
+from app.timekeys import decode_key
+
+# Load environment variables
+load_dotenv()
+
+def iter_logs(device_id, page_size):
+    """Yield (timestamp key, log) for one device in key order, one page at a time"""
+    logs_ref = get_ref(f"anomalies/{device_id}", cached=False)
+    last_key = None
+    while True:
+        query = logs_ref.order_by_key()
+        if last_key is not None:
+            query = query.start_at(last_key)
+        page = query.limit_to_first(page_size + (1 if last_key is not None else 0)).get() or {}
+        items = [(key, value) for key, value in page.items() if key != last_key]
+        if not items:
+            return
+        for item in items:
+            yield item
+        last_key = items[-1][0]
+
+def count_device(device_id, counters, page_size):
+    """Add one device's logs to counters[bucket][device_id]; returns (counted, skipped)"""
+    counted = skipped = 0
+    for timestamp_key, log in iter_logs(device_id, page_size):
+        moment = decode_key(timestamp_key)
+        if moment is None or not isinstance(log, dict):
+            skipped += 1
+            continue
+        device_counters = counters.setdefault(stats_bucket(moment), {}).setdefault(device_id, {"readings": 0})
+        device_counters["readings"] += 1
+        if log.get("is_anomaly", False):
+            device_counters["anomalies"] = device_counters.get("anomalies", 0) + 1
+            severity = log.get("severity_level")
+            if severity in SEVERITY_LEVELS:
+                device_counters[severity] = device_counters.get(severity, 0) + 1
+        counted += 1
+    return counted, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the hourly anomaly statistics counters from the anomaly logs")
+    parser.add_argument("--page-size", type=int, default=500, help="logs per read")
+    parser.add_argument("--dry-run", action="store_true", help="count logs without writing anything")
+    args = parser.parse_args()
+
+    try:
+        print("🔧 Initializing Firebase connection...")
+        init_firebase()
+        print("✅ Firebase connected successfully!")
+
+        device_ids = list((get_ref("anomalies", cached=False).get(shallow=True) or {}).keys())
+        print(f"\n📡 Found {len(device_ids)} devices with anomaly logs")
+
+        counters = {}
+        total_counted = total_skipped = 0
+        for device_id in device_ids:
+            counted, skipped = count_device(device_id, counters, args.page_size)
+            total_counted += counted
+            total_skipped += skipped
+            print(f"  📍 {device_id}: {counted} logs counted, {skipped} skipped")
+
+        if not args.dry_run:
+            get_ref(ANOMALY_STATS_ROOT).set(counters)
+
+        print("\n✅ Rebuild complete!" if not args.dry_run else "\n✅ Dry run complete!")
+        print("\n📈 Summary:")
+        print(f"  • {total_counted} logs counted into {len(counters)} hour buckets")
+        print(f"  • {total_skipped} logs skipped (unrecognised timestamp keys)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
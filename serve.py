@@ -0,0 +1,218 @@
+"""
+API Server Launcher
+
+Runs the API in several uvicorn worker processes that share one listening
+socket:
+
+    python serve.py --workers 4                  # every worker loads its own models
+    python serve.py --workers 4 --preload        # load models once, then fork the workers
+    python serve.py --workers 4 --memory-report  # start each way, print per-worker memory, exit
+
+With --preload the model registries are loaded in this process and the heap is
+frozen (gc.freeze) before forking, so the workers start from the same
+copy-on-write pages instead of loading N private copies. The database
+connection, listeners and background threads are still created in each worker
+after the fork. Set MODEL_MMAP=true as well so the scoring arrays are mapped
+from files under models/.shared and stay shared after a model reload.
+Needs fork (Linux/macOS).
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import select
+import signal
+import socket
+import argparse
+import subprocess
+import traceback
+from dotenv import load_dotenv
+
+# Make the app package importable when run from another directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Load environment variables
+load_dotenv()
+
+def bind_socket(host, port):
+    """Listening socket inherited by every worker"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def preload_models():
+    """Load the served model versions in the parent and freeze the heap so workers share it"""
+    from app.routers.anomalies import anomaly_models
+    from app.routers.predictions import risk_models
+    # Frozen objects are skipped by the collector, so it never writes to their shared pages
+    gc.collect()
+    gc.freeze()
+    return [anomaly_models.version(), risk_models.version()]
+
+def run_worker(sock, log_level, ready_fd=None):
+    """Worker body: import the app (models are already loaded if preloaded), warm up, serve"""
+    import uvicorn
+    from app.main import app, anomaly_models, risk_models
+
+    anomaly_models.warm_up()
+    risk_models.warm_up()
+    if ready_fd is not None:
+        os.write(ready_fd, b".")
+        os.close(ready_fd)
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+
+def spawn_worker(sock, log_level, ready_fd=None):
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            run_worker(sock, log_level, ready_fd)
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+def stop_workers(workers):
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+def serve(args):
+    sock = bind_socket(args.host, args.port)
+    if args.preload:
+        print("📦 Preloading models before forking workers...")
+        print(f"✅ Models loaded: {preload_models()}")
+
+    workers = {spawn_worker(sock, args.log_level) for _ in range(args.workers)}
+    print(f"🚀 {args.workers} workers serving on http://{args.host}:{args.port} (pids {sorted(workers)})")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited with status {status}, restarting")
+            time.sleep(1)
+            workers.add(spawn_worker(sock, args.log_level))
+    print("👋 All workers stopped")
+
+def measure(args):
+    """Start workers on a free port, wait until each has loaded and scored, print their memory as JSON"""
+    from app.process_memory import process_memory
+
+    sock = bind_socket("127.0.0.1", 0)
+    if args.preload:
+        preload_models()
+    ready_read, ready_write = os.pipe()
+    workers = [spawn_worker(sock, "warning", ready_write) for _ in range(args.workers)]
+    os.close(ready_write)
+
+    ready = 0
+    deadline = time.time() + 300
+    while ready < args.workers and time.time() < deadline:
+        readable, _, _ = select.select([ready_read], [], [], 1)
+        if readable:
+            chunk = os.read(ready_read, args.workers)
+            if not chunk:
+                break
+            ready += len(chunk)
+    # Let every worker finish starting its server
+    time.sleep(2)
+    try:
+        print(json.dumps({"ready": ready, "workers": [process_memory(pid) for pid in workers]}))
+    finally:
+        stop_workers(workers)
+
+def memory_report(args):
+    """Measure the same number of workers without sharing, with MODEL_MMAP, and with preload + MODEL_MMAP"""
+    modes = [
+        ("independent", [], {"MODEL_MMAP": "false"}),
+        ("mmap", [], {"MODEL_MMAP": "true"}),
+        ("preload+mmap", ["--preload"], {"MODEL_MMAP": "true"}),
+    ]
+    print(f"📊 Measuring {args.workers} workers per mode...")
+    rows = []
+    for label, flags, env in modes:
+        command = [sys.executable, os.path.abspath(__file__), "--measure", "--workers", str(args.workers)] + flags
+        result = subprocess.run(command, env={**os.environ, **env}, capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if result.returncode != 0 or not lines:
+            print(f"❌ {label}: measurement failed\n{result.stderr[-2000:]}")
+            continue
+        measured = json.loads(lines[-1])
+        workers = measured["workers"]
+        for worker in workers:
+            print(f"  📍 {label:<13} pid {worker['pid']:>7}: RSS {worker['rssMb']:>7} MB  "
+                  f"PSS {worker['pssMb']} MB  USS {worker['ussMb']} MB")
+        rows.append((label, workers))
+
+    def average(workers, key):
+        values = [worker[key] for worker in workers if worker.get(key) is not None]
+        return sum(values) / len(values) if values else float("nan")
+
+    def total(workers, key):
+        return sum(worker[key] for worker in workers if worker.get(key) is not None)
+
+    print("\n📈 Summary (MB):")
+    print(f"  {'mode':<13} {'RSS/worker':>11} {'PSS/worker':>11} {'USS/worker':>11} {'PSS total':>10}")
+    for label, workers in rows:
+        print(f"  {label:<13} {average(workers, 'rssMb'):>11.1f} {average(workers, 'pssMb'):>11.1f} "
+              f"{average(workers, 'ussMb'):>11.1f} {total(workers, 'pssMb'):>10.1f}")
+    print("\n💡 PSS total is what the workers cost together; RSS counts shared pages once per worker.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API in several worker processes")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")))
+    parser.add_argument("--preload", action="store_true", help="load models once before forking the workers")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--memory-report", action="store_true", help="compare per-worker memory with and without sharing")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    try:
+        if args.memory_report:
+            memory_report(args)
+        elif args.measure:
+            measure(args)
+        else:
+            serve(args)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
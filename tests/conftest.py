@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Run the API against the in-memory store; set before any app module reads its config
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("WRITE_BEHIND_ENABLED", "false")
+os.environ.pop("LOCAL_DB_SEED", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.firebase_config import clear_cache, get_ref
+from app.main import app
+
+
+@pytest.fixture
+def db():
+    """Empty database for the test"""
+    get_ref("/", cached=False).delete()
+    clear_cache()
+    yield get_ref("/", cached=False)
+    get_ref("/", cached=False).delete()
+    clear_cache()
+
+
+@pytest.fixture
+def client(db):
+    """API client without the startup hooks (no background workers or listeners)"""
+    return TestClient(app)
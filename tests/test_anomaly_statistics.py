@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from app.routers.anomalies import anomaly_stats_paths
+
+
+def detection(device_id, moment, severity=None):
+    return {
+        "device_id": device_id,
+        "timestamp": moment.isoformat(),
+        "is_anomaly": severity is not None,
+        "severity_level": severity
+    }
+
+
+def test_statistics_sums_hourly_counters(client, db):
+    now = datetime.now()
+    results = [
+        detection("monitor_1", now),
+        detection("monitor_1", now, "HIGH"),
+        detection("monitor_1", now - timedelta(hours=1), "CRITICAL"),
+        detection("monitor_2", now),
+        detection("monitor_2", now, "LOW"),
+        # Outside a 24 hour window
+        detection("monitor_2", now - timedelta(hours=30), "HIGH")
+    ]
+    db.update(anomaly_stats_paths(results))
+
+    response = client.get("/anomalies/statistics", params={"hours": 24})
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["time_period_hours"] == 24
+    assert stats["total_readings"] == 5
+    assert stats["total_anomalies"] == 3
+    assert stats["anomaly_rate_percent"] == 60.0
+    assert stats["severity_distribution"] == {"CRITICAL": 1, "HIGH": 1, "MEDIUM": 0, "LOW": 1}
+    assert stats["device_anomaly_counts"] == {"monitor_1": 2, "monitor_2": 1}
+
+
+def test_statistics_is_not_a_device_lookup(client, db):
+    response = client.get("/anomalies/statistics")
+
+    assert response.status_code == 200
+    assert response.json()["total_readings"] == 0
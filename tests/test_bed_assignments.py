@@ -0,0 +1,70 @@
+import pytest
+
+from app.firebase_config import get_ref
+
+
+@pytest.fixture
+def ward(db):
+    db.child("rooms/room_1").set({"roomId": "room_1", "status": "available"})
+    db.child("beds/bed_1").set({"roomId": "room_1", "bedNumber": "1", "status": "available"})
+    db.child("patients/patient_1").set({"personalInfo": {"name": "A"}})
+    # Requests earlier in this process leave the records in the read cache
+    for path in ("rooms/room_1", "beds", "beds/bed_1", "patients/patient_1"):
+        get_ref(path).get()
+    return db
+
+
+def test_bed_taken_by_another_process_is_not_assigned(client, ward):
+    # Written by another process, so the cached copies are not invalidated
+    ward.child("beds/bed_1").update({"status": "occupied", "patientId": "patient_2"})
+
+    response = client.post("/beds/bed_1/assign-patient/patient_1")
+
+    assert response.status_code == 400
+    assert ward.child("beds/bed_1/patientId").get() == "patient_2"
+
+
+def test_assignment_keeps_fields_written_by_another_process(client, ward):
+    ward.child("patients/patient_1/medicalHistory").set({"conditions": ["Asthma"]})
+    ward.child("beds/bed_1/lastCleaned").set("2026-10-16T08:00:00")
+
+    response = client.post("/beds/bed_1/assign-patient/patient_1")
+
+    assert response.status_code == 200
+    assert ward.child("patients/patient_1").get() == {
+        "personalInfo": {"name": "A", "bedId": "bed_1", "roomId": "room_1"},
+        "medicalHistory": {"conditions": ["Asthma"]}
+    }
+    assert ward.child("beds/bed_1").get() == {
+        "roomId": "room_1", "bedNumber": "1", "status": "occupied",
+        "patientId": "patient_1", "lastCleaned": "2026-10-16T08:00:00"
+    }
+
+
+def test_room_discharge_keeps_fields_written_by_another_process(client, ward):
+    assert client.post("/rooms/room_1/assign-patient/patient_1").status_code == 200
+    get_ref("patients/patient_1").get()
+    ward.child("patients/patient_1/medicalHistory").set({"conditions": ["Asthma"]})
+
+    response = client.delete("/rooms/room_1/unassign-patient/patient_1")
+
+    assert response.status_code == 200
+    assert ward.child("patients/patient_1").get() == {
+        "personalInfo": {"name": "A"},
+        "medicalHistory": {"conditions": ["Asthma"]}
+    }
+    assert ward.child("beds/bed_1/status").get() == "available"
+    assert ward.child("rooms/room_1/status").get() == "available"
+
+
+def test_resolving_an_alert_keeps_fields_written_by_another_process(client, db):
+    db.child("iotData/monitor_1/alerts/alert_1").set({"type": "warning", "resolved": False})
+    get_ref("iotData/monitor_1/alerts/alert_1").get()
+    db.child("iotData/monitor_1/alerts/alert_1/assignedTo").set("nurse_1")
+
+    response = client.post("/iotData/monitor_1/alerts/alert_1/resolve", json={"resolvedBy": "nurse_2"})
+
+    assert response.status_code == 200
+    assert db.child("iotData/monitor_1/alerts/alert_1").get() == {
+        "type": "warning", "resolved": True, "resolvedBy": "nurse_2", "assignedTo": "nurse_1"
+    }
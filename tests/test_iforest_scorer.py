@@ -0,0 +1,91 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from app.iforest_scorer import CompiledIsolationForest
+
+SHIPPED_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "models", "isolation_forest_anomaly_model.pkl")
+
+
+def fitted_bundle(max_features=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal([80, 120, 80, 37, 97], [10, 15, 10, 0.5, 2], size=(2000, 5))
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(n_estimators=50, max_features=max_features, contamination=0.05,
+                            random_state=seed).fit(scaler.transform(X))
+    return model, scaler
+
+
+def shipped_bundle():
+    if not os.path.exists(SHIPPED_MODEL):
+        pytest.skip("shipped anomaly model not present")
+    model_data = joblib.load(SHIPPED_MODEL)
+    return model_data["model"], model_data["scaler"]
+
+
+def edge_rows(compiled, model, scaler):
+    """Rows on split thresholds, at the training mean, all zeros and far outside the data"""
+    n_features = compiled.n_features
+    subsample_features = model._max_features != n_features
+    on_splits = []
+    for estimator, features in zip(model.estimators_[:5], model.estimators_features_[:5]):
+        tree = estimator.tree_
+        for node in np.flatnonzero(tree.children_left != -1)[:20]:
+            # Scaled space: every other feature at the mean, this one on the split
+            row = np.zeros(n_features)
+            feature = tree.feature[node]
+            row[features[feature] if subsample_features else feature] = tree.threshold[node]
+            on_splits.append(row)
+    return np.vstack([
+        scaler.inverse_transform(np.array(on_splits)),
+        compiled.mean,
+        np.zeros(n_features),
+        compiled.mean + 1e6,
+        compiled.mean - 1e6
+    ])
+
+
+def random_rows(compiled, n_rows=3000, seed=1):
+    rng = np.random.default_rng(seed)
+    return compiled.mean + rng.standard_normal((n_rows, compiled.n_features)) * compiled.scale * 3
+
+
+@pytest.mark.parametrize("bundle", [
+    pytest.param(shipped_bundle, id="shipped"),
+    pytest.param(lambda: fitted_bundle(), id="all-features"),
+    pytest.param(lambda: fitted_bundle(max_features=0.6), id="feature-subsets")
+])
+def test_compiled_scores_match_sklearn(bundle):
+    model, scaler = bundle()
+    compiled = CompiledIsolationForest.from_sklearn(model, scaler)
+
+    for X in (random_rows(compiled), edge_rows(compiled, model, scaler)):
+        X_model = scaler.transform(X)
+        np.testing.assert_allclose(compiled.score_samples(X), model.score_samples(X_model), rtol=0, atol=1e-12)
+        predictions, scores = compiled.score(X)
+        np.testing.assert_allclose(scores, model.decision_function(X_model), rtol=0, atol=1e-12)
+        assert np.array_equal(predictions, model.predict(X_model))
+
+
+def test_single_row_matches_batch():
+    model, scaler = fitted_bundle()
+    compiled = CompiledIsolationForest.from_sklearn(model, scaler)
+    X = random_rows(compiled, n_rows=20)
+
+    batch = compiled.score_samples(X)
+    assert np.array_equal(batch, np.array([compiled.score_samples(row)[0] for row in X]))
+
+
+def test_arrays_round_trip(tmp_path):
+    model, scaler = fitted_bundle()
+    compiled = CompiledIsolationForest.from_sklearn(model, scaler)
+    path = str(tmp_path / "forest.npz")
+    compiled.save(path)
+
+    X = random_rows(compiled, n_rows=200)
+    assert np.array_equal(CompiledIsolationForest.load(path).score_samples(X), compiled.score_samples(X))
@@ -0,0 +1,122 @@
+import pytest
+
+import app.routers.iot as iot
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Paths read through the iot router"""
+    paths = []
+    get_ref = iot.get_ref
+
+    class RecordingRef:
+        def __init__(self, path, ref):
+            self._path, self._ref = path, ref
+
+        def get(self, *args, **kwargs):
+            paths.append(self._path)
+            return self._ref.get(*args, **kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self._ref, name)
+
+    monkeypatch.setattr(iot, "get_ref", lambda path, *args, **kwargs: RecordingRef(path, get_ref(path, *args, **kwargs)))
+    return paths
+
+
+@pytest.fixture
+def ward(db):
+    db.child("patients/patient_1/personalInfo").set({"name": "A", "roomId": "room_1"})
+    db.child("iotData/monitor_1").set({
+        "deviceInfo": {"type": "vitals_monitor", "roomId": "room_1", "currentPatientId": "patient_1"},
+        "vitals": {"patient_1": {"1790000000000": {"heartRate": 70}}},
+        "alerts": {"alert_1": {"type": "warning", "resolved": False}}
+    })
+    db.child("iotData/monitor_2").set({
+        "deviceInfo": {"type": "vitals_monitor", "roomId": "room_1"},
+        "vitals": {"patient_9": {"1790000000000": {"heartRate": 90}}},
+        "alerts": {"alert_2": {"type": "critical", "resolved": False}}
+    })
+    db.child("iotData/env_1").set({
+        "deviceInfo": {"type": "environmental_sensor", "roomId": "room_1"},
+        "vitals": {"1790000000000": {"temperature": 21.0}, "1790000060000": {"temperature": 21.5}}
+    })
+    return db
+
+
+def test_assign_patient_writes_only_assignment_fields(client, ward, reads):
+    response = client.post("/iotData/monitor_2/assign-patient", json={"patientId": "patient_1"})
+
+    assert response.status_code == 200
+    assert not [path for path in reads if path.rstrip("/") in ("iotData/monitor_1", "iotData/monitor_2")]
+    # The previous monitor keeps its readings and alerts, and only loses the patient
+    previous = ward.child("iotData/monitor_1").get()
+    assert "currentPatientId" not in previous["deviceInfo"]
+    assert previous["vitals"] == {"patient_1": {"1790000000000": {"heartRate": 70}}}
+    assert previous["alerts"] == {"alert_1": {"type": "warning", "resolved": False}}
+    # The new monitor starts without the old readings but keeps its alerts
+    assigned = ward.child("iotData/monitor_2").get()
+    assert assigned["deviceInfo"] == {"type": "vitals_monitor", "roomId": "room_1", "currentPatientId": "patient_1"}
+    assert "vitals" not in assigned
+    assert assigned["alerts"] == {"alert_2": {"type": "critical", "resolved": False}}
+
+
+def test_unassign_patient_writes_only_assignment_fields(client, ward, reads):
+    response = client.delete("/iotData/monitor_1/unassign-patient")
+
+    assert response.status_code == 200
+    assert "iotData/monitor_1" not in reads
+    monitor = ward.child("iotData/monitor_1").get()
+    assert monitor["deviceInfo"] == {"type": "vitals_monitor", "roomId": "room_1"}
+    assert "vitals" not in monitor
+    assert monitor["alerts"] == {"alert_1": {"type": "warning", "resolved": False}}
+
+
+def test_update_device_info_merges_fields(client, ward, reads):
+    response = client.put("/iotData/monitor_2/deviceInfo", json={"bedId": "bed_3"})
+
+    assert response.status_code == 200
+    assert "iotData/monitor_2" not in reads
+    monitor = ward.child("iotData/monitor_2").get()
+    assert monitor["deviceInfo"] == {"type": "vitals_monitor", "roomId": "room_1", "bedId": "bed_3"}
+    assert monitor["vitals"] == {"patient_9": {"1790000000000": {"heartRate": 90}}}
+
+
+def test_update_device_info_with_empty_body_changes_nothing(client, ward):
+    response = client.put("/iotData/monitor_2/deviceInfo", json={})
+
+    assert response.status_code == 200
+    assert ward.child("iotData/monitor_2/deviceInfo").get() == {"type": "vitals_monitor", "roomId": "room_1"}
+    assert client.put("/iotData/monitor_9/deviceInfo", json={}).status_code == 404
+
+
+def test_env_sensor_for_room_reads_only_that_sensor(client, ward, reads):
+    response = client.get("/iotData/env-sensors/room/room_1")
+
+    assert response.status_code == 200
+    assert "iotData" not in reads
+    assert not [path for path in reads if path.startswith("iotData/monitor_")]
+    assert response.json() == {
+        "sensorId": "env_1",
+        "roomId": "room_1",
+        "deviceInfo": {"type": "environmental_sensor", "roomId": "room_1"},
+        "vitals": {"1790000000000": {"temperature": 21.0}, "1790000060000": {"temperature": 21.5}},
+        "latestReading": {"timestamp": "1790000060000", "data": {"temperature": 21.5}}
+    }
+
+
+def test_room_device_assignment_writes_only_room_field(client, ward):
+    from app.firebase_config import get_ref
+    get_ref("iotData/monitor_2").get()
+    # Stored by another process after the device was cached
+    ward.child("iotData/monitor_2/vitals/patient_9/1790000060000").set({"heartRate": 95})
+
+    assert client.post("/rooms/room_2/assign-device/monitor_2").status_code == 200
+    monitor = ward.child("iotData/monitor_2").get()
+    assert monitor["deviceInfo"] == {"type": "vitals_monitor", "roomId": "room_2"}
+    assert monitor["vitals"] == {"patient_9": {"1790000000000": {"heartRate": 90}, "1790000060000": {"heartRate": 95}}}
+    assert monitor["alerts"] == {"alert_2": {"type": "critical", "resolved": False}}
+
+    assert client.delete("/rooms/room_2/unassign-device/monitor_2").status_code == 200
+    assert ward.child("iotData/monitor_2/deviceInfo").get() == {"type": "vitals_monitor"}
+    assert len(ward.child("iotData/monitor_2/vitals/patient_9").get()) == 2
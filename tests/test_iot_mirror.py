@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from app.iot_mirror import IoTMirror
+
+
+@pytest.fixture
+def live_mirror(db):
+    db.child("iotData/monitor_1").set({
+        "deviceInfo": {"type": "vitals_monitor", "roomId": "room_1", "currentPatientId": "patient_1"},
+        "vitals": {"patient_1": {"1790000000000": {"heartRate": 70}, "1790000001000": {"heartRate": 75}}},
+        "alerts": {"alert_1": {"type": "warning", "resolved": True}}
+    })
+    mirror = IoTMirror()
+    mirror.start()
+    assert mirror.is_live()
+    yield mirror
+    mirror.stop()
+
+
+def test_deleted_latest_reading_is_read_again(live_mirror, db):
+    db.child("iotData/monitor_1/vitals/patient_1/1790000001000").delete()
+
+    assert live_mirror.latest_vitals("monitor_1", "patient_1") == ("1790000000000", {"heartRate": 70})
+    assert live_mirror.refetches == 1
+
+
+def test_reopened_alert_is_read_again(live_mirror, db):
+    db.child("iotData/monitor_1/alerts/alert_1").update({"resolved": False})
+
+    assert live_mirror.device_unresolved_alerts("monitor_1") == {"alert_1": {"type": "warning", "resolved": False}}
+
+
+def test_accessors_do_not_wait_for_a_re_read(live_mirror, db):
+    reading, release = threading.Event(), threading.Event()
+    read_refetch = live_mirror._read_refetch
+
+    def slow_read(*refetch):
+        reading.set()
+        release.wait(5)
+        return read_refetch(*refetch)
+
+    live_mirror._read_refetch = slow_read
+    writer = threading.Thread(target=db.child("iotData/monitor_1/vitals/patient_1/1790000001000").delete)
+    writer.start()
+    try:
+        assert reading.wait(5)
+        answers = []
+        reader = threading.Thread(target=lambda: answers.append(
+            (live_mirror.device_info("monitor_1"), live_mirror.devices_in_room("room_1"))))
+        reader.start()
+        reader.join(1)
+        assert not reader.is_alive(), "accessor blocked behind the listener's database read"
+        assert answers[0][1] == ["monitor_1"]
+    finally:
+        release.set()
+        writer.join(5)
+    assert live_mirror.latest_vitals("monitor_1", "patient_1")[0] == "1790000000000"
+
+
+def test_re_read_is_not_swapped_in_over_a_newer_write(live_mirror, db):
+    read_refetch = live_mirror._read_refetch
+    calls = []
+
+    def read_then_record(*refetch):
+        result = read_refetch(*refetch)
+        if not calls:
+            # A request stores a newer reading while the stale read is in flight
+            path = "iotData/monitor_1/vitals/patient_1/1790000002000"
+            db.child(path).set({"heartRate": 90})
+            live_mirror.record_write(path, {"heartRate": 90})
+        calls.append(refetch)
+        return result
+
+    live_mirror._read_refetch = read_then_record
+    db.child("iotData/monitor_1/vitals/patient_1/1790000001000").delete()
+
+    assert len(calls) == 2
+    assert live_mirror.latest_vitals("monitor_1", "patient_1") == ("1790000002000", {"heartRate": 90})
+
+
+def test_writes_under_an_unknown_device_do_not_create_it(live_mirror, db):
+    db.child("iotData/monitor_9/vitals/patient_1/1790000000000").set({"heartRate": 70})
+    db.child("iotData/monitor_9/alerts/alert_9").set({"type": "warning", "resolved": False})
+    db.child("iotData/monitor_9/latestVitals/patient_1").set({"timestamp": "1790000000000", "data": {"heartRate": 70}})
+
+    assert live_mirror.device_info("monitor_9") is None
+    assert "monitor_9" not in live_mirror.device_infos()
+    assert "monitor_9" not in live_mirror.unresolved_alerts()
+
+    db.child("iotData/monitor_9/deviceInfo").set({"type": "vitals_monitor", "roomId": "room_1"})
+
+    assert live_mirror.device_info("monitor_9") == {"type": "vitals_monitor", "roomId": "room_1"}
+    assert live_mirror.devices_in_room("room_1") == ["monitor_1", "monitor_9"]
@@ -0,0 +1,48 @@
+import os
+
+import joblib
+import pytest
+
+from app.model_registry import InvalidModelVersion, ModelRegistry, ModelVersionNotFound
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry("test_model", models_dir=str(tmp_path / "models"))
+    registry.register({"weights": [1, 2, 3]}, version="v1")
+    return registry
+
+
+@pytest.mark.parametrize("version", ["../outside", "../../etc/passwd", "v1/../v1", "sub/v1", "..", ".hidden", "a\\b"])
+def test_load_rejects_path_like_versions(registry, tmp_path, version):
+    # A pickle outside the versions directory that a traversal would reach
+    joblib.dump({"weights": "outside"}, tmp_path / "models" / "outside.pkl")
+
+    with pytest.raises(InvalidModelVersion):
+        registry.load(version, activate=True)
+
+    assert registry.pointer() == "v1"
+    assert registry.version() == "v1"
+
+
+def test_load_rejects_unknown_version(registry):
+    with pytest.raises(ModelVersionNotFound):
+        registry.load("v2", activate=True)
+
+    assert registry.pointer() == "v1"
+
+
+def test_register_rejects_path_like_versions(registry, tmp_path):
+    with pytest.raises(InvalidModelVersion):
+        registry.register({"weights": []}, version="../escaped")
+
+    assert not os.path.exists(tmp_path / "models" / "escaped.pkl")
+
+
+@pytest.mark.parametrize("endpoint", ["/anomalies/model/reload", "/predict/model/reload"])
+def test_reload_endpoints_reject_bad_versions(client, endpoint):
+    response = client.post(endpoint, params={"version": "../../etc/passwd"})
+    assert response.status_code == 400
+
+    response = client.post(endpoint, params={"version": "no-such-version"})
+    assert response.status_code == 404
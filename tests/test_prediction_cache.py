@@ -0,0 +1,104 @@
+import pytest
+
+from app.prediction_cache import PredictionCache, prediction_key
+from app.vitals_store import write_vitals
+
+FEATURES = {"heart_rate": 88, "oxygen_level": 97, "temperature": 98.6, "conditions": "Diabetes"}
+
+
+def test_lookup_hits_only_for_the_same_inputs():
+    cache = PredictionCache(max_entries=10)
+    key = prediction_key("patient_1", "v1", FEATURES)
+    cache.put("patient_1", key, {"prediction": "Low"})
+
+    assert cache.get("patient_1", prediction_key("patient_1", "v1", dict(FEATURES))) == {"prediction": "Low"}
+    assert cache.get("patient_1", prediction_key("patient_1", "v1", {**FEATURES, "heart_rate": 89})) is None
+    assert cache.get("patient_2", key) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_new_model_version_misses():
+    cache = PredictionCache(max_entries=10)
+    cache.put("patient_1", prediction_key("patient_1", "v1", FEATURES), {"prediction": "Low"})
+
+    assert prediction_key("patient_1", "v2", FEATURES) != prediction_key("patient_1", "v1", FEATURES)
+    assert cache.get("patient_1", prediction_key("patient_1", "v2", FEATURES)) is None
+
+
+def test_new_prediction_replaces_the_patients_entry():
+    cache = PredictionCache(max_entries=10)
+    old_key = prediction_key("patient_1", "v1", FEATURES)
+    new_key = prediction_key("patient_1", "v1", {**FEATURES, "heart_rate": 120})
+    cache.put("patient_1", old_key, {"prediction": "Low"})
+    cache.put("patient_1", new_key, {"prediction": "High"})
+
+    assert cache.get("patient_1", old_key) is None
+    assert cache.get("patient_1", new_key) == {"prediction": "High"}
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_patient_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    keys = {patient_id: prediction_key(patient_id, "v1", FEATURES) for patient_id in ("p1", "p2", "p3")}
+    cache.put("p1", keys["p1"], {"prediction": "Low"})
+    cache.put("p2", keys["p2"], {"prediction": "Low"})
+    # Reading p1 makes p2 the least recently used
+    assert cache.get("p1", keys["p1"]) is not None
+    cache.put("p3", keys["p3"], {"prediction": "Low"})
+
+    assert cache.get("p2", keys["p2"]) is None
+    assert cache.get("p1", keys["p1"]) is not None
+    assert cache.get("p3", keys["p3"]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_zero_size_disables_the_cache():
+    cache = PredictionCache(max_entries=0)
+    key = prediction_key("patient_1", "v1", FEATURES)
+    cache.put("patient_1", key, {"prediction": "Low"})
+
+    assert cache.get("patient_1", key) is None
+    assert cache.stats()["enabled"] is False
+
+
+@pytest.fixture
+def scored_patient(db):
+    from app.routers.predictions import risk_models, risk_prediction_cache
+    if risk_models.active is None:
+        pytest.skip("risk model not loaded")
+    risk_prediction_cache.clear()
+    db.child("patients/patient_1").set({"personalInfo": {"age": 70},
+                                        "medicalHistory": {"conditions": ["Diabetes"]}})
+    db.child("iotData/monitor_1/deviceInfo").set({"type": "vitals_monitor", "currentPatientId": "patient_1"})
+    write_vitals("monitor_1", "patient_1", "1790000000000",
+                 {"heartRate": 88, "oxygenLevel": 97, "temperature": 98.6, "respiratoryRate": 16}, root_ref=db)
+    yield db
+    risk_prediction_cache.clear()
+
+
+def test_unchanged_inputs_return_the_stored_prediction(client, scored_patient):
+    first = client.get("/predict/risk/patient_1").json()
+    logs = scored_patient.child("aiLogs/patient_1").get(shallow=True)
+
+    second = client.get("/predict/risk/patient_1").json()
+
+    assert first["cached"] is False
+    assert second["cached"] is True
+    # The stored prediction as it is, including when it was made and when it is next due
+    assert second["prediction_details"] == first["prediction_details"]
+    stored = scored_patient.child("patients/patient_1/predictions").get()
+    for field in ("riskLevel", "riskScore", "predictedAt", "nextPrediction"):
+        assert second["prediction_details"][field] == stored[field]
+    assert scored_patient.child("aiLogs/patient_1").get(shallow=True) == logs
+
+
+def test_new_reading_is_scored_again(client, scored_patient):
+    client.get("/predict/risk/patient_1")
+    write_vitals("monitor_1", "patient_1", "1790000060000",
+                 {"heartRate": 131, "oxygenLevel": 90, "temperature": 101.2, "respiratoryRate": 26})
+
+    response = client.get("/predict/risk/patient_1").json()
+
+    assert response["cached"] is False
+    assert response["prediction_details"]["vitalsUsed"]["heartRate"] == 131
@@ -0,0 +1,90 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import app.routers.realtime as realtime
+from app.timekeys import encode_key
+from app.vitals_ingest import ingest_readings
+
+MOMENT = datetime(2026, 10, 16, 12, 0, 0, 123000)
+
+
+@pytest.fixture
+def monitor(db):
+    db.child("iotData/monitor_1/deviceInfo").set({"type": "vitals_monitor", "currentPatientId": "patient_1"})
+    return db
+
+
+def reading(heart_rate, device_id="monitor_1"):
+    return {"deviceId": device_id, "data": {"heartRate": heart_rate}, "timestamp": MOMENT.isoformat()}
+
+
+@pytest.fixture
+def gated_ingest(monkeypatch):
+    """ingest_readings that waits for the test before storing each batch"""
+    gate = threading.Event()
+    batches = []
+
+    def ingest(readings):
+        gate.wait(5)
+        batches.append(len(readings))
+        return ingest_readings(readings)
+
+    monkeypatch.setattr(realtime, "ingest_readings", ingest)
+    return gate, batches
+
+
+def test_websocket_stops_reading_while_its_queue_is_full(client, monitor, monkeypatch, gated_ingest):
+    gate, batches = gated_ingest
+    monkeypatch.setattr(realtime, "STREAM_QUEUE_SIZE", 2)
+    monkeypatch.setattr(realtime, "STREAM_BATCH_SIZE", 1)
+    received = realtime.stream_stats["received"]
+
+    with client.websocket_connect("/ws/vitals") as websocket:
+        assert websocket.receive_json() == {"type": "ready", "credit": 2, "batchSize": 1}
+        for seq in range(6):
+            websocket.send_json({**reading(70 + seq), "timestamp": None, "seq": seq})
+        time.sleep(0.3)
+        # One batch being stored, two queued and one waiting to be queued; the rest stay unread
+        assert realtime.stream_stats["received"] - received == 4
+
+        gate.set()
+        acks = [websocket.receive_json() for _ in range(6)]
+
+    assert [ack["results"][0]["seq"] for ack in acks] == list(range(6))
+    assert all(ack["type"] == "ack" and ack["results"][0]["status"] == "stored" for ack in acks)
+    assert all(0 <= ack["credit"] <= 2 for ack in acks)
+    assert batches == [1] * 6
+
+
+def test_websocket_rejects_bad_messages_without_closing(client, monitor):
+    with client.websocket_connect("/ws/vitals") as websocket:
+        websocket.receive_json()
+        websocket.send_text("not json")
+        assert websocket.receive_json()["results"][0]["error"] == "Invalid JSON"
+        websocket.send_json([{"seq": 7, "data": {}}, {**reading(70), "seq": 8}])
+        rejected = websocket.receive_json()
+        stored = websocket.receive_json()
+
+    assert rejected["results"][0]["seq"] == 7 and rejected["results"][0]["status"] == "rejected"
+    assert stored["results"] == [{"deviceId": "monitor_1", "status": "stored", "timestamp": encode_key(MOMENT),
+                                  "patientId": "patient_1", "seq": 8}]
+
+
+def test_ndjson_stream_is_stored_in_batches(client, monitor, monkeypatch, gated_ingest):
+    gate, batches = gated_ingest
+    gate.set()
+    monkeypatch.setattr(realtime, "STREAM_BATCH_SIZE", 2)
+    lines = [f'{{"deviceId": "monitor_1", "data": {{"heartRate": {70 + i}}}}}' for i in range(5)]
+    lines[2:2] = ["not json", '{"deviceId": "monitor_9", "data": {}}']
+
+    response = client.post("/stream/vitals", content="\n".join(lines).encode())
+
+    assert response.status_code == 200
+    assert response.json()["stored"] == 5
+    assert [(error["seq"], error["error"]) for error in response.json()["errors"]] == [
+        (3, "Invalid JSON"), (4, "Device not found")]
+    # The unknown device is rejected when its batch is stored
+    assert batches == [2, 2, 2]
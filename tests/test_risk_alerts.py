@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from app.routers.predictions import alert_paths
+
+
+def test_alerts_raised_in_the_same_millisecond_do_not_share_paths():
+    moment = datetime(2026, 10, 16, 12, 0, 0, 123000)
+    vitals = {"heartRate": 130}
+
+    first_key, first_paths = alert_paths("patient_1", "High", 81, vitals, "monitor_1", moment)
+    second_key, second_paths = alert_paths("patient_2", "Critical", 93, vitals, "monitor_2", moment)
+    # Same patient twice, e.g. an API request and the scheduler
+    third_key, third_paths = alert_paths("patient_1", "High", 82, vitals, "monitor_1", moment)
+
+    assert len({first_key, second_key, third_key}) == 3
+    assert not set(first_paths) & set(second_paths)
+    assert not set(first_paths) & set(third_paths)
+    assert f"alerts/{first_key}" in first_paths
+    assert first_paths[f"alerts/{first_key}"]["patientId"] == "patient_1"
@@ -0,0 +1,109 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app.risk_scheduler as risk_scheduler_module
+from app.risk_scheduler import RISK_SCHEDULER_LEASE_PATH, RiskScheduler
+from app.routers.predictions import format_datetime_for_firebase
+
+
+def patient(next_prediction=None):
+    record = {"personalInfo": {"age": 70}}
+    if next_prediction is not None:
+        record["predictions"] = {"nextPrediction": format_datetime_for_firebase(next_prediction)}
+    return record
+
+
+def scored(next_prediction):
+    return {"prediction_details": {"nextPrediction": format_datetime_for_firebase(next_prediction)},
+            "alert_created": False}
+
+
+def test_rebuild_queues_stored_next_predictions():
+    scheduler = RiskScheduler()
+    now = datetime.now()
+    scheduler._rebuild({
+        "overdue": patient(now - timedelta(minutes=30)),
+        "later": patient(now + timedelta(hours=2)),
+        "never_scored": patient(),
+        "broken": "not a patient"
+    })
+
+    due = scheduler._pop_due(time.time())
+
+    assert [patient_id for _, patient_id in due] == ["overdue", "never_scored"]
+    assert set(scheduler._due) == {"later"}
+    assert scheduler._next_due() == pytest.approx((now + timedelta(hours=2)).timestamp(), abs=1)
+
+
+def test_pop_due_returns_most_overdue_first_and_skips_stale_entries():
+    scheduler = RiskScheduler()
+    now = datetime.now()
+    scheduler.schedule("p1", now - timedelta(minutes=5))
+    scheduler.schedule("p2", now - timedelta(minutes=20))
+    scheduler.schedule("p3", now - timedelta(minutes=10))
+    # Rescheduled after being queued: only the newest time counts
+    scheduler.schedule("p3", now + timedelta(minutes=10))
+    scheduler.schedule("p1", now - timedelta(minutes=1))
+
+    due = scheduler._pop_due(now.timestamp())
+
+    assert [patient_id for _, patient_id in due] == ["p2", "p1"]
+    assert due[1][0] == (now - timedelta(minutes=1)).timestamp()
+    assert scheduler._pop_due(now.timestamp()) == []
+    assert [patient_id for _, patient_id in scheduler._pop_due((now + timedelta(minutes=11)).timestamp())] == ["p3"]
+    assert scheduler._next_due() is None
+
+
+def test_score_reschedules_results_and_retries_errors(monkeypatch):
+    scheduler = RiskScheduler()
+    scheduler._rebuild({"p1": patient(), "p2": patient()})
+    scheduler._pop_due(time.time())
+    next_prediction = datetime.now().replace(microsecond=0) + timedelta(hours=4)
+    # p3 was deleted since the last refresh
+    monkeypatch.setattr(risk_scheduler_module, "predict_patients",
+                        lambda patient_ids, patients: ({"p1": scored(next_prediction)},
+                                                       {"p2": "No recent vitals", "p3": "Patient not found"}))
+
+    scheduler._score(["p1", "p2", "p3"])
+
+    retry_at = time.time() + risk_scheduler_module.RISK_SCHEDULER_RETRY_MINUTES * 60
+    assert scheduler._due["p1"] == next_prediction.timestamp()
+    assert scheduler._due["p2"] == pytest.approx(retry_at, abs=5)
+    assert "p3" not in scheduler._due
+    stats = scheduler.stats()
+    assert (stats["scored"], stats["skipped"], stats["inFlight"]) == (1, 2, 0)
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    scheduler = RiskScheduler()
+    scheduler._rebuild({"p1": patient(), "p2": patient()})
+    scheduler._pop_due(time.time())
+
+    def fail(patient_ids, patients):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(risk_scheduler_module, "predict_patients", fail)
+    scheduler._score(["p1", "p2"])
+
+    retry_at = time.time() + risk_scheduler_module.RISK_SCHEDULER_RETRY_MINUTES * 60
+    assert scheduler._due == {"p1": pytest.approx(retry_at, abs=5), "p2": pytest.approx(retry_at, abs=5)}
+    assert scheduler._pop_due(time.time()) == []
+    assert scheduler.stats()["errors"] == 1
+
+
+def test_live_lease_is_not_taken_by_another_worker(db):
+    holder, other = RiskScheduler(), RiskScheduler()
+
+    assert holder._renew_lease()
+    assert not other._renew_lease()
+    assert holder._renew_lease()
+    assert db.child(RISK_SCHEDULER_LEASE_PATH).get()["owner"] == holder._owner
+
+    # Released on stop, or left to expire: either way the other worker takes over
+    holder._release_lease()
+    assert other._renew_lease()
+    db.child(RISK_SCHEDULER_LEASE_PATH).update({"expiresAt": time.time() - 1})
+    assert holder._renew_lease()
+    assert not other._renew_lease()
@@ -0,0 +1,124 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from app.risk_scorer import CompiledRiskModel, sample_rows
+from app.vitals_store import write_vitals
+
+SHIPPED_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "models", "patient_risk_model.pkl")
+NUMERIC = ["age", "heart_rate", "systolic_bp", "diastolic_bp", "temperature",
+           "oxygen_level", "respiratory_rate", "glucose", "num_conditions"]
+CONDITIONS = ["", "Diabetes", "Hypertension", "Diabetes|Hypertension", "COPD"]
+
+
+def shipped_pipeline():
+    if not os.path.exists(SHIPPED_MODEL):
+        pytest.skip("shipped risk model not present")
+    return joblib.load(SHIPPED_MODEL)
+
+
+def fitted_pipeline(missing_fraction=0.1, seed=0):
+    """Small pipeline with the shipped layout, trained on rows with missing values"""
+    rng = np.random.default_rng(seed)
+    n_rows = 1500
+    frame = pd.DataFrame(rng.normal(80, 20, size=(n_rows, len(NUMERIC))), columns=NUMERIC)
+    frame = frame.mask(rng.random(frame.shape) < missing_fraction)
+    frame["conditions"] = rng.choice(CONDITIONS, n_rows)
+    labels = np.where(frame["heart_rate"].fillna(80) > 95, "High", np.where(frame["glucose"].fillna(80) > 90, "Medium", "Low"))
+    preprocessor = ColumnTransformer([
+        ("num", "passthrough", NUMERIC),
+        ("cat", OneHotEncoder(handle_unknown="ignore"), ["conditions"])
+    ])
+    pipeline = Pipeline([
+        ("preprocessor", preprocessor),
+        ("classifier", RandomForestClassifier(n_estimators=20, random_state=seed))
+    ])
+    return pipeline.fit(frame, labels)
+
+
+def expected_proba(pipeline, rows):
+    columns = list(pipeline.named_steps["preprocessor"].feature_names_in_)
+    return pipeline.predict_proba(pd.DataFrame(rows, columns=columns))
+
+
+def incomplete_rows():
+    complete = {"heart_rate": 120, "oxygen_level": 91, "temperature": 101.5, "systolic_bp": 150,
+                "diastolic_bp": 95, "age": 70, "glucose": 180, "respiratory_rate": 24,
+                "num_conditions": 1, "conditions": "Diabetes"}
+    rows = []
+    for column in NUMERIC:
+        rows.append({**complete, column: None})
+    rows.append({column: None for column in NUMERIC} | {"conditions": ""})
+    return rows
+
+
+@pytest.mark.parametrize("pipeline_factory", [
+    pytest.param(shipped_pipeline, id="shipped"),
+    pytest.param(fitted_pipeline, id="trained-with-missing"),
+    pytest.param(lambda: fitted_pipeline(missing_fraction=0.0), id="trained-without-missing")
+])
+def test_compiled_probabilities_match_pipeline_exactly(pipeline_factory):
+    pipeline = pipeline_factory()
+    compiled = CompiledRiskModel.from_pipeline(pipeline)
+    rows = sample_rows(compiled, 2000, seed=3) + incomplete_rows()
+
+    expected = expected_proba(pipeline, rows)
+
+    assert any(value is None for row in rows for value in row.values())
+    assert np.array_equal(compiled.predict_proba(rows), expected)
+    assert np.array_equal(np.array([compiled.predict_proba_one(row) for row in rows]), expected)
+    assert np.array_equal(compiled.classes_, pipeline.named_steps["classifier"].classes_)
+
+
+def test_missing_value_is_scored_not_rejected():
+    compiled = CompiledRiskModel.from_pipeline(fitted_pipeline())
+    row = incomplete_rows()[1]
+
+    probabilities = compiled.predict_proba_one(row)
+
+    assert np.isfinite(probabilities).all()
+    assert probabilities.sum() == pytest.approx(1.0)
+
+
+def test_shared_arrays_score_the_same():
+    compiled = CompiledRiskModel.from_pipeline(fitted_pipeline())
+    rows = sample_rows(compiled, 200, seed=4) + incomplete_rows()
+    copy = compiled.with_arrays({key: np.array(value) for key, value in compiled.arrays().items()})
+
+    assert np.array_equal(copy.predict_proba(rows), compiled.predict_proba(rows))
+
+
+def seed_patient(db, patient_id, monitor_id, vitals):
+    db.child(f"patients/{patient_id}").set({"personalInfo": {"age": 70},
+                                            "medicalHistory": {"conditions": ["Diabetes"]}})
+    db.child(f"iotData/{monitor_id}/deviceInfo").set({"type": "vitals_monitor", "currentPatientId": patient_id})
+    write_vitals(monitor_id, patient_id, "1790000000000", vitals, root_ref=db)
+
+
+def test_risk_endpoints_accept_incomplete_readings(client, db):
+    from app.routers.predictions import risk_models
+    if risk_models.active is None:
+        pytest.skip("risk model not loaded")
+    seed_patient(db, "patient_complete", "monitor_complete",
+                 {"heartRate": 88, "oxygenLevel": 97, "temperature": 98.6, "glucose": 110,
+                  "respiratoryRate": 16, "bloodPressure": {"systolic": 125, "diastolic": 82}})
+    # No oxygen level, glucose or blood pressure
+    seed_patient(db, "patient_incomplete", "monitor_incomplete",
+                 {"heartRate": 131, "temperature": 101.2, "respiratoryRate": 26})
+
+    response = client.get("/predict/risk/patient_incomplete")
+    assert response.status_code == 200
+    assert response.json()["prediction"] in response.json()["probabilities"]
+
+    response = client.post("/predict/risk:batch", json={"patient_ids": ["patient_complete", "patient_incomplete"]})
+    assert response.status_code == 200
+    assert response.json()["scored"] == 2
+    assert response.json()["errors"] == {}
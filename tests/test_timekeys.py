@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from app.timekeys import decode_key, encode_key, key_order, read_last, read_window, unique_key
+
+
+def test_unique_keys_differ_within_a_millisecond():
+    moment = datetime(2026, 10, 16, 12, 0, 0, 123000)
+
+    keys = {unique_key(moment) for _ in range(1000)}
+
+    assert len(keys) == 1000
+    assert all(key.startswith(encode_key(moment) + "-") for key in keys)
+
+
+def test_unique_keys_sort_and_decode_by_time():
+    moment = datetime(2026, 10, 16, 12, 0, 0, 123000)
+    earlier, later = unique_key(moment - timedelta(milliseconds=1)), unique_key(moment)
+
+    assert decode_key(later) == decode_key(encode_key(moment)) == moment
+    assert earlier < encode_key(moment) < later
+    assert key_order(earlier) < key_order(later)
+    assert decode_key(encode_key(moment) + "x") is None
+
+
+def test_key_queries_include_unique_keys(db):
+    moment = datetime(2026, 10, 16, 12, 0, 0, 123000)
+    ref = db.child("alerts")
+    plain, unique = encode_key(moment - timedelta(seconds=1)), unique_key(moment)
+    ref.update({plain: {"n": 1}, unique: {"n": 2}})
+
+    assert list(read_window(ref, moment - timedelta(seconds=5), moment)) == [plain, unique]
+    assert [key for key, _ in read_last(ref, 1)] == [unique]
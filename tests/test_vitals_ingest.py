@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pytest
+
+import app.routers.iot as iot
+from app.timekeys import encode_key
+from app.vitals_ingest import VitalsReading, ingest_readings
+from app.vitals_store import read_range
+
+MOMENT = datetime(2026, 10, 16, 12, 0, 0, 123000)
+
+
+@pytest.fixture
+def monitor(db):
+    db.child("iotData/monitor_1/deviceInfo").set({"type": "vitals_monitor", "currentPatientId": "patient_1"})
+    return db
+
+
+def reading(heart_rate, moment=MOMENT, device_id="monitor_1"):
+    return {"deviceId": device_id, "data": {"heartRate": heart_rate}, "timestamp": moment.isoformat()}
+
+
+def pointer(db):
+    return db.child("iotData/monitor_1/latestVitals/patient_1/timestamp").get()
+
+
+def test_readings_in_the_same_millisecond_get_consecutive_keys(monitor):
+    results = ingest_readings([VitalsReading(**reading(heart_rate)) for heart_rate in (70, 71, 72)])
+
+    first = int(encode_key(MOMENT))
+    assert [int(result["timestamp"]) for result in results] == [first, first + 1, first + 2]
+    stored = read_range("monitor_1", "patient_1", MOMENT.replace(microsecond=0), MOMENT.replace(second=1))
+    assert [record["heartRate"] for _, record in stored] == [70, 71, 72]
+    assert pointer(monitor) == results[-1]["timestamp"]
+
+
+def test_latest_vitals_pointer_only_moves_forward(client, monitor):
+    newer = MOMENT.replace(minute=5)
+    older = MOMENT.replace(minute=1)
+    # Out of order within one batch: the pointer takes the newest reading
+    response = client.post("/iotData/vitals:batch", json={"readings": [reading(80, newer), reading(70, older)]})
+    assert response.json()["stored"] == 2
+    assert pointer(monitor) == encode_key(newer)
+
+    # A backfilled older reading is stored but leaves the pointer alone
+    response = client.post("/iotData/vitals:batch", json={"readings": [reading(60, MOMENT)]})
+
+    assert response.json()["stored"] == 1
+    assert pointer(monitor) == encode_key(newer)
+    assert monitor.child("iotData/monitor_1/latestVitals/patient_1/data").get() == {"heartRate": 80}
+
+
+def test_batch_reports_rejected_readings(client, monitor):
+    response = client.post("/iotData/vitals:batch", json={"readings": [
+        reading(70), reading(70, device_id="monitor_9"), {**reading(70), "patientId": "patient_2"}]})
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == ["stored", "rejected", "rejected"]
+
+
+def test_batch_above_the_limit_is_rejected(client, monitor, monkeypatch):
+    monkeypatch.setattr(iot, "VITALS_BATCH_MAX_ITEMS", 2)
+
+    response = client.post("/iotData/vitals:batch", json={"readings": [reading(70)] * 3})
+
+    assert response.status_code == 413
+    assert pointer(monitor) is None
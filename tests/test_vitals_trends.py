@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from app.vitals_trends import TREND_FIELDS, TrendState
+
+
+def expected_stats(times, values, window):
+    """Mean, population std and least-squares slope per minute over the last `window` readings"""
+    times, values = np.array(times[-window:]), np.array(values[-window:])
+    mean, std, slope = (np.full(len(TREND_FIELDS), np.nan) for _ in range(3))
+    for f in range(len(TREND_FIELDS)):
+        present = ~np.isnan(values[:, f])
+        x, y = times[present] - times[0], values[present, f]
+        if len(y):
+            mean[f], std[f] = y.mean(), y.std()
+        if len(y) >= 2:
+            slope[f] = np.polyfit(x, y, 1)[0] * 60
+    return mean, std, slope
+
+
+def random_readings(n_readings, missing, seed=0):
+    rng = np.random.default_rng(seed)
+    seconds = 1790000000.0 + np.cumsum(rng.uniform(20, 90, n_readings))
+    values = rng.normal([80, 120, 80, 97, 16, 98.6, 110], [8, 10, 6, 1.5, 2, 0.6, 15],
+                        size=(n_readings, len(TREND_FIELDS)))
+    values[rng.random(values.shape) < missing] = np.nan
+    # A field that stays missing for a stretch longer than the smallest window
+    values[10:18, 0] = np.nan
+    return seconds, values
+
+
+@pytest.mark.parametrize("missing", [0.0, 0.3])
+def test_window_stats_match_a_recompute_after_every_reading(missing):
+    state = TrendState(windows=[3, 5, 8], alpha=0.3)
+    seconds, values = random_readings(45, missing)
+
+    for step, (moment, reading) in enumerate(zip(seconds, values), start=1):
+        state.add(moment, reading)
+        # 45 readings wrap the 8-slot ring several times and cross every rebuild
+        for i, window in enumerate(state.windows):
+            mean, std, slope = state.window_stats(i)
+            expected = expected_stats(list(seconds[:step]), list(values[:step]), window)
+            for actual, wanted in zip((mean, std, slope), expected):
+                np.testing.assert_allclose(actual, wanted, rtol=1e-6, atol=1e-6, err_msg=f"step {step}, window {window}")
+
+
+def test_missing_fields_do_not_enter_sums_or_ewma():
+    state = TrendState(windows=[3], alpha=0.5)
+    heart_rate = TREND_FIELDS.index("heart_rate")
+    for moment, value in ((0.0, 60.0), (60.0, np.nan), (120.0, np.nan), (180.0, 90.0)):
+        reading = np.full(len(TREND_FIELDS), np.nan)
+        reading[heart_rate] = value
+        state.add(moment, reading)
+
+    mean, std, slope = state.window_stats(0)
+    snapshot = state.snapshot()["fields"]["heart_rate"]
+
+    # Only the reading at 180 s is in the 3-reading window
+    assert mean[heart_rate] == 90.0
+    assert std[heart_rate] == 0.0
+    assert np.isnan(slope[heart_rate])
+    assert snapshot["windows"]["3"]["readings"] == 1
+    assert snapshot["last"] == 90.0
+    assert snapshot["ewma"] == 75.0
+    assert snapshot["windows"]["3"]["mean"] is not None
+    assert state.snapshot()["fields"]["glucose"]["windows"]["3"]["mean"] is None
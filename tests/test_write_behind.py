@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+
+import app.write_behind as write_behind_module
+from app.routers.predictions import alert_paths
+from app.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def queue(db, monkeypatch):
+    """Running queue that only flushes when told to"""
+    monkeypatch.setattr(write_behind_module, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(write_behind_module, "WRITE_BEHIND_FLUSH_INTERVAL", 60)
+    queue = WriteBehindQueue("test")
+    queue.start()
+    yield queue
+    queue.stop()
+
+
+def test_writes_are_coalesced_into_one_update(queue, db):
+    queue.submit({"patients/p1/predictions": {"riskLevel": "Low", "riskScore": 10}})
+    queue.submit({"patients/p1/predictions": {"riskLevel": "High", "riskScore": 80}})
+    queue.submit({"patients/p1/predictions/alertId": "a1", "patients/p2/predictions": {"riskLevel": "Low"}})
+
+    assert db.child("patients").get() is None
+    assert queue.flush() == 2
+    assert db.child("patients").get() == {
+        "p1": {"predictions": {"riskLevel": "High", "riskScore": 80, "alertId": "a1"}},
+        "p2": {"predictions": {"riskLevel": "Low"}}
+    }
+    stats = queue.stats()
+    assert stats["coalesced"] == 2
+    assert stats["droppedAlerts"] == 0
+    assert stats["flushes"] == 1
+
+
+def test_alerts_raised_in_the_same_millisecond_all_reach_the_database(queue, db):
+    moment = datetime(2026, 10, 16, 12, 0, 0, 123000)
+    keys = []
+    for patient_id in ("p1", "p2", "p1"):
+        alert_key, paths = alert_paths(patient_id, "High", 80, {"heartRate": 130}, "monitor_1", moment)
+        keys.append(alert_key)
+        queue.submit(paths)
+
+    queue.flush()
+
+    assert sorted(db.child("alerts").get()) == sorted(keys)
+    assert sorted(db.child("iotData/monitor_1/alerts").get()) == sorted(keys)
+    assert queue.stats()["droppedAlerts"] == 0
+
+
+def test_overwritten_pending_alerts_are_counted_as_dropped(queue, db):
+    queue.submit({"alerts/001790000000000": {"patientId": "p1"},
+                  "iotData/monitor_1/alerts/001790000000000": {"type": "warning"}})
+    queue.submit({"alerts/001790000000000": {"patientId": "p2"}})
+    # Replacing the monitor's whole alerts subtree drops the pending entry under it
+    queue.submit({"iotData/monitor_1/alerts": {"001790000000001": {"type": "critical"}}})
+    # Updating a field of a pending alert keeps the alert
+    queue.submit({"alerts/001790000000000/resolved": True})
+
+    stats = queue.stats()
+    assert stats["droppedAlerts"] == 2
+    assert stats["coalesced"] == 1
+
+
+def test_failed_flush_is_retried_under_newer_writes(queue, db, monkeypatch):
+    get_ref = write_behind_module.get_ref
+    failures = [RuntimeError("network down")]
+
+    def flaky_get_ref(path, *args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return get_ref(path, *args, **kwargs)
+
+    monkeypatch.setattr(write_behind_module, "get_ref", flaky_get_ref)
+    queue.submit({"x/a": {"v": 1}, "x/b": 2})
+    assert queue.flush() == 0
+    queue.submit({"x/a/v": 5, "x/c": 3})
+
+    assert queue.flush() == 3
+    assert db.child("x").get() == {"a": {"v": 5}, "b": 2, "c": 3}
+    assert queue.stats()["failedFlushes"] == 1
+
+
+def test_stop_writes_everything_pending(queue, db):
+    queue.submit({"aiLogs/p1/001790000000000": {"prediction": "High"}})
+
+    queue.stop()
+
+    assert db.child("aiLogs/p1").get() == {"001790000000000": {"prediction": "High"}}
+    assert queue.pending_count() == 0
@@ -1,6 +1,17 @@
 """
 Training script for Anomaly Detection using Isolation Forest
 This script trains a single Isolation Forest model and saves it to the models folder
+
+Synthetic samples are drawn a whole feature column at a time with NumPy, so
+generating millions of samples takes seconds. Large datasets can be generated
+by several processes (each filling its own shard of the output) into a
+columnar directory of one .npy file per feature, which training then reads
+directly:
+
+    python train_anomaly.py                                     # 1500 normal + 250 anomalous, in memory
+    python train_anomaly.py --normal-samples 5000000 --anomalous-samples 250000 \
+        --workers 8 --data-dir data/anomaly_training --generate-only
+    python train_anomaly.py --data-dir data/anomaly_training    # train from the generated columns
 """
 
 import pandas as pd
@@ -8,185 +19,280 @@ import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import joblib
-import random
 import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+from multiprocessing import Pool
+
+FEATURE_NAMES = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'temperature',
+                 'oxygen_level', 'respiratory_rate', 'glucose', 'env_temperature',
+                 'env_humidity', 'env_air_quality', 'env_noise_level', 'env_co2_level',
+                 'env_light_level', 'env_pressure']
+
+# Baselines per patient type (young_healthy, middle_aged, elderly, pediatric)
+PATIENT_BASELINES = {
+    'heart_rate': [68, 72, 75, 85],
+    'systolic_bp': [115, 125, 135, 100],
+    'diastolic_bp': [75, 82, 85, 65],
+    'temperature': [36.8, 37.0, 37.1, 37.2],
+    'oxygen_level': [99, 98, 97, 99],
+    'respiratory_rate': [14, 16, 18, 22],
+}
+
+# (mean, standard deviation) of normal samples; vital means come from PATIENT_BASELINES
+NORMAL_DISTRIBUTIONS = {
+    'heart_rate': (None, 8),
+    'systolic_bp': (None, 12),
+    'diastolic_bp': (None, 8),
+    'temperature': (None, 0.3),
+    'oxygen_level': (None, 1.5),
+    'respiratory_rate': (None, 3),
+    'glucose': (100, 15),
+    'env_temperature': (22, 1.5),
+    'env_humidity': (45, 6),
+    'env_air_quality': (85, 7),
+    'env_noise_level': (35, 6),
+    'env_co2_level': (400, 50),
+    'env_light_level': (300, 40),
+    'env_pressure': (1013.25, 2),
+}
+
+NORMAL_BOUNDS = {
+    'heart_rate': (50, 110), 'systolic_bp': (80, 150), 'diastolic_bp': (50, 100),
+    'temperature': (35.5, 38.0), 'oxygen_level': (90, 100), 'respiratory_rate': (10, 25),
+    'glucose': (60, 180), 'env_temperature': (18, 28), 'env_humidity': (25, 80),
+    'env_air_quality': (40, 100), 'env_noise_level': (20, 60), 'env_co2_level': (300, 800),
+    'env_light_level': (150, 500), 'env_pressure': (1000, 1030),
+}
+
+# Baseline that anomalies are introduced into
+ANOMALOUS_BASELINE = {
+    'heart_rate': (75, 10), 'systolic_bp': (120, 15), 'diastolic_bp': (80, 10),
+    'temperature': (36.8, 0.3), 'oxygen_level': (97, 2), 'respiratory_rate': (16, 3),
+    'glucose': (100, 20), 'env_temperature': (22, 2), 'env_humidity': (45, 8),
+    'env_air_quality': (85, 10), 'env_noise_level': (35, 8), 'env_co2_level': (400, 80),
+    'env_light_level': (300, 60), 'env_pressure': (1013.25, 3),
+}
+
+# Uniform ranges each anomaly type draws its affected features from
+ANOMALY_RANGES = {
+    'cardiac_stress': {'heart_rate': (130, 180), 'systolic_bp': (160, 200)},
+    'medical_emergency': {'temperature': (39, 41), 'oxygen_level': (75, 90), 'respiratory_rate': (30, 45)},
+    'environmental_anomaly': {
+        'env_temperature': (32, 40),  # Too hot
+        'env_humidity': (85, 95),  # Too humid
+        'env_air_quality': (20, 40),  # Poor air
+        'env_noise_level': (70, 90),  # Too noisy
+        'env_co2_level': (800, 1500),  # High CO2
+        'env_light_level': (10, 50),  # Too dim
+        'env_pressure': (990, 1000),  # Low pressure
+    },
+    'combined_anomaly': {
+        'heart_rate': (110, 140), 'oxygen_level': (88, 94), 'env_temperature': (28, 35),
+        'env_co2_level': (600, 1000), 'env_noise_level': (60, 80),
+    },
+}
+
+ANOMALOUS_BOUNDS = {
+    'heart_rate': (40, 200), 'systolic_bp': (70, 220), 'diastolic_bp': (40, 130),
+    'temperature': (32, 42), 'oxygen_level': (70, 100), 'respiratory_rate': (8, 50),
+    'glucose': (40, 400), 'env_temperature': (10, 45), 'env_humidity': (10, 100),
+    'env_air_quality': (0, 100), 'env_noise_level': (15, 100), 'env_co2_level': (200, 2000),
+    'env_light_level': (5, 1000), 'env_pressure': (980, 1050),
+}
+
+# Samples generated per shard when generating with several processes
+DEFAULT_SHARD_SIZE = 250000
+
+def generate_normal_columns(num_samples, rng=None):
+    """
+    Draw normal samples column by column: {feature: array of num_samples}
+    Each sample gets a random patient type whose baselines set the vital sign means
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    patient_type = rng.integers(0, 4, num_samples)
+    columns = {}
+    for feature in FEATURE_NAMES:
+        mean, spread = NORMAL_DISTRIBUTIONS[feature]
+        if mean is None:
+            mean = np.asarray(PATIENT_BASELINES[feature], dtype=np.float64)[patient_type]
+        low, high = NORMAL_BOUNDS[feature]
+        # Ensure values are within realistic bounds
+        columns[feature] = np.clip(rng.normal(mean, spread, num_samples), low, high)
+    return columns
+
+def generate_anomalous_columns(num_samples, rng=None):
+    """
+    Draw anomalous samples column by column: a normal baseline with one of the
+    vital (cardiac stress or medical emergency), environmental or combined anomalies
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    columns = {feature: rng.normal(mean, spread, num_samples)
+               for feature, (mean, spread) in ANOMALOUS_BASELINE.items()}
+
+    anomaly_type = rng.integers(0, 3, num_samples)  # vital, environmental, combined
+    cardiac = (anomaly_type == 0) & (rng.random(num_samples) < 0.5)
+    masks = {
+        'cardiac_stress': cardiac,
+        'medical_emergency': (anomaly_type == 0) & ~cardiac,
+        'environmental_anomaly': anomaly_type == 1,
+        'combined_anomaly': anomaly_type == 2,
+    }
+    for kind, mask in masks.items():
+        count = int(mask.sum())
+        for feature, (low, high) in ANOMALY_RANGES[kind].items():
+            columns[feature][mask] = rng.uniform(low, high, count)
+
+    for feature, (low, high) in ANOMALOUS_BOUNDS.items():
+        # Ensure bounds are still respected
+        np.clip(columns[feature], low, high, out=columns[feature])
+    return {feature: columns[feature] for feature in FEATURE_NAMES}
+
+def columns_to_records(columns):
+    """Column dict -> list of per-sample dicts"""
+    return pd.DataFrame(columns).to_dict('records')
 
 def generate_synthetic_training_data(num_samples=1000):
     """
     Generate synthetic training data for anomaly detection
     This creates realistic vital signs data with complete environmental data
     """
-    training_data = []
-    
-    for i in range(num_samples):
-        # Generate more realistic normal data with varied baselines for different patient types
-        patient_type = random.choice(['young_healthy', 'middle_aged', 'elderly', 'pediatric'])
-        
-        if patient_type == 'young_healthy':
-            base_hr, base_sys, base_dia = 68, 115, 75
-            base_temp, base_o2, base_rr = 36.8, 99, 14
-        elif patient_type == 'middle_aged':
-            base_hr, base_sys, base_dia = 72, 125, 82
-            base_temp, base_o2, base_rr = 37.0, 98, 16
-        elif patient_type == 'elderly':
-            base_hr, base_sys, base_dia = 75, 135, 85
-            base_temp, base_o2, base_rr = 37.1, 97, 18
-        else:  # pediatric
-            base_hr, base_sys, base_dia = 85, 100, 65
-            base_temp, base_o2, base_rr = 37.2, 99, 22
-        
-        data_point = {
-            'heart_rate': np.random.normal(base_hr, 8),
-            'systolic_bp': np.random.normal(base_sys, 12),
-            'diastolic_bp': np.random.normal(base_dia, 8),
-            'temperature': np.random.normal(base_temp, 0.3),
-            'oxygen_level': np.random.normal(base_o2, 1.5),
-            'respiratory_rate': np.random.normal(base_rr, 3),
-            'glucose': np.random.normal(100, 15),  # Reduced variation for more realistic normal range
-            # Environmental data with more realistic variation
-            'env_temperature': np.random.normal(22, 1.5),  # Reduced variation
-            'env_humidity': np.random.normal(45, 6),  # Reduced variation
-            'env_air_quality': np.random.normal(85, 7),  # Reduced variation
-            'env_noise_level': np.random.normal(35, 6),  # Reduced variation
-            'env_co2_level': np.random.normal(400, 50),  # Reduced variation
-            'env_light_level': np.random.normal(300, 40),  # Reduced variation
-            'env_pressure': np.random.normal(1013.25, 2)  # Reduced variation
-        }
-        
-        # Ensure values are within realistic bounds
-        data_point['heart_rate'] = max(50, min(110, data_point['heart_rate']))
-        data_point['systolic_bp'] = max(80, min(150, data_point['systolic_bp']))
-        data_point['diastolic_bp'] = max(50, min(100, data_point['diastolic_bp']))
-        data_point['temperature'] = max(35.5, min(38.0, data_point['temperature']))
-        data_point['oxygen_level'] = max(90, min(100, data_point['oxygen_level']))
-        data_point['respiratory_rate'] = max(10, min(25, data_point['respiratory_rate']))
-        data_point['glucose'] = max(60, min(180, data_point['glucose']))
-        # Environmental bounds - update field names to match API
-        data_point['env_temperature'] = max(18, min(28, data_point['env_temperature']))
-        data_point['env_humidity'] = max(25, min(80, data_point['env_humidity']))
-        data_point['env_air_quality'] = max(40, min(100, data_point['env_air_quality']))
-        data_point['env_noise_level'] = max(20, min(60, data_point['env_noise_level']))
-        data_point['env_co2_level'] = max(300, min(800, data_point['env_co2_level']))
-        data_point['env_light_level'] = max(150, min(500, data_point['env_light_level']))
-        data_point['env_pressure'] = max(1000, min(1030, data_point['env_pressure']))
-        
-        training_data.append(data_point)
-    
-    return training_data
+    return columns_to_records(generate_normal_columns(num_samples))
 
 def generate_anomalous_training_data(num_samples=100):
     """
     Generate some anomalous training samples to improve model's detection capability
     This creates data points with various types of anomalies
     """
-    anomalous_data = []
-    
-    for i in range(num_samples):
-        # Start with normal baseline
-        data_point = {
-            'heart_rate': np.random.normal(75, 10),
-            'systolic_bp': np.random.normal(120, 15),
-            'diastolic_bp': np.random.normal(80, 10),
-            'temperature': np.random.normal(36.8, 0.3),
-            'oxygen_level': np.random.normal(97, 2),
-            'respiratory_rate': np.random.normal(16, 3),
-            'glucose': np.random.normal(100, 20),
-            'env_temperature': np.random.normal(22, 2),
-            'env_humidity': np.random.normal(45, 8),
-            'env_air_quality': np.random.normal(85, 10),
-            'env_noise_level': np.random.normal(35, 8),
-            'env_co2_level': np.random.normal(400, 80),
-            'env_light_level': np.random.normal(300, 60),
-            'env_pressure': np.random.normal(1013.25, 3)
-        }
-        
-        # Randomly introduce anomalies
-        anomaly_type = random.choice(['vital_anomaly', 'environmental_anomaly', 'combined_anomaly'])
-        
-        if anomaly_type == 'vital_anomaly':
-            # Introduce vital sign anomalies
-            if random.random() < 0.5:  # Cardiac stress
-                data_point['heart_rate'] = random.uniform(130, 180)
-                data_point['systolic_bp'] = random.uniform(160, 200)
-            else:  # Medical emergency
-                data_point['temperature'] = random.uniform(39, 41)
-                data_point['oxygen_level'] = random.uniform(75, 90)
-                data_point['respiratory_rate'] = random.uniform(30, 45)
-                
-        elif anomaly_type == 'environmental_anomaly':
-            # Introduce environmental anomalies
-            data_point['env_temperature'] = random.uniform(32, 40)  # Too hot
-            data_point['env_humidity'] = random.uniform(85, 95)  # Too humid
-            data_point['env_air_quality'] = random.uniform(20, 40)  # Poor air
-            data_point['env_noise_level'] = random.uniform(70, 90)  # Too noisy
-            data_point['env_co2_level'] = random.uniform(800, 1500)  # High CO2
-            data_point['env_light_level'] = random.uniform(10, 50)  # Too dim
-            data_point['env_pressure'] = random.uniform(990, 1000)  # Low pressure
-            
-        else:  # combined_anomaly
-            # Both vital and environmental issues
-            data_point['heart_rate'] = random.uniform(110, 140)
-            data_point['oxygen_level'] = random.uniform(88, 94)
-            data_point['env_temperature'] = random.uniform(28, 35)
-            data_point['env_co2_level'] = random.uniform(600, 1000)
-            data_point['env_noise_level'] = random.uniform(60, 80)
-        
-        # Ensure bounds are still respected
-        data_point['heart_rate'] = max(40, min(200, data_point['heart_rate']))
-        data_point['systolic_bp'] = max(70, min(220, data_point['systolic_bp']))
-        data_point['diastolic_bp'] = max(40, min(130, data_point['diastolic_bp']))
-        data_point['temperature'] = max(32, min(42, data_point['temperature']))
-        data_point['oxygen_level'] = max(70, min(100, data_point['oxygen_level']))
-        data_point['respiratory_rate'] = max(8, min(50, data_point['respiratory_rate']))
-        data_point['glucose'] = max(40, min(400, data_point['glucose']))
-        data_point['env_temperature'] = max(10, min(45, data_point['env_temperature']))
-        data_point['env_humidity'] = max(10, min(100, data_point['env_humidity']))
-        data_point['env_air_quality'] = max(0, min(100, data_point['env_air_quality']))
-        data_point['env_noise_level'] = max(15, min(100, data_point['env_noise_level']))
-        data_point['env_co2_level'] = max(200, min(2000, data_point['env_co2_level']))
-        data_point['env_light_level'] = max(5, min(1000, data_point['env_light_level']))
-        data_point['env_pressure'] = max(980, min(1050, data_point['env_pressure']))
-        
-        anomalous_data.append(data_point)
-    
-    return anomalous_data
+    return columns_to_records(generate_anomalous_columns(num_samples))
+
+def _fill_shard(task):
+    """Generate one shard and write it into its rows of the column files (runs in a worker process)"""
+    data_dir, kind, start, stop, seed = task
+    rng = np.random.default_rng(seed)
+    generate = generate_normal_columns if kind == 'normal' else generate_anomalous_columns
+    columns = generate(stop - start, rng)
+    for feature in FEATURE_NAMES:
+        column = np.load(os.path.join(data_dir, f"{feature}.npy"), mmap_mode='r+')
+        column[start:stop] = columns[feature]
+        column.flush()
+        del column
+    return stop - start
+
+def generate_dataset(data_dir, normal_samples, anomalous_samples, workers=1,
+                     shard_size=DEFAULT_SHARD_SIZE, seed=None):
+    """
+    Write a columnar dataset: one .npy per feature plus label.npy (0 normal, 1 anomalous)
+    and metadata.json. Shards are generated in parallel straight into their slices of
+    preallocated column files; each shard has its own seed from one SeedSequence, so
+    a given seed gives the same data whatever the number of workers
+    """
+    total = normal_samples + anomalous_samples
+    os.makedirs(data_dir, exist_ok=True)
+    for feature in FEATURE_NAMES:
+        np.lib.format.open_memmap(os.path.join(data_dir, f"{feature}.npy"), mode='w+',
+                                  dtype=np.float64, shape=(total,)).flush()
+    labels = np.zeros(total, dtype=np.int8)
+    labels[normal_samples:] = 1
+    np.save(os.path.join(data_dir, 'label.npy'), labels)
+
+    ranges = [('normal', start, min(start + shard_size, normal_samples))
+              for start in range(0, normal_samples, shard_size)]
+    ranges += [('anomalous', normal_samples + start, normal_samples + min(start + shard_size, anomalous_samples))
+               for start in range(0, anomalous_samples, shard_size)]
+    seed_sequence = np.random.SeedSequence(seed)
+    tasks = [(data_dir, kind, start, stop, shard_seed)
+             for (kind, start, stop), shard_seed in zip(ranges, seed_sequence.spawn(len(ranges)))]
+
+    if workers > 1 and len(tasks) > 1:
+        with Pool(min(workers, len(tasks))) as pool:
+            for _ in pool.imap_unordered(_fill_shard, tasks):
+                pass
+    else:
+        for task in tasks:
+            _fill_shard(task)
+
+    metadata = {
+        'samples': total,
+        'normal_samples': normal_samples,
+        'anomalous_samples': anomalous_samples,
+        'features': FEATURE_NAMES,
+        'shards': len(tasks),
+        'seed': seed_sequence.entropy,
+        'created_at': datetime.now().isoformat()
+    }
+    with open(os.path.join(data_dir, 'metadata.json'), 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    return metadata
+
+def load_training_columns(data_dir):
+    """Feature matrix, feature names and metadata of a dataset written by generate_dataset"""
+    with open(os.path.join(data_dir, 'metadata.json')) as metadata_file:
+        metadata = json.load(metadata_file)
+    feature_names = metadata['features']
+    X = np.empty((metadata['samples'], len(feature_names)), dtype=np.float64)
+    for i, feature in enumerate(feature_names):
+        # Memory-mapped, so each column is copied into the matrix without an intermediate
+        X[:, i] = np.load(os.path.join(data_dir, f"{feature}.npy"), mmap_mode='r')
+    return X, feature_names, metadata
 
 def prepare_features(data_list):
     """
-    Convert list of data dictionaries to feature matrix
+    Convert a column dict or a list of data dictionaries to a feature matrix
     """
-    feature_names = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'temperature', 
-                    'oxygen_level', 'respiratory_rate', 'glucose', 'env_temperature', 
-                    'env_humidity', 'env_air_quality', 'env_noise_level', 'env_co2_level', 
-                    'env_light_level', 'env_pressure']
+    feature_names = list(FEATURE_NAMES)
     
-    features = []
-    for data_point in data_list:
-        row = [data_point.get(feature, 0) for feature in feature_names]
-        features.append(row)
+    if isinstance(data_list, dict):
+        return np.column_stack([np.asarray(data_list[feature], dtype=np.float64) for feature in feature_names]), feature_names
     
-    return np.array(features), feature_names
+    frame = pd.DataFrame(list(data_list)).reindex(columns=feature_names).fillna(0)
+    return frame.to_numpy(dtype=np.float64), feature_names
 
-def train_isolation_forest_model():
+def build_training_matrix(normal_samples, anomalous_samples, data_dir=None, workers=1,
+                          shard_size=DEFAULT_SHARD_SIZE, seed=None):
+    """
+    Feature matrix, feature names, normal and anomalous counts for training
+    Reads an existing columnar dataset from data_dir, otherwise generates one
+    (in memory for a single process, through column files when sharded)
+    """
+    if data_dir and os.path.exists(os.path.join(data_dir, 'metadata.json')):
+        X, feature_names, metadata = load_training_columns(data_dir)
+        print(f"Loaded {metadata['samples']} samples from {data_dir}")
+        return X, feature_names, metadata['normal_samples'], metadata['anomalous_samples']
+    
+    started = time.perf_counter()
+    if data_dir or workers > 1:
+        target_dir = data_dir or tempfile.mkdtemp(prefix='anomaly_training_')
+        metadata = generate_dataset(target_dir, normal_samples, anomalous_samples, workers, shard_size, seed)
+        print(f"Generated {metadata['samples']} samples in {metadata['shards']} shards "
+              f"with {workers} workers in {time.perf_counter() - started:.2f}s")
+        X, feature_names, _ = load_training_columns(target_dir)
+        if not data_dir:
+            shutil.rmtree(target_dir, ignore_errors=True)
+    else:
+        rng = np.random.default_rng(seed)
+        normal_columns = generate_normal_columns(normal_samples, rng)
+        anomalous_columns = generate_anomalous_columns(anomalous_samples, rng)
+        print(f"Generated {normal_samples} normal and {anomalous_samples} anomalous synthetic data points "
+              f"in {time.perf_counter() - started:.2f}s")
+        X = np.vstack([prepare_features(normal_columns)[0], prepare_features(anomalous_columns)[0]])
+        feature_names = list(FEATURE_NAMES)
+    return X, feature_names, normal_samples, anomalous_samples
+
+def train_isolation_forest_model(normal_samples=1500, anomalous_samples=250, data_dir=None,
+                                 workers=1, shard_size=DEFAULT_SHARD_SIZE, seed=None):
     """
     Train Isolation Forest model with complete environmental data and save to models folder
     """
     print("Starting Isolation Forest model training with complete environmental data...")
     
-    # Generate normal training data
-    normal_training_data = generate_synthetic_training_data(1500) 
-    print(f"Generated {len(normal_training_data)} normal synthetic data points")
-    
-    # Generate some anomalous data for better model understanding
-    anomalous_training_data = generate_anomalous_training_data(250)
-    print(f"Generated {len(anomalous_training_data)} anomalous synthetic data points")
-    
-    # Combine all training data
-    all_training_data = normal_training_data + anomalous_training_data
-    print(f"Total training samples: {len(all_training_data)}")
-    
-    # Prepare features
-    X_train, feature_names = prepare_features(all_training_data)
+    X_train, feature_names, normal_count, anomalous_count = build_training_matrix(
+        normal_samples, anomalous_samples, data_dir, workers, shard_size, seed)
+    print(f"Total training samples: {len(X_train)}")
     print(f"Feature matrix shape: {X_train.shape}")
     print(f"Features: {feature_names}")
     print("Environmental features included:")
@@ -201,7 +307,7 @@ def train_isolation_forest_model():
     
     # Initialize and train Isolation Forest with more restrictive contamination
     # Reduce contamination rate to make model less sensitive to normal variations
-    contamination_rate = min(0.05, len(anomalous_training_data) / len(all_training_data))  # Cap at 5%
+    contamination_rate = min(0.05, anomalous_count / len(X_train))  # Cap at 5%
     print(f"Using contamination rate: {contamination_rate:.3f} (reduced for better precision)")
     
     isolation_forest = IsolationForest(
@@ -229,9 +335,9 @@ def train_isolation_forest_model():
         'model': isolation_forest,
         'scaler': scaler,
         'feature_names': feature_names,
-        'training_samples': len(all_training_data),
-        'normal_samples': len(normal_training_data),
-        'anomalous_samples': len(anomalous_training_data),
+        'training_samples': len(X_train),
+        'normal_samples': normal_count,
+        'anomalous_samples': anomalous_count,
         'contamination_rate': contamination_rate
     }
     
@@ -386,8 +492,29 @@ def load_and_test_saved_model():
     test_model(model, scaler, feature_names)
 
 if __name__ == "__main__":
-    # Train the model
-    model, scaler, feature_names = train_isolation_forest_model()
-    
-    # Test loading the saved model
-    load_and_test_saved_model()
+    parser = argparse.ArgumentParser(description="Generate synthetic data and train the anomaly model")
+    parser.add_argument("--normal-samples", type=int, default=1500)
+    parser.add_argument("--anomalous-samples", type=int, default=250)
+    parser.add_argument("--workers", type=int, default=1, help="processes generating shards")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="samples per shard")
+    parser.add_argument("--data-dir", help="columnar dataset to train from (generated there if missing)")
+    parser.add_argument("--seed", type=int, help="seed for reproducible data")
+    parser.add_argument("--generate-only", action="store_true", help="write the dataset to --data-dir without training")
+    args = parser.parse_args()
+    
+    if args.generate_only:
+        if not args.data_dir:
+            parser.error("--generate-only needs --data-dir")
+        started = time.perf_counter()
+        metadata = generate_dataset(args.data_dir, args.normal_samples, args.anomalous_samples,
+                                    args.workers, args.shard_size, args.seed)
+        elapsed = time.perf_counter() - started
+        print(f"Generated {metadata['samples']} samples in {metadata['shards']} shards with {args.workers} workers "
+              f"in {elapsed:.2f}s ({metadata['samples'] / elapsed:,.0f} samples/s) -> {args.data_dir}")
+    else:
+        # Train the model
+        model, scaler, feature_names = train_isolation_forest_model(
+            args.normal_samples, args.anomalous_samples, args.data_dir, args.workers, args.shard_size, args.seed)
+        
+        # Test loading the saved model
+        load_and_test_saved_model()